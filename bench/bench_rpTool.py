@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Created on October 18 2026
+
+@description: Micro-benchmarks of the hot functions of rpFBA, compared against stored baselines
+
+"""
+import argparse
+import statistics
+import platform
+import json
+import time
+import sys
+import os
+
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import rpTool as rpFBA
+import rpToolServe
+import rpSBML
+import rpMerge
+
+from bench_rpToolServe import GEM_PATH, GEM_SOURCE_REACTION
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+
+##
+#
+#
+class _mergedFixture:
+    """The pathway and the GEM parsed and merged once, from which each run of a benchmark gets fresh copies
+    """
+    def __init__(self, rpsbml_path, gem_sbml, pathway_id='rp_pathway', species_group_id='central_species', sink_species_group_id='rp_sink_species'):
+        self.rpsbml_path = rpsbml_path
+        self.pathway_id = pathway_id
+        self.species_group_id = species_group_id
+        self.sink_species_group_id = sink_species_group_id
+        self.pathway_document = rpSBML.rpSBML('bench', path=rpsbml_path).document
+        rpsbml = rpSBML.rpSBML('bench', self.pathway_document.clone())
+        groups = rpsbml.model.getPlugin('groups')
+        self.cent_spe = [str(i.getIdRef()) for i in groups.getGroup(species_group_id).getListOfMembers()]
+        self.sink_spe = [str(i.getIdRef()) for i in groups.getGroup(sink_species_group_id).getListOfMembers()]
+        rpsbml_gem = rpSBML.rpSBML('bench', path=gem_sbml)
+        species_source_target, reactions_convert = rpMerge.rpMerge().mergeModels(rpsbml, rpsbml_gem)
+        self.rev_reactions_convert = {v: k for k, v in reactions_convert.items()}
+        self.merged_document = rpsbml_gem.document
+
+
+    def pathway(self):
+        """Return a copy of the pathway model
+
+        :rtype: rpSBML
+        """
+        return rpSBML.rpSBML('bench', self.pathway_document.clone())
+
+
+    def rpfba(self, convert=False):
+        """Return rpFBA on a copy of the merged model
+
+        :param convert: Convert the model to cobra (Default: False)
+
+        :type convert: bool
+
+        :rtype: rpFBA
+        """
+        rpfba = rpFBA.rpFBA(rpSBML.rpSBML('bench', self.merged_document.clone()))
+        if convert and not rpfba._convertToCobra():
+            raise RuntimeError('Cannot convert the merged model to cobra')
+        return rpfba
+
+
+def benchmarks(fixture, source_reaction, target_reaction, fraction_of=0.75):
+    """Return the micro-benchmarks, as a setup run before every measure and the measured function called with the value returned by the setup
+
+    :param fixture: The merged models
+    :param source_reaction: The id of the source reaction
+    :param target_reaction: The id of the target reaction
+    :param fraction_of: The fraction of the optimum of the source reaction (Default: 0.75)
+
+    :type fixture: _mergedFixture
+    :type source_reaction: str
+    :type target_reaction: str
+    :type fraction_of: float
+
+    :return: Dictionnary of the name of the benchmarks to a tuple with the setup and the measured function
+    :rtype: dict
+    """
+    pathway_id = fixture.pathway_id
+
+    def _solved():
+        rpfba = fixture.rpfba(True)
+        objective_id = rpfba._findCreateObjective([target_reaction], [1.0], True, 'obj_bench')
+        rpfba._setCobraObjective(rpfba.cobraModel, objective_id)
+        return rpfba, objective_id, rpfba.cobraModel.optimize()
+
+    def _simulated():
+        rpfba = fixture.rpfba()
+        rpfba.runFractionReaction(source_reaction, 1.0, target_reaction, 1.0, fraction_of, True, pathway_id)
+        return fixture.pathway(), rpfba.rpsbml
+
+    return {'convertToCobra': (fixture.rpfba,
+                               lambda rpfba: rpfba._convertToCobra()),
+            'writeAnalysisResults': (_solved,
+                                     lambda x: x[0].writeAnalysisResults(x[1], x[2], pathway_id)),
+            'runFBA': (lambda: fixture.rpfba(True),
+                       lambda rpfba: rpfba.runFBA(target_reaction, 1.0, True, pathway_id)),
+            'runParsimoniousFBA': (lambda: fixture.rpfba(True),
+                                   lambda rpfba: rpfba.runParsimoniousFBA(target_reaction, 1.0, fraction_of, True, pathway_id)),
+            'runFractionReaction': (lambda: fixture.rpfba(True),
+                                    lambda rpfba: rpfba.runFractionReaction(source_reaction, 1.0, target_reaction, 1.0, fraction_of, True, pathway_id)),
+            'transferResults': (_simulated,
+                                lambda x: rpToolServe.transferResults(x[0],
+                                                                      x[1],
+                                                                      fixture.rev_reactions_convert,
+                                                                      fixture.cent_spe,
+                                                                      fixture.sink_spe,
+                                                                      pathway_id,
+                                                                      fixture.species_group_id,
+                                                                      fixture.sink_species_group_id))}
+
+
+def measure(setup, func, repeat=20):
+    """Return the times of the calls of a function, each on a fresh value returned by the setup that is not measured
+
+    :param setup: Function returning the argument of the measured function
+    :param func: The measured function
+    :param repeat: The number of measures (Default: 20)
+
+    :type setup: function
+    :type func: function
+    :type repeat: int
+
+    :return: The time of each call in seconds
+    :rtype: list
+    """
+    times = []
+    for i in range(repeat):
+        value = setup()
+        start = time.perf_counter()
+        func(value)
+        times.append(time.perf_counter()-start)
+    return times
+
+
+def compareBaseline(results, baseline, threshold=20.0):
+    """Compare the median times of the benchmarks with their baseline
+
+    :param results: The name of the benchmarks to their median time in seconds
+    :param baseline: The name of the benchmarks to their baseline median time in seconds
+    :param threshold: The slowdown in percent above which a benchmark is a regression (Default: 20.0)
+
+    :type results: dict
+    :type baseline: dict
+    :type threshold: float
+
+    :return: The names of the benchmarks that are slower than their baseline by more than the threshold
+    :rtype: list
+    """
+    regressions = []
+    for name, median in sorted(results.items()):
+        if name not in baseline:
+            logging.warning('No baseline for '+str(name)+', run with -update_baseline to record one')
+            continue
+        change = (median/baseline[name]-1.0)*100.0
+        logging.info(str(name)+': '+str(round(median*1000.0, 3))+'ms ('+('+' if change>=0.0 else '')+str(round(change, 1))+'% of the baseline)')
+        if change>threshold:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser('Micro-benchmarks of the hot functions of rpFBA')
+    parser.add_argument('-rpsbml', type=str, default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test', 'data', 'rpsbml.xml'))
+    parser.add_argument('-gem_sbml', type=str, default=None)
+    parser.add_argument('-source_reaction', type=str, default=None)
+    parser.add_argument('-target_reaction', type=str, default='RP1_sink')
+    parser.add_argument('-benchmarks', type=str, default=None)
+    parser.add_argument('-repeat', type=int, default=20)
+    parser.add_argument('-baseline', type=str, default=BASELINE_PATH)
+    parser.add_argument('-update_baseline', type=str, default='False')
+    parser.add_argument('-threshold', type=float, default=20.0)
+    params = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    if params.update_baseline==True or params.update_baseline=='True' or params.update_baseline=='true':
+        update_baseline = True
+    elif params.update_baseline==False or params.update_baseline=='False' or params.update_baseline=='false':
+        update_baseline = False
+    else:
+        logging.error('Cannot interpret '+str(params.update_baseline))
+        exit(1)
+    gem_sbml = params.gem_sbml
+    source_reaction = params.source_reaction
+    if gem_sbml is None:
+        gem_sbml = GEM_PATH
+        if source_reaction is None:
+            source_reaction = GEM_SOURCE_REACTION
+    if source_reaction is None:
+        source_reaction = 'biomass'
+    fixture = _mergedFixture(params.rpsbml, gem_sbml)
+    all_benchmarks = benchmarks(fixture, source_reaction, params.target_reaction)
+    names = params.benchmarks.split(',') if params.benchmarks else list(all_benchmarks)
+    results = {}
+    for name in names:
+        if name not in all_benchmarks:
+            logging.error('Cannot recognise the benchmark: '+str(name))
+            exit(1)
+        times = measure(*all_benchmarks[name], repeat=params.repeat)
+        results[name] = statistics.median(times)
+        logging.debug(str(name)+': median='+str(results[name])+'s min='+str(min(times))+'s')
+    baseline = {}
+    if os.path.exists(params.baseline):
+        with open(params.baseline, 'r') as infile:
+            stored = json.load(infile)
+        if stored.get('host')!=platform.node():
+            logging.warning('The baseline has been recorded on '+str(stored.get('host'))+', the times may not be comparable')
+        baseline = stored['benchmarks']
+    if update_baseline:
+        baseline.update(results)
+        with open(params.baseline, 'w') as outfile:
+            json.dump({'host': platform.node(), 'python': platform.python_version(), 'benchmarks': baseline}, outfile, indent=4, sort_keys=True)
+        logging.info('Updated the baseline '+str(params.baseline))
+    else:
+        regressions = compareBaseline(results, baseline, params.threshold)
+        if regressions:
+            logging.error('Slower than the baseline by more than '+str(params.threshold)+'%: '+', '.join(regressions))
+            exit(1)
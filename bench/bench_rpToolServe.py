@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+Created on October 18 2026
+
+@description: Throughput benchmark of rpToolServe.main on synthetic batches of pathways
+
+"""
+import multiprocessing
+import traceback
+import argparse
+import subprocess
+import itertools
+import resource
+import tempfile
+import tarfile
+import random
+import json
+import re
+import time
+import sys
+import os
+import io
+
+import logging
+
+import libsbml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import rpToolServe
+import rpProfiler
+
+
+#GEM of the benchmarks, written by writeGEM() from the pathway test/data/rpsbml.xml
+GEM_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test', 'data', 'gem.xml')
+#its biomass reaction, the source reaction of the benchmarks
+GEM_SOURCE_REACTION = 'R_Biomass_Ecoli_core'
+
+
+##
+#
+#
+def _gitCommit():
+    """Return the current commit of the repository, to identify the code that is benchmarked
+
+    :return: The hash of the commit, None if it cannot be found
+    :rtype: str
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _childrenPeakRSS():
+    """Return the peak resident set size of the largest terminated child process
+
+    Like the peak RSS of the process itself, it is a high-water mark over the lifetime of the process, see runIsolated()
+
+    :return: The peak resident set size in MB
+    :rtype: float
+    """
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if sys.platform=='darwin':
+        return rss/1048576.0
+    return rss/1024.0
+
+
+def writeGEM(gem_path, rpsbml_path, target_reaction='RP1_sink'):
+    """Write the small E. coli core model bundled with cobrapy as the GEM of the benchmark (GEM_PATH, see -write_gem)
+
+    The core model does not contain the species consumed and produced by the test pathway (ex: geranyl diphosphate and diphosphate), that could then never carry a flux once merged. They are added to the cytosol with their MIRIAM annotations, so that the merge finds them, and a sink reaction that supplies or drains them. The target species of the pathway, consumed by the target reaction, are left out
+
+    :param gem_path: Path of the SBML file to write
+    :param rpsbml_path: Path to the pathway that is merged with the GEM
+    :param target_reaction: The id of the target reaction of the pathway (Default: RP1_sink)
+
+    :type gem_path: str
+    :type rpsbml_path: str
+    :type target_reaction: str
+
+    :return: The SBML id of the biomass reaction of the model
+    :rtype: str
+    """
+    import cobra
+    try:
+        model = cobra.io.load_model('textbook')
+    except AttributeError:
+        #cobrapy <0.20
+        import cobra.test
+        model = cobra.test.create_test_model('textbook')
+    rp_model = libsbml.readSBMLFromFile(rpsbml_path).getModel()
+    target = rp_model.getReaction(target_reaction)
+    target_species = [i.getSpecies() for i in target.getListOfReactants()] if target is not None else []
+    for species in rp_model.getListOfSpecies():
+        if species.getId() in target_species:
+            continue
+        annotation = {}
+        for cv_term in species.getCVTerms() or []:
+            if cv_term.getBiologicalQualifierType()!=libsbml.BQB_IS:
+                continue
+            for i in range(cv_term.getNumResources()):
+                resource_uri = cv_term.getResourceURI(i).split('identifiers.org/')[-1]
+                if '/' in resource_uri:
+                    namespace, identifier = resource_uri.split('/', 1)
+                    annotation.setdefault(namespace, []).append(identifier)
+        #the SBML ids (M_ppi) are also listed as BiGG ids
+        bigg_ids = [i for i in annotation.get('bigg.metabolite', []) if not i.startswith('M_')]
+        if any(i+'_c' in model.metabolites for i in bigg_ids):
+            continue
+        metabolite = cobra.Metabolite((bigg_ids[0] if bigg_ids else species.getId())+'_c',
+                                      name=species.getName(),
+                                      compartment='c')
+        metabolite.annotation = annotation
+        model.add_metabolites([metabolite])
+        model.add_boundary(metabolite, type='sink')
+        logging.info('Added the species '+str(species.getId())+' of the pathway to the GEM as '+str(metabolite.id))
+    cobra.io.write_sbml_model(model, gem_path)
+    return 'R_Biomass_Ecoli_core'
+
+
+def writeBatch(rpsbml_path, output_tar, num_models, seed=0):
+    """Write a TAR of synthetic pathways by mutating a pathway
+
+    Each model gets its own id and a random upper flux bound on each of its heterologous reactions, so that the models are different (for the cache) and their optimisations are not identical
+
+    :param rpsbml_path: Path to the pathway to mutate
+    :param output_tar: Path of the TAR output
+    :param num_models: The number of models
+    :param seed: The seed of the random bounds (Default: 0)
+
+    :type rpsbml_path: str
+    :type output_tar: str
+    :type num_models: int
+    :type seed: int
+
+    :return: None
+    :rtype: None
+    """
+    rand = random.Random(seed)
+    document = libsbml.readSBMLFromFile(rpsbml_path)
+    model = document.getModel()
+    model_id = model.getId()
+    reactions = [model.getReaction(i) for i in range(model.getNumReactions())]
+    bound_parameters = []
+    for reaction in reactions:
+        parameter = model.createParameter()
+        parameter.setId('B_bench_'+reaction.getId())
+        parameter.setConstant(True)
+        parameter.setUnits('mmol_per_gDW_per_hr')
+        reaction.getPlugin('fbc').setUpperFluxBound(parameter.getId())
+        bound_parameters.append(parameter)
+    with tarfile.open(output_tar, mode='w:gz') as tar:
+        for i in range(num_models):
+            model.setId(model_id+'_bench_'+str(i))
+            for parameter in bound_parameters:
+                parameter.setValue(rand.uniform(10.0, 1000.0))
+            content = libsbml.writeSBMLToString(document).encode('utf-8')
+            info = tarfile.TarInfo(model.getId()+'.sbml.xml')
+            info.size = len(content)
+            tar.addfile(tarinfo=info, fileobj=io.BytesIO(content))
+
+
+def countFluxes(output_tar, target_reaction):
+    """Count the output models where the objective of the target reaction has a non-zero value
+
+    :param output_tar: Path to the TAR of the output models
+    :param target_reaction: The id of the target reaction
+
+    :type output_tar: str
+    :type target_reaction: str
+
+    :return: The number of models
+    :rtype: int
+    """
+    value_pattern = re.compile(r'<brsynth:fba_obj_'+re.escape(target_reaction)+r'\w*\s[^>]*value="([^"]*)"')
+    num_flux = 0
+    for file_name, content in rpToolServe.readTar(output_tar):
+        for value in value_pattern.findall(content.decode('utf-8')):
+            try:
+                if abs(float(value))>1e-9:
+                    num_flux += 1
+                    break
+            except ValueError:
+                pass
+    return num_flux
+
+
+def runBenchmark(input_tar, gem_sbml, num_models, num_workers, sim_type, source_reaction, target_reaction, share_gem=False):
+    """Run rpToolServe.main once and measure its throughput, peak memory and the time of each stage
+
+    The peak RSS are high-water marks over the lifetime of the process, use runIsolated() to measure those of a single configuration
+
+    :param input_tar: Path to the TAR of pathways
+    :param gem_sbml: Path to the GEM
+    :param num_models: The number of models of the TAR
+    :param num_workers: The number of worker processes
+    :param sim_type: The simulation type
+    :param source_reaction: The id of the source reaction
+    :param target_reaction: The id of the target reaction
+    :param share_gem: Share the GEM between the models (Default: False)
+
+    :type input_tar: str
+    :type gem_sbml: str
+    :type num_models: int
+    :type num_workers: int
+    :type sim_type: str
+    :type source_reaction: str
+    :type target_reaction: str
+    :type share_gem: bool
+
+    :return: The results of the run
+    :rtype: dict
+    """
+    with tempfile.TemporaryDirectory() as tmp_folder:
+        output_tar = os.path.join(tmp_folder, 'output.tar')
+        profile_report = os.path.join(tmp_folder, 'profile.jsonl')
+        start = time.perf_counter()
+        status = rpToolServe.main(input_tar,
+                                  gem_sbml,
+                                  output_tar,
+                                  sim_type,
+                                  source_reaction,
+                                  target_reaction,
+                                  1.0,
+                                  1.0,
+                                  True,
+                                  0.75,
+                                  num_workers=num_workers,
+                                  share_gem=share_gem,
+                                  profile_report=profile_report)
+        wall = time.perf_counter()-start
+        num_output = rpToolServe.countTar(output_tar) if os.path.exists(output_tar) else 0
+        num_flux = countFluxes(output_tar, target_reaction) if num_output else 0
+        summary = rpProfiler.summarize(profile_report)
+    return {'num_models': num_models,
+            'num_workers': num_workers,
+            'sim_type': sim_type,
+            'share_gem': share_gem,
+            'status': bool(status),
+            'num_output': num_output,
+            'num_flux': num_flux,
+            'wall': wall,
+            'models_per_second': num_models/wall if wall else None,
+            'peak_rss': rpProfiler._getPeakRSS(),
+            #the profiled processes reset their peak RSS with each stage, the profile keeps it
+            'children_peak_rss': max(_childrenPeakRSS(), summary['worker_peak_rss'] or 0.0),
+            'stages': summary['stages'],
+            'solver_status': summary['solver_status']}
+
+
+def _runConfig(conn, args):
+    """Run runBenchmark() in the process of a configuration and send back its results or the traceback of its error
+    """
+    try:
+        conn.send((runBenchmark(*args), None))
+    except Exception:
+        conn.send((None, traceback.format_exc()))
+    conn.close()
+
+
+def runIsolated(*args):
+    """Run runBenchmark() in a new process, so that the peak RSS of the process and of its workers are those of this configuration only
+
+    The process is started with spawn rather than fork, as a forked process inherits the high-water mark of its parent
+
+    :param args: The arguments of runBenchmark()
+
+    :type args: tuple
+
+    :return: The results of the run
+    :rtype: dict
+    """
+    context = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(target=_runConfig, args=(child_conn, args))
+    process.start()
+    child_conn.close()
+    try:
+        result, error = parent_conn.recv()
+    except EOFError:
+        result, error = None, 'The benchmark process died'
+    process.join()
+    if error:
+        raise RuntimeError('Benchmark of '+str(args[2:])+' failed: '+str(error))
+    return result
+
+
+def checkResult(result):
+    """Return the problems of the results of a configuration: failed run, missing output models or models without a flux on the target reaction
+
+    :param result: The results of the run
+
+    :type result: dict
+
+    :return: The problems, empty if there are none
+    :rtype: list
+    """
+    problems = []
+    if not result['status']:
+        problems.append('the run failed')
+    if result['num_output']!=result['num_models']:
+        problems.append(str(result['num_output'])+' output models for '+str(result['num_models'])+' input models')
+    if result['num_flux']!=result['num_output']:
+        problems.append(str(result['num_output']-result['num_flux'])+' output models without flux on the target reaction')
+    return problems
+
+
+def compareResults(results, baseline_path, threshold=0.1):
+    """Compare the throughput of results with the ones of a previous run of the same configurations
+
+    :param results: The results of the current run
+    :param baseline_path: Path to the JSON lines results of the previous run
+    :param threshold: The relative decrease of throughput reported as a regression (Default: 0.1)
+
+    :type results: list
+    :type baseline_path: str
+    :type threshold: float
+
+    :return: The configurations with a regression
+    :rtype: list
+    """
+    config_keys = ['num_models', 'num_workers', 'sim_type', 'share_gem']
+    baseline = {}
+    with open(baseline_path, 'r') as infile:
+        for line in infile:
+            if line.strip():
+                record = json.loads(line)
+                baseline[tuple(record.get(i) for i in config_keys)] = record
+    regressions = []
+    for record in results:
+        config = tuple(record[i] for i in config_keys)
+        if config not in baseline or not baseline[config]['models_per_second']:
+            continue
+        ratio = record['models_per_second']/baseline[config]['models_per_second']
+        logging.info(str(dict(zip(config_keys, config)))+': '+str(round(record['models_per_second'], 3))+' models/s ('+str(round(ratio*100.0, 1))+'% of the baseline)')
+        if ratio<1.0-threshold:
+            regressions.append(record)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser('Throughput benchmark of rpFBA on synthetic batches of pathways')
+    parser.add_argument('-sizes', type=str, default='1,10,100,1000,10000')
+    parser.add_argument('-workers', type=str, default='1,2,4')
+    parser.add_argument('-sim_types', type=str, default='fraction,fba,pfba')
+    parser.add_argument('-share_gem', type=str, default='False')
+    parser.add_argument('-rpsbml', type=str, default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test', 'data', 'rpsbml.xml'))
+    parser.add_argument('-gem_sbml', type=str, default=None)
+    parser.add_argument('-source_reaction', type=str, default=None)
+    parser.add_argument('-target_reaction', type=str, default='RP1_sink')
+    parser.add_argument('-output', type=str, default='bench_results.jsonl')
+    parser.add_argument('-baseline', type=str, default=None)
+    parser.add_argument('-threshold', type=float, default=0.1)
+    parser.add_argument('-write_gem', type=str, default=None)
+    params = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    if params.write_gem:
+        #regenerate the GEM of the benchmarks (ex: for another pathway) and exit
+        writeGEM(params.write_gem, params.rpsbml, params.target_reaction)
+        exit(0)
+    if params.share_gem==True or params.share_gem=='True' or params.share_gem=='true':
+        share_gem = True
+    elif params.share_gem==False or params.share_gem=='False' or params.share_gem=='false':
+        share_gem = False
+    else:
+        logging.error('Cannot interpret '+str(params.share_gem))
+        exit(1)
+    commit = _gitCommit()
+    results = []
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp_folder:
+        gem_sbml = params.gem_sbml
+        source_reaction = params.source_reaction
+        if gem_sbml is None:
+            gem_sbml = GEM_PATH
+            if source_reaction is None:
+                source_reaction = GEM_SOURCE_REACTION
+        if source_reaction is None:
+            source_reaction = 'biomass'
+        for num_models in [int(i) for i in params.sizes.split(',')]:
+            input_tar = os.path.join(tmp_folder, 'input_'+str(num_models)+'.tar')
+            writeBatch(params.rpsbml, input_tar, num_models)
+            for num_workers, sim_type in itertools.product([int(i) for i in params.workers.split(',')], params.sim_types.split(',')):
+                logging.info('Running '+str(num_models)+' models with '+str(num_workers)+' workers ('+str(sim_type)+')')
+                result = runIsolated(input_tar, gem_sbml, num_models, num_workers, sim_type, source_reaction, params.target_reaction, share_gem)
+                result['commit'] = commit
+                result['date'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+                logging.info(str(round(result['models_per_second'], 3))+' models/s, '+str(result['num_output'])+' output models, '+str(result['num_flux'])+' with flux, solver status: '+str(result['solver_status']))
+                problems = checkResult(result)
+                if problems:
+                    #the throughput of a run that has not produced all its results is not recorded
+                    logging.error(str(num_models)+' models with '+str(num_workers)+' workers ('+str(sim_type)+'): '+', '.join(problems))
+                    failures.append(result)
+                    continue
+                results.append(result)
+                #written as they complete so that a long benchmark can be interrupted
+                with open(params.output, 'a') as outfile:
+                    outfile.write(json.dumps(result)+'\n')
+            os.remove(input_tar)
+    if failures:
+        logging.error(str(len(failures))+' configurations did not produce the expected results, their throughput is not comparable')
+        exit(1)
+    if params.baseline:
+        regressions = compareResults(results, params.baseline, params.threshold)
+        if regressions:
+            logging.error(str(len(regressions))+' configurations are more than '+str(params.threshold*100.0)+'% slower than the baseline')
+            exit(1)
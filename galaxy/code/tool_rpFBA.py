@@ -41,6 +41,25 @@ if __name__ == "__main__":
     parser.add_argument('-is_max', type=str, default='True')
     parser.add_argument('-fraction_of', type=float, default=0.75)
     parser.add_argument('-dont_merge', type=str, default='True')
+    parser.add_argument('-share_gem', type=str, default='False')
+    parser.add_argument('-max_tasks_per_worker', type=int, default=100)
+    parser.add_argument('-max_worker_rss', type=float, default=None)
+    parser.add_argument('-cache_dir', type=str, default=None)
+    parser.add_argument('-cache_size', type=float, default=1024)
+    parser.add_argument('-clear_cache', type=str, default='False')
+    parser.add_argument('-sweep_fractions', type=str, default='0.1:0.95:0.05')
+    parser.add_argument('-envelope_points', type=int, default=20)
+    parser.add_argument('-profile_report', type=str, default=None)
+    parser.add_argument('-flux_export', type=str, default=None)
+    parser.add_argument('-flux_export_full', type=str, default='False')
+    parser.add_argument('-results_db', type=str, default=None)
+    parser.add_argument('-skip_computed', type=str, default='False')
+    parser.add_argument('-schedule_lookahead', type=int, default=1000)
+    parser.add_argument('-solver_timeout', type=float, default=None)
+    parser.add_argument('-model_timeout', type=float, default=None)
+    parser.add_argument('-crash_retries', type=int, default=1)
+    parser.add_argument('-batch_report', type=str, default=None)
+    parser.add_argument('-work_dir', type=str, default=None)
     params = parser.parse_args()
     if params.num_workers>=20 or params.num_workers<=0:
         logging.error('Cannot have more than 20 and 0 or less workers: '+str(params.num_workers))
@@ -62,7 +81,38 @@ if __name__ == "__main__":
     else:
         logging.error('Cannot interpret '+str(params.dont_merge))
         exit(1)
-    if params.objective_id=='None':
+    if params.share_gem==True or params.share_gem=='True' or params.share_gem=='true':
+        share_gem = True
+    elif params.share_gem==False or params.share_gem=='False' or params.share_gem=='false':
+        share_gem = False
+    else:
+        logging.error('Cannot interpret '+str(params.share_gem))
+        exit(1)
+    if params.clear_cache==True or params.clear_cache=='True' or params.clear_cache=='true':
+        clear_cache = True
+    elif params.clear_cache==False or params.clear_cache=='False' or params.clear_cache=='false':
+        clear_cache = False
+    else:
+        logging.error('Cannot interpret '+str(params.clear_cache))
+        exit(1)
+    if params.flux_export_full==True or params.flux_export_full=='True' or params.flux_export_full=='true':
+        flux_export_full = True
+    elif params.flux_export_full==False or params.flux_export_full=='False' or params.flux_export_full=='false':
+        flux_export_full = False
+    else:
+        logging.error('Cannot interpret '+str(params.flux_export_full))
+        exit(1)
+    if params.skip_computed==True or params.skip_computed=='True' or params.skip_computed=='true':
+        skip_computed = True
+    elif params.skip_computed==False or params.skip_computed=='False' or params.skip_computed=='false':
+        skip_computed = False
+    else:
+        logging.error('Cannot interpret '+str(params.skip_computed))
+        exit(1)
+    if params.objective_id=='None' and ',' in params.sim_type:
+        #the objective of each simulation type is named obj_<sim_type> by rpToolServe
+        objective_id = None
+    elif params.objective_id=='None':
         objective_id = 'obj_'+params.sim_type
     else:
         objective_id = params.objective_id
@@ -84,7 +134,26 @@ if __name__ == "__main__":
                          params.compartment_id,
                          None, #this is fillorphanspecies
                          params.species_group_id,
-                         params.sink_species_group_id)
+                         params.sink_species_group_id,
+                         share_gem,
+                         params.max_tasks_per_worker,
+                         params.max_worker_rss,
+                         params.cache_dir,
+                         params.cache_size,
+                         clear_cache,
+                         params.sweep_fractions,
+                         params.envelope_points,
+                         params.profile_report,
+                         params.flux_export,
+                         flux_export_full,
+                         params.results_db,
+                         skip_computed,
+                         params.schedule_lookahead,
+                         params.solver_timeout,
+                         params.model_timeout,
+                         params.crash_retries,
+                         params.batch_report,
+                         params.work_dir)
     elif params.input_format=='sbml':
         #make the tar.xz 
         with tempfile.TemporaryDirectory() as tmpOutputFolder:
@@ -112,7 +181,26 @@ if __name__ == "__main__":
                              params.compartment_id,
                              None, #this is filloorphanspecies
                              params.species_group_id,
-                             params.sink_species_group_id)
+                             params.sink_species_group_id,
+                             share_gem,
+                             params.max_tasks_per_worker,
+                             params.max_worker_rss,
+                             params.cache_dir,
+                             params.cache_size,
+                             clear_cache,
+                             params.sweep_fractions,
+                             params.envelope_points,
+                             params.profile_report,
+                             params.flux_export,
+                             flux_export_full,
+                             params.results_db,
+                             skip_computed,
+                             params.schedule_lookahead,
+                             params.solver_timeout,
+                             params.model_timeout,
+                             params.crash_retries,
+                             params.batch_report,
+                             params.work_dir)
             with tarfile.open(output_tar, mode='r') as outTar:
                 def is_within_directory(directory, target):
                     
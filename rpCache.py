@@ -0,0 +1,264 @@
+import hashlib
+import tempfile
+import shutil
+import os
+
+import logging
+
+
+def hashFile(path, block_size=1048576):
+    """Return the SHA-256 hash of the content of a file
+
+    :param path: Path to the file
+    :param block_size: The number of bytes read at once (Default: 1048576)
+
+    :type path: str
+    :type block_size: int
+
+    :return: The hexadecimal hash
+    :rtype: str
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as infile:
+        for block in iter(lambda: infile.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def hashKey(*parts):
+    """Return a SHA-256 hash identifying a list of values
+
+    Bytes are hashed as they are and all the other values through their str() representation. Each part is prefixed with its length so that different splits of the same content do not collide
+
+    :param parts: The values to hash
+
+    :type parts: list
+
+    :return: The hexadecimal hash
+    :rtype: str
+    """
+    sha = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = str(part).encode('utf-8')
+        sha.update(str(len(part)).encode('utf-8')+b':')
+        sha.update(part)
+    return sha.hexdigest()
+
+
+def isPrivate(path):
+    """Return if a file and its folder are owned by the current user and cannot be written by the other users, so that its content can be trusted (ex: before unpickling it)
+
+    :param path: Path to the file
+
+    :type path: str
+
+    :return: If the file is private
+    :rtype: bool
+    """
+    if not hasattr(os, 'getuid'):
+        return True
+    for check_path in [path, os.path.dirname(os.path.abspath(path))]:
+        try:
+            stat = os.stat(check_path)
+        except OSError:
+            return False
+        if stat.st_uid!=os.getuid() or stat.st_mode & 0o022:
+            return False
+    return True
+
+
+class rpCache:
+    """On-disk content-addressed cache with a least recently used eviction policy
+
+    The entries are files named after their key. Reading an entry updates its modification time, which is used to evict the least recently used entries when the total size of the cache exceeds its maximum. The entries are written to a temporary file and then renamed, so that an interrupted run never leaves a partial entry. The folders of the cache are only accessible by their owner (0700), as some entries are unpickled
+    """
+    def __init__(self, cache_dir, max_size=None):
+        """Default constructor
+
+        :param cache_dir: The folder of the cache, created if it does not exist
+        :param max_size: The maximal size of the cache in MB, None for no limit (Default: None)
+
+        :type cache_dir: str
+        :type max_size: float
+        """
+        self.logger = logging.getLogger(__name__)
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        if hasattr(os, 'getuid') and os.stat(self.cache_dir).st_uid==os.getuid():
+            os.chmod(self.cache_dir, 0o700)
+        else:
+            self.logger.warning('The cache folder '+str(self.cache_dir)+' is owned by another user')
+        self.size = sum(os.path.getsize(i) for i in self._listEntries())
+
+
+    ##########################################################
+    ################# Private Functions ######################
+    ##########################################################
+
+
+    def _path(self, key):
+        """Return the path of an entry
+
+        :param key: The key of the entry
+
+        :type key: str
+
+        :return: The path of the entry file
+        :rtype: str
+        """
+        return os.path.join(self.cache_dir, key[:2], key)
+
+
+    def _listEntries(self):
+        """Return the paths of all the entries of the cache
+
+        :return: The paths of the entry files
+        :rtype: list
+        """
+        entries = []
+        for sub_dir in os.scandir(self.cache_dir):
+            if sub_dir.is_dir():
+                entries += [i.path for i in os.scandir(sub_dir.path) if i.is_file() and not i.name.startswith('.')]
+        return entries
+
+
+    def _evict(self):
+        """Remove the least recently used entries until the cache is within its maximal size
+
+        :return: The number of removed entries
+        :rtype: int
+        """
+        if self.max_size is None or self.size<=self.max_size*1048576:
+            return 0
+        entries = sorted(((os.stat(i), i) for i in self._listEntries()), key=lambda x: x[0].st_mtime)
+        self.size = sum(i[0].st_size for i in entries)
+        num_removed = 0
+        for stat, path in entries:
+            if self.size<=self.max_size*1048576:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= stat.st_size
+            num_removed += 1
+        self.logger.debug('Evicted '+str(num_removed)+' entries from the cache '+str(self.cache_dir))
+        return num_removed
+
+
+    def _commit(self, key, tmp_path):
+        """Rename a complete temporary file of the cache folder as an entry and evict the least recently used entries if needed
+
+        :param key: The key of the entry
+        :param tmp_path: Path to the temporary file
+
+        :type key: str
+        :type tmp_path: str
+
+        :return: The path of the entry file
+        :rtype: str
+        """
+        entry_path = self._path(key)
+        os.makedirs(os.path.dirname(entry_path), mode=0o700, exist_ok=True)
+        if os.path.exists(entry_path):
+            self.size -= os.path.getsize(entry_path)
+        self.size += os.path.getsize(tmp_path)
+        os.replace(tmp_path, entry_path)
+        self._evict()
+        return entry_path
+
+
+    ##########################################################
+    ###################### Public ############################
+    ##########################################################
+
+
+    def get(self, key):
+        """Return the content of an entry and mark it as recently used
+
+        :param key: The key of the entry
+
+        :type key: str
+
+        :return: The content of the entry or None if it is not in the cache
+        :rtype: bytes
+        """
+        path = self.getPath(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as infile:
+                return infile.read()
+        except FileNotFoundError:
+            return None
+
+
+    def getPath(self, key):
+        """Return the path of an entry and mark it as recently used
+
+        :param key: The key of the entry
+
+        :type key: str
+
+        :return: The path of the entry file or None if it is not in the cache
+        :rtype: str
+        """
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+
+    def put(self, key, content):
+        """Add or replace an entry of the cache
+
+        :param key: The key of the entry
+        :param content: The content of the entry
+
+        :type key: str
+        :type content: bytes
+
+        :return: The path of the entry file
+        :rtype: str
+        """
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, prefix='.', delete=False) as outfile:
+            outfile.write(content)
+        return self._commit(key, outfile.name)
+
+
+    def putFile(self, key, path):
+        """Add or replace an entry of the cache with a copy of a file
+
+        :param key: The key of the entry
+        :param path: Path to the file
+
+        :type key: str
+        :type path: str
+
+        :return: The path of the entry file
+        :rtype: str
+        """
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, prefix='.', delete=False) as outfile:
+            with open(path, 'rb') as infile:
+                shutil.copyfileobj(infile, outfile)
+        return self._commit(key, outfile.name)
+
+
+    def clear(self):
+        """Remove all the entries of the cache
+
+        :return: None
+        :rtype: None
+        """
+        for sub_dir in os.scandir(self.cache_dir):
+            if sub_dir.is_dir():
+                shutil.rmtree(sub_dir.path)
+            else:
+                os.remove(sub_dir.path)
+        self.size = 0
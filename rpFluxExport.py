@@ -0,0 +1,170 @@
+import collections
+import zipfile
+import re
+
+import logging
+
+import numpy
+
+
+#arrays of each chunk of the export, suffixed by the number of the chunk
+_ROW_ARRAYS = ['model', 'objective', 'value', 'status']
+_FLUX_ARRAYS = ['flux_row', 'flux_reaction', 'flux_value', 'flux_pathway']
+
+
+class rpFluxWriter:
+    """Incremental writer of the results of the optimisations of a batch as a columnar NumPy archive (.npz)
+
+    The export has one row per (model, objective) with the objective value and the solver status, and a long table of the fluxes with the row, the index of the reaction, the flux and whether the reaction is one of the objective or heterologous pathway reactions annotated by rpFBA. The ids of the reactions are stored once, in the order of their index. The rows are buffered and appended to the archive as chunks of arrays, the archive being closed after each chunk so that the rows already written can be read if the run is killed. Use readFluxExport() to read the whole export
+    """
+    def __init__(self, path, full_fluxes=False, chunk_size=1000):
+        """Default constructor
+
+        :param path: Path of the .npz export, replaced if it exists
+        :param full_fluxes: Export the fluxes of all the reactions of the model instead of only the heterologous pathway (Default: False)
+        :param chunk_size: The number of rows buffered before being appended to the archive (Default: 1000)
+
+        :type path: str
+        :type full_fluxes: bool
+        :type chunk_size: int
+        """
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.full_fluxes = full_fluxes
+        self.chunk_size = chunk_size
+        self.num_rows = 0
+        self._num_chunks = 0
+        self._reactions = {}
+        self._new_reactions = []
+        self._rows = collections.defaultdict(list)
+        self._num_buffered = 0
+        #create an empty archive
+        with zipfile.ZipFile(self.path, mode='w'):
+            pass
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+    ##########################################################
+    ################# Private Functions ######################
+    ##########################################################
+
+
+    def _reactionIndex(self, reaction_id):
+        """Return the index of a reaction, adding it to the index if it is new
+
+        :param reaction_id: The id of the reaction
+
+        :type reaction_id: str
+
+        :return: The index of the reaction
+        :rtype: int
+        """
+        index = self._reactions.get(reaction_id)
+        if index is None:
+            index = self._reactions[reaction_id] = len(self._reactions)
+            self._new_reactions.append(reaction_id)
+        return index
+
+
+    def _flush(self):
+        """Append the buffered rows and the new reaction ids to the archive as a chunk
+
+        :return: None
+        :rtype: None
+        """
+        if not self._num_buffered and not self._new_reactions:
+            return
+        arrays = {'model': numpy.array(self._rows['model'], dtype=str),
+                  'objective': numpy.array(self._rows['objective'], dtype=str),
+                  'value': numpy.array(self._rows['value'], dtype=numpy.float64),
+                  'status': numpy.array(self._rows['status'], dtype=str),
+                  'flux_row': numpy.array(self._rows['flux_row'], dtype=numpy.int64),
+                  'flux_reaction': numpy.array(self._rows['flux_reaction'], dtype=numpy.int32),
+                  'flux_value': numpy.array(self._rows['flux_value'], dtype=numpy.float64),
+                  'flux_pathway': numpy.array(self._rows['flux_pathway'], dtype=bool),
+                  'reactions': numpy.array(self._new_reactions, dtype=str)}
+        with zipfile.ZipFile(self.path, mode='a', compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, array in arrays.items():
+                with archive.open(name+'_'+str(self._num_chunks)+'.npy', mode='w', force_zip64=True) as outfile:
+                    numpy.lib.format.write_array(outfile, array, allow_pickle=False)
+        self._num_chunks += 1
+        self._rows.clear()
+        self._new_reactions = []
+        self._num_buffered = 0
+
+
+    ##########################################################
+    ###################### Public ############################
+    ##########################################################
+
+
+    def write(self, model_name, results):
+        """Add the results of the optimisations of a model
+
+        :param model_name: The name of the model
+        :param results: The results of each objective, as recorded by rpFBA: dictionnaries with the objective id, its value, the solver status, the fluxes of the pathway reactions and optionally the fluxes of all the reactions
+
+        :type model_name: str
+        :type results: list
+
+        :return: None
+        :rtype: None
+        """
+        for result in results:
+            row = self.num_rows
+            self._rows['model'].append(model_name)
+            self._rows['objective'].append(result['objective'])
+            self._rows['value'].append(numpy.nan if result['value'] is None else result['value'])
+            self._rows['status'].append(str(result['status']))
+            fluxes = result.get('fluxes') if self.full_fluxes else None
+            if fluxes is None:
+                fluxes = result['pathway']
+            for reaction_id, flux in fluxes.items():
+                self._rows['flux_row'].append(row)
+                self._rows['flux_reaction'].append(self._reactionIndex(reaction_id))
+                self._rows['flux_value'].append(numpy.nan if flux is None else flux)
+                self._rows['flux_pathway'].append(reaction_id in result['pathway'])
+            self.num_rows += 1
+            self._num_buffered += 1
+        if self._num_buffered>=self.chunk_size:
+            self._flush()
+
+
+    def close(self):
+        """Append the remaining rows to the archive
+
+        :return: None
+        :rtype: None
+        """
+        self._flush()
+        self.logger.debug('Exported '+str(self.num_rows)+' results to '+str(self.path))
+
+
+def readFluxExport(path):
+    """Read an export written by rpFluxWriter, concatenating its chunks
+
+    :param path: Path of the .npz export
+
+    :type path: str
+
+    :return: Dictionnary of the columns: model, objective, value and status (one value per row), flux_row, flux_reaction, flux_value and flux_pathway (one value per flux) and reactions (the reaction ids, by index)
+    :rtype: dict
+    """
+    chunks = collections.defaultdict(dict)
+    with numpy.load(path, allow_pickle=False) as archive:
+        for name in archive.files:
+            match = re.match(r'^(.+)_(\d+)$', name)
+            if match:
+                chunks[match.group(1)][int(match.group(2))] = archive[name]
+    columns = {}
+    for name in _ROW_ARRAYS+_FLUX_ARRAYS+['reactions']:
+        arrays = [chunks[name][i] for i in sorted(chunks[name])]
+        columns[name] = numpy.concatenate(arrays) if arrays else numpy.array([])
+    return columns
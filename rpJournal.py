@@ -0,0 +1,149 @@
+import collections
+import tempfile
+import json
+import os
+
+import logging
+
+
+class rpJournal:
+    """Persistent record of the models of a batch that have been completed, to resume the batch if it is interrupted
+
+    The output of each completed model is written to the folder of the run and appended to an append-only journal (journal.jsonl) with its location. The folder of a run is named after a fingerprint of its inputs and parameters, so that restarting the same batch with the same work folder reopens the journal and skips the models that it lists, while a batch with other inputs or parameters starts its own journal. The outputs are written to a temporary file, synced to disk and then renamed (the rename being synced too) before being journaled, and the journal is synced to disk after each model, so that a killed run or a crash of the machine never journals a partial output
+    """
+    def __init__(self, work_dir, fingerprint):
+        """Default constructor
+
+        :param work_dir: The work folder, created if it does not exist
+        :param fingerprint: The hash of the inputs and parameters of the batch
+
+        :type work_dir: str
+        :type fingerprint: str
+        """
+        self.logger = logging.getLogger(__name__)
+        self.run_dir = os.path.join(work_dir, 'run_'+str(fingerprint)[:16])
+        self.models_dir = os.path.join(self.run_dir, 'models')
+        os.makedirs(self.models_dir, exist_ok=True)
+        self.path = os.path.join(self.run_dir, 'journal.jsonl')
+        self._outputs = collections.OrderedDict()
+        self._load()
+        self.num_resumed = len(self._outputs)
+        self._file = open(self.path, 'a')
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+    ##########################################################
+    ################# Private Functions ######################
+    ##########################################################
+
+
+    def _load(self):
+        """Read the models completed by the previous runs from the journal
+
+        A last line that has been partially written when the run was killed is removed from the journal
+
+        :return: None
+        :rtype: None
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as infile:
+            content = infile.read()
+        complete = content[:content.rfind(b'\n')+1]
+        if len(complete)<len(content):
+            self.logger.warning('Removing the incomplete last entry of the journal '+str(self.path))
+            with open(self.path, 'wb') as outfile:
+                outfile.write(complete)
+        for line in complete.decode('utf-8').splitlines():
+            entry = json.loads(line)
+            path = os.path.join(self.run_dir, entry['path'])
+            if os.path.exists(path):
+                self._outputs[entry['model']] = path
+
+
+    ##########################################################
+    ###################### Public ############################
+    ##########################################################
+
+
+    @property
+    def num_models(self):
+        """Number of models completed, by this run and the previous ones
+
+        :return: The number of models
+        :rtype: int
+        """
+        return len(self._outputs)
+
+
+    def isDone(self, model_name):
+        """Return if a model has already been completed
+
+        :param model_name: The name of the model
+
+        :type model_name: str
+
+        :return: If the model is in the journal
+        :rtype: bool
+        """
+        return model_name in self._outputs
+
+
+    def write(self, model_name, content):
+        """Write the output of a completed model to the run folder and add it to the journal
+
+        :param model_name: The name of the model
+        :param content: The output SBML of the model
+
+        :type model_name: str
+        :type content: str
+
+        :return: None
+        :rtype: None
+        """
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        path = os.path.join(self.models_dir, str(model_name)+'.sbml.xml')
+        fd, tmp_path = tempfile.mkstemp(dir=self.models_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as outfile:
+            outfile.write(content)
+            #the content is on disk before the model is renamed and added to the journal
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.replace(tmp_path, path)
+        #and so is the rename
+        dir_fd = os.open(self.models_dir, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        self._file.write(json.dumps({'model': model_name, 'path': os.path.relpath(path, self.run_dir)})+'\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._outputs[model_name] = path
+
+
+    def outputs(self):
+        """Return the outputs of the completed models, in the order they have been completed
+
+        :return: Tuples of the name of the model and the path of its output
+        :rtype: list
+        """
+        return list(self._outputs.items())
+
+
+    def close(self):
+        """Close the journal
+
+        :return: None
+        :rtype: None
+        """
+        if not self._file.closed:
+            self._file.close()
@@ -0,0 +1,443 @@
+import multiprocessing
+import multiprocessing.connection
+import collections
+import heapq
+import traceback
+import resource
+import time
+import sys
+import os
+
+import logging
+
+
+def _getRSS():
+    """Return the resident set size of the current process
+
+    :return: The resident set size in MB
+    :rtype: float
+    """
+    try:
+        with open('/proc/self/statm', 'r') as statm:
+            return int(statm.read().split()[1])*os.sysconf('SC_PAGE_SIZE')/1048576.0
+    except (OSError, ValueError, IndexError):
+        #fall back on the peak RSS, in bytes on macOS and kB elsewhere
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform=='darwin':
+            return rss/1048576.0
+        return rss/1024.0
+
+
+def _worker(conn, func, common_args, initializer, initargs, max_tasks, max_rss):
+    """Loop of a worker process: receive chunks of tasks from the parent and send back their results
+
+    The worker retires itself, possibly in the middle of a chunk, after max_tasks tasks or when its RSS exceeds max_rss, to contain memory leaks (ex: cobrapy https://github.com/opencobra/cobrapy/issues/568)
+
+    :param conn: The worker end of the pipe to the parent
+    :param func: The function to call for every task
+    :param common_args: The arguments shared by all the tasks, appended to the task arguments
+    :param initializer: Function called once when the worker starts (Default: None)
+    :param initargs: The arguments of the initializer
+    :param max_tasks: Number of tasks after which the worker retires (None for no limit)
+    :param max_rss: RSS in MB after which the worker retires (None for no limit)
+
+    :type conn: multiprocessing.connection.Connection
+    :type func: function
+    :type common_args: tuple
+    :type initializer: function
+    :type initargs: tuple
+    :type max_tasks: int
+    :type max_rss: float
+
+    :return: None
+    :rtype: None
+    """
+    if initializer is not None:
+        try:
+            initializer(*initargs)
+        except Exception:
+            #the parent stops the pool if the workers keep failing to start
+            conn.send(('init_failed', traceback.format_exc()))
+            conn.close()
+            return
+    num_tasks = 0
+    is_retired = False
+    while not is_retired:
+        chunk = conn.recv()
+        if chunk is None:
+            break
+        for task_id, args in chunk:
+            conn.send(('start', task_id))
+            try:
+                result = func(*(tuple(args)+tuple(common_args)))
+                error = None
+            except Exception:
+                result = None
+                error = traceback.format_exc()
+            conn.send(('done', task_id, result, error))
+            num_tasks += 1
+            #checked after every task rather than every chunk, the tasks of the chunk that have not started are given back to the parent
+            if (max_tasks and num_tasks>=max_tasks) or (max_rss and _getRSS()>max_rss):
+                is_retired = True
+                break
+        conn.send(('retire',) if is_retired else ('ready',))
+    conn.close()
+
+
+class rpPool:
+    """Pool of long-lived worker processes
+
+    The workers keep their imported modules and whatever the initializer loads (ex: the GEM) across tasks, receive the tasks in chunks and are replaced after a number of tasks or above an RSS threshold. If the initializer fails (or the worker dies before starting a task) max_init_failures times in a row, the pool raises a RuntimeError rather than replacing the workers forever. The arguments common to all the tasks are passed once per worker rather than with every task. A worker that dies (ex: segmentation fault of the solver) fails the task it was running and is replaced, without stopping the rest of the batch, and a worker that runs a task for longer than task_timeout is killed and replaced in the same way. The task of a worker that died can be run again in a new worker, so that it does not inherit the state left by the previous tasks. The tasks can be dispatched by decreasing estimated cost to shorten the makespan of heterogeneous batches
+    """
+    def __init__(self,
+                 func,
+                 common_args=(),
+                 num_workers=10,
+                 chunksize=None,
+                 max_tasks=None,
+                 max_rss=None,
+                 initializer=None,
+                 initargs=(),
+                 task_timeout=None,
+                 retries=0,
+                 max_init_failures=3):
+        """Default constructor
+
+        :param func: The function called for each task as func(*task_args, *common_args). Must be importable from the worker
+        :param common_args: The arguments shared by all the tasks (Default: ())
+        :param num_workers: The number of worker processes (Default: 10)
+        :param chunksize: The number of tasks sent at once to a worker. If None, chosen from the number of tasks (Default: None)
+        :param max_tasks: Number of tasks after which a worker is replaced (Default: None)
+        :param max_rss: RSS in MB above which a worker is replaced (Default: None)
+        :param initializer: Function called once when each worker starts (Default: None)
+        :param initargs: The arguments of the initializer (Default: ())
+        :param task_timeout: Wall time in seconds after which the worker running a task is killed and the task fails with the status timed_out (Default: None)
+        :param retries: Number of times a task whose worker died is run again, each time in a new worker, before failing with the status crashed (Default: 0)
+        :param max_init_failures: Number of consecutive workers failing to start after which the pool stops (Default: 3)
+
+        :type func: function
+        :type common_args: tuple
+        :type num_workers: int
+        :type chunksize: int
+        :type max_tasks: int
+        :type max_rss: float
+        :type initializer: function
+        :type initargs: tuple
+        :type task_timeout: float
+        :type retries: int
+        :type max_init_failures: int
+        """
+        self.logger = logging.getLogger(__name__)
+        if num_workers<1:
+            raise ValueError('Cannot have 0 or less workers: '+str(num_workers))
+        self.func = func
+        self.common_args = tuple(common_args)
+        self.num_workers = num_workers
+        self.chunksize = chunksize
+        self.max_tasks = max_tasks
+        self.max_rss = max_rss
+        self.initializer = initializer
+        self.initargs = tuple(initargs)
+        self.task_timeout = task_timeout
+        self.retries = retries
+        self.max_init_failures = max_init_failures
+        self.workers = {}
+        self._worker_count = 0
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+    ##########################################################
+    ################# Private Functions ######################
+    ##########################################################
+
+
+    def _startWorker(self):
+        """Start a new worker process
+
+        :return: The id of the worker
+        :rtype: int
+        """
+        parent_conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_worker,
+                                          args=(child_conn,
+                                                self.func,
+                                                self.common_args,
+                                                self.initializer,
+                                                self.initargs,
+                                                self.max_tasks,
+                                                self.max_rss))
+        process.daemon = True
+        process.start()
+        child_conn.close()
+        worker_id = self._worker_count
+        self._worker_count += 1
+        self.workers[worker_id] = {'process': process,
+                                   'conn': parent_conn,
+                                   'tasks': [],
+                                   'current': None,
+                                   'started': None,
+                                   'ready': True,
+                                   'is_initialized': False,
+                                   'init_error': None}
+        self.logger.debug('Started worker '+str(worker_id)+' (pid '+str(process.pid)+')')
+        return worker_id
+
+
+    def _chunksize(self, num_tasks=None):
+        """Return the number of tasks sent at once to a worker
+
+        If it has not been given to the constructor, it is chosen from the number of tasks with the same heuristic as multiprocessing.Pool.map(), about four chunks per worker, or is 1 if the number of tasks is not known
+
+        :param num_tasks: The number of tasks, None if it is not known (Default: None)
+
+        :type num_tasks: int
+
+        :return: The size of the chunks
+        :rtype: int
+        """
+        if self.chunksize:
+            return self.chunksize
+        if not num_tasks:
+            return 1
+        chunksize, extra = divmod(num_tasks, self.num_workers*4)
+        if extra or chunksize==0:
+            chunksize += 1
+        return chunksize
+
+
+    def _sendChunk(self, worker, chunk):
+        """Send a chunk of tasks to a worker
+
+        If the worker has already died (ex: in the initializer), the tasks are given back when its death is handled
+
+        :param worker: The worker
+        :param chunk: The ids and arguments of the tasks
+
+        :type worker: dict
+        :type chunk: list
+
+        :return: None
+        :rtype: None
+        """
+        try:
+            worker['conn'].send(chunk)
+        except (BrokenPipeError, OSError):
+            self.logger.debug('Cannot send the tasks to the worker (pid '+str(worker['process'].pid)+'), it has died')
+
+
+    def _stopWorker(self, worker_id):
+        """Close the connection of a worker and wait for its process to finish
+
+        :param worker_id: The id of the worker
+
+        :type worker_id: int
+
+        :return: None
+        :rtype: None
+        """
+        worker = self.workers.pop(worker_id)
+        worker['conn'].close()
+        worker['process'].join()
+
+
+    ##########################################################
+    ###################### Public ############################
+    ##########################################################
+
+
+    def imap_unordered(self, tasks, cost=None, lookahead=None, num_tasks=None):
+        """Run the tasks on the workers and yield the results as they complete
+
+        The tasks are consumed lazily, only when a worker is ready to receive them, so that they can be read from a stream (ex: the members of a tar archive) without being held in memory all at once. If cost is given, up to lookahead tasks are read ahead and the most expensive of them are dispatched first (longest job first), so that the long tasks do not end up last while the other workers are idle: each idle worker takes a chunk of the most expensive remaining tasks
+
+        :param tasks: The arguments of each task
+        :param cost: Function returning the estimated cost of a task from its arguments, as a number. None to dispatch the tasks in their order (Default: None)
+        :param lookahead: The number of tasks read ahead to be ordered by cost. None to read all the tasks (Default: None)
+        :param num_tasks: The number of tasks, to choose the size of the chunks when tasks has no length (ex: a generator). An estimate is enough (Default: None)
+
+        :type tasks: iterable
+        :type cost: function
+        :type lookahead: int
+        :type num_tasks: int
+
+        :return: Generator of tuples with the task arguments, the returned value, the error traceback (None if successful) and the status of the task: success, failed (exception raised by the task), crashed (the worker died) or timed_out
+        :rtype: generator
+
+        :raises RuntimeError: If max_init_failures workers in a row fail to start
+        """
+        try:
+            num_tasks = len(tasks)
+        except TypeError:
+            pass
+        chunksize = self._chunksize(num_tasks)
+        tasks_iter = enumerate(tasks)
+        is_exhausted = False
+        #tasks given back by a dead worker before they started
+        pending = collections.deque()
+        #tasks read ahead, ordered by decreasing cost
+        queued = []
+        #arguments of the tasks that have been dispatched and are not completed
+        running = {}
+        #tasks whose worker died, to be run again in a new worker
+        retried = collections.deque()
+        num_retries = collections.Counter()
+        #workers in a row that have failed in the initializer or died before starting a task
+        num_init_failures = 0
+
+        def _nextTask():
+            """Return the next task to dispatch, None if there are none left"""
+            nonlocal is_exhausted
+            if pending:
+                return pending.popleft()
+            while not is_exhausted and (cost is None or not lookahead or len(queued)<lookahead):
+                try:
+                    task_id, args = next(tasks_iter)
+                except StopIteration:
+                    is_exhausted = True
+                    break
+                if cost is None:
+                    return task_id, args
+                heapq.heappush(queued, (-cost(args), task_id, args))
+            if queued:
+                task_cost, task_id, args = heapq.heappop(queued)
+                return task_id, args
+            return None
+
+        while True:
+            ##### run the tasks whose worker died again, each alone in a new worker #####
+            while retried:
+                if len(self.workers)>=self.num_workers:
+                    idle = [i for i in self.workers if self.workers[i]['ready'] and not self.workers[i]['tasks']]
+                    if not idle:
+                        break
+                    #make room for the new worker
+                    try:
+                        self.workers[idle[0]]['conn'].send(None)
+                    except (BrokenPipeError, OSError):
+                        pass
+                    self._stopWorker(idle[0])
+                task_id, args = retried.popleft()
+                worker = self.workers[self._startWorker()]
+                worker['tasks'] = [task_id]
+                worker['ready'] = False
+                running[task_id] = args
+                self._sendChunk(worker, [(task_id, args)])
+            ##### dispatch the chunks to the idle workers, starting new ones if needed #####
+            while True:
+                idle = [i for i in self.workers if self.workers[i]['ready'] and not self.workers[i]['tasks']]
+                if not idle and len(self.workers)>=self.num_workers:
+                    break
+                chunk = []
+                while len(chunk)<chunksize:
+                    task = _nextTask()
+                    if task is None:
+                        break
+                    chunk.append(task)
+                if not chunk:
+                    break
+                worker = self.workers[idle[0] if idle else self._startWorker()]
+                worker['tasks'] = [i[0] for i in chunk]
+                worker['ready'] = False
+                running.update(chunk)
+                self._sendChunk(worker, chunk)
+            if not running and not pending and not queued and not retried and is_exhausted:
+                break
+            conn_workers = {worker['conn']: worker_id for worker_id, worker in self.workers.items()}
+            sentinel_workers = {worker['process'].sentinel: worker_id for worker_id, worker in self.workers.items()}
+            #wake up at the earliest deadline of the running tasks
+            wait_timeout = None
+            if self.task_timeout:
+                deadlines = [worker['started']+self.task_timeout for worker in self.workers.values() if worker['current'] is not None]
+                if deadlines:
+                    wait_timeout = max(0.0, min(deadlines)-time.monotonic())
+            for ready in multiprocessing.connection.wait(list(conn_workers)+list(sentinel_workers), wait_timeout):
+                worker_id = conn_workers.get(ready, sentinel_workers.get(ready))
+                if worker_id not in self.workers:
+                    #the worker has already been handled from its other waitable
+                    continue
+                worker = self.workers[worker_id]
+                is_dead = False
+                try:
+                    while worker['conn'].poll():
+                        msg = worker['conn'].recv()
+                        if msg[0]=='start':
+                            worker['current'] = msg[1]
+                            worker['started'] = time.monotonic()
+                            worker['is_initialized'] = True
+                            num_init_failures = 0
+                        elif msg[0]=='done':
+                            worker['tasks'].remove(msg[1])
+                            worker['current'] = None
+                            yield running.pop(msg[1]), msg[2], msg[3], 'success' if msg[3] is None else 'failed'
+                        elif msg[0]=='ready':
+                            worker['ready'] = True
+                        elif msg[0]=='retire':
+                            self.logger.debug('Replacing worker '+str(worker_id))
+                            self._stopWorker(worker_id)
+                            pending.extendleft((i, running.pop(i)) for i in reversed(worker['tasks']))
+                            break
+                        elif msg[0]=='init_failed':
+                            worker['init_error'] = msg[1]
+                except (EOFError, OSError):
+                    is_dead = True
+                if worker_id in self.workers and (is_dead or not worker['process'].is_alive()):
+                    worker['process'].join()
+                    exitcode = worker['process'].exitcode
+                    self.logger.warning('Worker '+str(worker_id)+' died with exit code '+str(exitcode))
+                    self._stopWorker(worker_id)
+                    if not worker['is_initialized']:
+                        num_init_failures += 1
+                        error = worker['init_error'] or 'Worker died with exit code '+str(exitcode)+' before starting a task'
+                        self.logger.error('Worker '+str(worker_id)+' failed to start ('+str(num_init_failures)+' in a row)')
+                        self.logger.error(error)
+                        if num_init_failures>=self.max_init_failures:
+                            raise RuntimeError('The workers failed to start '+str(num_init_failures)+' times in a row: '+error)
+                    task_id = worker['current']
+                    if task_id is not None:
+                        worker['tasks'].remove(task_id)
+                        if num_retries[task_id]<self.retries:
+                            num_retries[task_id] += 1
+                            self.logger.warning('Running the task of worker '+str(worker_id)+' again in a new worker')
+                            retried.append((task_id, running.pop(task_id)))
+                        else:
+                            error = 'Worker died with exit code '+str(exitcode)
+                            if num_retries[task_id]:
+                                error += ' (retried '+str(num_retries[task_id])+' times)'
+                            yield running.pop(task_id), None, error, 'crashed'
+                    #the tasks of the chunk that have not started are given to another worker
+                    pending.extendleft((i, running.pop(i)) for i in reversed(worker['tasks']))
+            ##### kill the workers that have been running the same task for longer than task_timeout #####
+            if self.task_timeout:
+                now = time.monotonic()
+                for worker_id in list(self.workers):
+                    worker = self.workers[worker_id]
+                    if worker['current'] is None or now-worker['started']<self.task_timeout or worker['conn'].poll():
+                        #the messages of a worker that has just completed its task are read first
+                        continue
+                    self.logger.warning('Worker '+str(worker_id)+' timed out after '+str(self.task_timeout)+' s')
+                    worker['process'].kill()
+                    self._stopWorker(worker_id)
+                    worker['tasks'].remove(worker['current'])
+                    yield running.pop(worker['current']), None, 'Timed out after '+str(self.task_timeout)+' s', 'timed_out'
+                    pending.extendleft((i, running.pop(i)) for i in reversed(worker['tasks']))
+
+
+    def close(self):
+        """Stop all the workers
+
+        :return: None
+        :rtype: None
+        """
+        for worker_id in list(self.workers):
+            try:
+                self.workers[worker_id]['conn'].send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            self._stopWorker(worker_id)
@@ -0,0 +1,406 @@
+import contextlib
+import functools
+import resource
+import json
+import time
+import sys
+import os
+
+import logging
+
+
+#profile of the model being run by this process, None when the profiling is disabled
+_current = None
+#returned instead of a stage when the profiling is disabled, so that it costs a single function call
+_NULL_CONTEXT = contextlib.nullcontext()
+#if the peak RSS of the process can be reset, None until it is first tried
+_can_reset_peak = None
+#peak RSS of the process before it was last reset, in MB
+_peak_before_reset = 0.0
+
+
+def _getPeakRSS():
+    """Return the peak resident set size of the current process since it started
+
+    It is a high-water mark over the lifetime of the process, that only grows in a worker running many models. The kernel resets it with the peak of the stages (see _resetPeakRSS()), the peak before the last reset is kept
+
+    :return: The peak resident set size in MB
+    :rtype: float
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #in bytes on macOS and kB elsewhere
+    if sys.platform=='darwin':
+        return max(rss/1048576.0, _peak_before_reset)
+    return max(rss/1024.0, _peak_before_reset)
+
+
+def _getRSS():
+    """Return the current resident set size of the current process
+
+    :return: The resident set size in MB, None if /proc/self/statm is not available
+    :rtype: float
+    """
+    try:
+        with open('/proc/self/statm', 'r') as statm:
+            return int(statm.read().split()[1])*os.sysconf('SC_PAGE_SIZE')/1048576.0
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _resetPeakRSS():
+    """Reset the peak resident set size of the current process (VmHWM) to its current RSS
+
+    Writing 5 to /proc/self/clear_refs is supported by Linux since 4.0. It also resets the ru_maxrss of getrusage(), so the peak before the reset is kept for _getPeakRSS()
+
+    :return: If the peak RSS has been reset
+    :rtype: bool
+    """
+    global _can_reset_peak, _peak_before_reset
+    if _can_reset_peak is False:
+        return False
+    _peak_before_reset = max(_peak_before_reset, _getHWM() or 0.0)
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        _can_reset_peak = True
+    except OSError:
+        _can_reset_peak = False
+    return _can_reset_peak
+
+
+def _getHWM():
+    """Return the peak resident set size of the current process since it started or since it was last reset by _resetPeakRSS()
+
+    :return: The peak resident set size in MB, None if /proc/self/status is not available
+    :rtype: float
+    """
+    try:
+        with open('/proc/self/status', 'r') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])/1024.0
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _solverIterations(cobra_model):
+    """Return the cumulated number of simplex iterations of the solver of a cobra model
+
+    Only GLPK (the default solver of cobrapy) exposes it
+
+    :param cobra_model: The cobra model
+
+    :type cobra_model: cobra.Model
+
+    :return: The number of iterations, None if it is not available
+    :rtype: int
+    """
+    try:
+        import swiglpk
+        return swiglpk.glp_get_it_cnt(cobra_model.solver.problem)
+    except (ImportError, AttributeError, TypeError):
+        return None
+
+
+def _percentile(values, percent):
+    """Return the percentile of a list of values, using the nearest rank
+
+    :param values: The sorted values
+    :param percent: The percentile, between 0 and 100
+
+    :type values: list
+    :type percent: float
+
+    :return: The percentile
+    :rtype: float
+    """
+    return values[max(0, min(len(values)-1, int(-(-len(values)*percent//100))-1))]
+
+
+class rpProfile:
+    """Record of the wall time, CPU time and RSS of the stages of a model run, and of the status and iterations of its optimisations
+
+    The stages can be nested (ex: convert within simulate_fba) and a stage run several times is cumulated. The peak_rss of a stage is the peak RSS of the process during the stage, measured by resetting the peak of the process (VmHWM) when a stage starts and reading it when a stage starts or ends, the peaks read being added to all the stages that are running. rss_delta is the cumulated change of the current RSS during the stage. They are None where /proc is not available (and peak_rss where the peak cannot be reset). The peak RSS of the process since it started, that grows over the models run by the same worker, is only recorded once per model as worker_peak_rss
+    """
+    def __init__(self, model_name):
+        """Default constructor
+
+        :param model_name: The name of the model
+
+        :type model_name: str
+        """
+        self.model_name = model_name
+        self.stages = {}
+        self.solver = []
+        #peak RSS of each stage that is running, outermost first
+        self._running = []
+
+
+    def _updatePeaks(self):
+        """Add the peak RSS since the last reset to the running stages
+
+        :return: None
+        :rtype: None
+        """
+        peak = _getHWM()
+        for running in self._running:
+            if running['peak'] is not None and peak is not None:
+                running['peak'] = max(running['peak'], peak)
+            else:
+                running['peak'] = None
+
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Context manager timing a stage
+
+        :param name: The name of the stage
+
+        :type name: str
+
+        :return: None
+        :rtype: None
+        """
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        #the peak reached so far by the enclosing stages is kept before it is reset
+        self._updatePeaks()
+        running = {'peak': 0.0 if _resetPeakRSS() else None}
+        self._running.append(running)
+        rss = _getRSS()
+        try:
+            yield
+        finally:
+            self._updatePeaks()
+            self._running.remove(running)
+            stage = self.stages.setdefault(name, {'count': 0, 'wall': 0.0, 'cpu': 0.0, 'peak_rss': None, 'rss_delta': None})
+            stage['count'] += 1
+            stage['wall'] += time.perf_counter()-wall
+            stage['cpu'] += time.process_time()-cpu
+            if running['peak'] is not None:
+                stage['peak_rss'] = max(stage['peak_rss'] or 0.0, running['peak'])
+            rss_after = _getRSS()
+            if rss is not None and rss_after is not None:
+                stage['rss_delta'] = (stage['rss_delta'] or 0.0)+rss_after-rss
+
+
+    @contextlib.contextmanager
+    def solve(self, objective_id, cobra_model):
+        """Context manager timing an optimisation, as the solve stage, and recording its status and number of iterations
+
+        :param objective_id: The id of the objective
+        :param cobra_model: The cobra model that is optimised
+
+        :type objective_id: str
+        :type cobra_model: cobra.Model
+
+        :return: None
+        :rtype: None
+        """
+        iterations = _solverIterations(cobra_model)
+        with self.stage('solve'):
+            try:
+                yield
+            finally:
+                iterations_after = _solverIterations(cobra_model)
+                try:
+                    status = cobra_model.solver.status
+                except AttributeError:
+                    status = None
+                self.solver.append({'objective': objective_id,
+                                    'status': status,
+                                    'iterations': None if iterations is None or iterations_after is None else iterations_after-iterations})
+
+
+    def toDict(self):
+        """Return the profile as a dictionnary
+
+        :return: The profile
+        :rtype: dict
+        """
+        return {'model': self.model_name,
+                'pid': os.getpid(),
+                'worker_peak_rss': _getPeakRSS(),
+                'stages': self.stages,
+                'solver': self.solver}
+
+
+    def write(self, report_path):
+        """Append the profile as a line of a JSON lines report
+
+        The line is written with a single write() to a file opened with O_APPEND, so that the lines of several processes writing to the same report are not interleaved
+
+        :param report_path: Path to the report
+
+        :type report_path: str
+
+        :return: None
+        :rtype: None
+        """
+        line = (json.dumps(self.toDict())+'\n').encode('utf-8')
+        fd = os.open(report_path, os.O_WRONLY|os.O_APPEND|os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+@contextlib.contextmanager
+def _profile(model_name, report_path):
+    """Set the profile of the current model and write it to the report once the model has run. See profile()
+    """
+    global _current
+    previous = _current
+    _current = rpProfile(model_name)
+    try:
+        yield _current
+    finally:
+        model_profile, _current = _current, previous
+        try:
+            model_profile.write(report_path)
+        except OSError as e:
+            logging.warning('Cannot write the profile of '+str(model_name)+': '+str(e))
+
+
+def profile(model_name, report_path=None):
+    """Context manager profiling the run of a model. The stages and optimisations run within it are recorded and written to the report when it exits
+
+    :param model_name: The name of the model
+    :param report_path: Path to the JSON lines report. None to disable the profiling (Default: None)
+
+    :type model_name: str
+    :type report_path: str
+
+    :return: Context manager
+    :rtype: contextlib.AbstractContextManager
+    """
+    if report_path is None:
+        return _NULL_CONTEXT
+    return _profile(model_name, report_path)
+
+
+def stage(name):
+    """Context manager timing a stage of the model being profiled. Does nothing if no model is profiled
+
+    :param name: The name of the stage
+
+    :type name: str
+
+    :return: Context manager
+    :rtype: contextlib.AbstractContextManager
+    """
+    if _current is None:
+        return _NULL_CONTEXT
+    return _current.stage(name)
+
+
+def solve(objective_id, cobra_model):
+    """Context manager timing an optimisation of the model being profiled and recording its status and iterations. Does nothing if no model is profiled
+
+    :param objective_id: The id of the objective
+    :param cobra_model: The cobra model that is optimised
+
+    :type objective_id: str
+    :type cobra_model: cobra.Model
+
+    :return: Context manager
+    :rtype: contextlib.AbstractContextManager
+    """
+    if _current is None:
+        return _NULL_CONTEXT
+    return _current.solve(objective_id, cobra_model)
+
+
+def staged(name):
+    """Decorator timing every call of a function as a stage of the model being profiled
+
+    :param name: The name of the stage
+
+    :type name: str
+
+    :return: The decorator
+    :rtype: function
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current is None:
+                return func(*args, **kwargs)
+            with _current.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def summarize(report_path):
+    """Summarise a JSON lines report: the p50, p95 and maximum of the wall time, CPU time, peak RSS and RSS delta of each stage across the models, and the number of optimisations per solver status
+
+    The worker_peak_rss of the models is only summarised by its maximum, the peak RSS of the largest worker, as it is cumulated over the models run by the same worker
+
+    :param report_path: Path to the report
+
+    :type report_path: str
+
+    :return: The summary
+    :rtype: dict
+    """
+    stages = {}
+    status = {}
+    models = set()
+    worker_peak_rss = None
+    with open(report_path, 'r') as infile:
+        for line in infile:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            models.add(record['model'])
+            if record.get('worker_peak_rss') is not None:
+                worker_peak_rss = max(worker_peak_rss or 0.0, record['worker_peak_rss'])
+            for name, stage in record['stages'].items():
+                for key in ['wall', 'cpu', 'peak_rss', 'rss_delta']:
+                    values = stages.setdefault(name, {}).setdefault(key, [])
+                    if stage.get(key) is not None:
+                        values.append(stage[key])
+            for solve in record['solver']:
+                status[str(solve['status'])] = status.get(str(solve['status']), 0)+1
+    summary = {'num_models': len(models), 'worker_peak_rss': worker_peak_rss, 'solver_status': status, 'stages': {}}
+    for name, values in stages.items():
+        summary['stages'][name] = {'count': len(values['wall'])}
+        for key, key_values in values.items():
+            if not key_values:
+                summary['stages'][name][key] = None
+                continue
+            key_values = sorted(key_values)
+            summary['stages'][name][key] = {'p50': _percentile(key_values, 50),
+                                            'p95': _percentile(key_values, 95),
+                                            'max': key_values[-1]}
+    return summary
+
+
+def writeSummary(report_path, summary_path=None):
+    """Write the summary of a JSON lines report to a JSON file and log it
+
+    :param report_path: Path to the report
+    :param summary_path: Path to the summary. If None, <report>.summary.json without the extension of the report (Default: None)
+
+    :type report_path: str
+    :type summary_path: str
+
+    :return: The summary
+    :rtype: dict
+    """
+    if summary_path is None:
+        summary_path = os.path.splitext(report_path)[0]+'.summary.json'
+    summary = summarize(report_path)
+    with open(summary_path, 'w') as outfile:
+        json.dump(summary, outfile, indent=4)
+    logging.info('Profiled '+str(summary['num_models'])+' models, solver status: '+str(summary['solver_status']))
+    for name, stage in sorted(summary['stages'].items(), key=lambda x: -x[1]['wall']['max']):
+        message = str(name)+': wall p50='+str(round(stage['wall']['p50'], 4))+'s p95='+str(round(stage['wall']['p95'], 4))+'s max='+str(round(stage['wall']['max'], 4))+'s'
+        if stage['peak_rss'] is not None:
+            message += ', peak RSS p95='+str(round(stage['peak_rss']['p95'], 1))+'MB max='+str(round(stage['peak_rss']['max'], 1))+'MB'
+        if stage['rss_delta'] is not None:
+            message += ', RSS delta p95='+str(round(stage['rss_delta']['p95'], 1))+'MB'
+        logging.info(message)
+    return summary
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+
+import argparse
+import sqlite3
+import json
+import time
+import os
+
+import logging
+
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started TEXT,
+    input TEXT,
+    output TEXT,
+    gem_hash TEXT,
+    params TEXT
+);
+CREATE TABLE IF NOT EXISTS models (
+    run_id INTEGER,
+    model TEXT,
+    model_key TEXT,
+    status TEXT,
+    wall REAL,
+    PRIMARY KEY (run_id, model)
+);
+CREATE INDEX IF NOT EXISTS models_key ON models (model_key, status);
+CREATE TABLE IF NOT EXISTS objectives (
+    run_id INTEGER,
+    model TEXT,
+    objective TEXT,
+    value REAL,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS objectives_run ON objectives (run_id, model);
+CREATE TABLE IF NOT EXISTS fluxes (
+    run_id INTEGER,
+    model TEXT,
+    objective TEXT,
+    reaction TEXT,
+    flux REAL
+);
+CREATE INDEX IF NOT EXISTS fluxes_reaction ON fluxes (reaction, run_id);
+'''
+
+
+class rpResultsIndex:
+    """SQLite index of the results of the batch runs: the parameters and GEM of each run, and the status, wall time, objective values and pathway fluxes of each model
+
+    The models are identified by the same key as the cache of the output models (the GEM, the content of the model and the parameters), so that the models already computed with identical parameters by a previous run can be found and skipped. Only the process running the batch writes to the index, the rows of a run are committed every commit_every models
+    """
+    def __init__(self, db_path, commit_every=100):
+        """Default constructor
+
+        :param db_path: Path to the SQLite database, created if it does not exist
+        :param commit_every: The number of models added between two commits (Default: 100)
+
+        :type db_path: str
+        :type commit_every: int
+        """
+        self.logger = logging.getLogger(__name__)
+        self.db_path = db_path
+        self.commit_every = commit_every
+        self.run_id = None
+        self._num_uncommitted = 0
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+    ##########################################################
+    ###################### Writing ###########################
+    ##########################################################
+
+
+    def startRun(self, input_path, output_path, gem_hash, params):
+        """Add a new run, to which the following models are added
+
+        :param input_path: Path of the input TAR
+        :param output_path: Path of the output TAR
+        :param gem_hash: The hash of the content of the GEM
+        :param params: The parameters of the run
+
+        :type input_path: str
+        :type output_path: str
+        :type gem_hash: str
+        :type params: dict
+
+        :return: The id of the run
+        :rtype: int
+        """
+        cursor = self.conn.execute('INSERT INTO runs (started, input, output, gem_hash, params) VALUES (?, ?, ?, ?, ?)',
+                                   (time.strftime('%Y-%m-%dT%H:%M:%S'),
+                                    os.path.abspath(input_path),
+                                    os.path.abspath(output_path),
+                                    gem_hash,
+                                    json.dumps(params, sort_keys=True, default=str)))
+        self.conn.commit()
+        self.run_id = cursor.lastrowid
+        return self.run_id
+
+
+    def addModel(self, model_name, model_key, results=None, status='success'):
+        """Add the results of a model to the current run
+
+        :param model_name: The name of the model
+        :param model_key: The key identifying the model, the GEM and the parameters
+        :param results: The results of the model as returned by singleFBA(): the wall time and the objectives with their value, solver status and pathway fluxes (Default: None)
+        :param status: The status of the model: success, failed, crashed, quarantined or timed_out (Default: success)
+
+        :type model_name: str
+        :type model_key: str
+        :type results: dict
+        :type status: str
+
+        :return: None
+        :rtype: None
+        """
+        results = results or {}
+        self.conn.execute('INSERT OR REPLACE INTO models (run_id, model, model_key, status, wall) VALUES (?, ?, ?, ?, ?)',
+                          (self.run_id, model_name, model_key, status, results.get('wall')))
+        objectives = results.get('objectives') or []
+        self.conn.executemany('INSERT INTO objectives (run_id, model, objective, value, status) VALUES (?, ?, ?, ?, ?)',
+                              [(self.run_id, model_name, i['objective'], i['value'], str(i['status'])) for i in objectives])
+        self.conn.executemany('INSERT INTO fluxes (run_id, model, objective, reaction, flux) VALUES (?, ?, ?, ?, ?)',
+                              [(self.run_id, model_name, i['objective'], reaction_id, flux) for i in objectives for reaction_id, flux in i['pathway'].items()])
+        self._num_uncommitted += 1
+        if self._num_uncommitted>=self.commit_every:
+            self.commit()
+
+
+    def isComputed(self, model_key, statuses=('success',)):
+        """Return if a model has already been computed with the same GEM and parameters by any run
+
+        :param model_key: The key identifying the model, the GEM and the parameters
+        :param statuses: The statuses of the models considered computed (Default: ('success',))
+
+        :type model_key: str
+        :type statuses: tuple
+
+        :return: If the model has been computed
+        :rtype: bool
+        """
+        query = 'SELECT 1 FROM models WHERE model_key=? AND status IN ('+', '.join('?' for i in statuses)+') LIMIT 1'
+        return self.conn.execute(query, (model_key,)+tuple(statuses)).fetchone() is not None
+
+
+    def commit(self):
+        """Commit the models added since the last commit
+
+        :return: None
+        :rtype: None
+        """
+        self.conn.commit()
+        self._num_uncommitted = 0
+
+
+    def close(self):
+        """Commit and close the database
+
+        :return: None
+        :rtype: None
+        """
+        self.commit()
+        self.conn.close()
+
+
+    ##########################################################
+    ###################### Queries ###########################
+    ##########################################################
+
+
+    def listRuns(self):
+        """Return the runs of the index
+
+        :return: Tuples of the run id, start date, input, output, GEM hash, parameters and number of models
+        :rtype: list
+        """
+        return self.conn.execute('''SELECT runs.run_id, started, input, output, gem_hash, params, COUNT(models.model)
+                                    FROM runs LEFT JOIN models ON runs.run_id=models.run_id
+                                    GROUP BY runs.run_id ORDER BY runs.run_id''').fetchall()
+
+
+    def lastRun(self):
+        """Return the id of the last run
+
+        :return: The id of the run, None if the index is empty
+        :rtype: int
+        """
+        return self.conn.execute('SELECT MAX(run_id) FROM runs').fetchone()[0]
+
+
+    def topPathways(self, reaction_id, objective_id=None, num_pathways=10, run_id=None):
+        """Return the pathways with the highest flux of a reaction (ex: the target reaction)
+
+        :param reaction_id: The id of the reaction
+        :param objective_id: Only the fluxes of this objective. If None, the best flux of each pathway across its objectives (Default: None)
+        :param num_pathways: The number of pathways (Default: 10)
+        :param run_id: The id of the run. If None, the last run (Default: None)
+
+        :type reaction_id: str
+        :type objective_id: str
+        :type num_pathways: int
+        :type run_id: int
+
+        :return: Tuples of the name of the model, the objective and the flux, by decreasing flux
+        :rtype: list
+        """
+        if run_id is None:
+            run_id = self.lastRun()
+        query = 'SELECT model, objective, MAX(flux) AS best FROM fluxes WHERE run_id=? AND reaction=?'
+        args = [run_id, reaction_id]
+        if objective_id is not None:
+            query += ' AND objective=?'
+            args.append(objective_id)
+        query += ' GROUP BY model ORDER BY best DESC LIMIT ?'
+        args.append(num_pathways)
+        return self.conn.execute(query, args).fetchall()
+
+
+    def compareRuns(self, run_a, run_b, objective_id):
+        """Return the values of an objective for the models of two runs
+
+        :param run_a: The id of the first run
+        :param run_b: The id of the second run
+        :param objective_id: The id of the objective
+
+        :type run_a: int
+        :type run_b: int
+        :type objective_id: str
+
+        :return: Tuples of the name of the model and the objective values of both runs (None if the model is not in one of the runs), ordered by model
+        :rtype: list
+        """
+        return self.conn.execute('''SELECT model, MAX(CASE WHEN run_id=? THEN value END), MAX(CASE WHEN run_id=? THEN value END)
+                                    FROM objectives WHERE run_id IN (?, ?) AND objective=?
+                                    GROUP BY model ORDER BY model''', (run_a, run_b, run_a, run_b, objective_id)).fetchall()
+
+
+##
+#
+#
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser('Query the SQLite index of the results of rpFBA')
+    parser.add_argument('command', type=str, choices=['runs', 'top', 'compare'])
+    parser.add_argument('-db', type=str)
+    parser.add_argument('-reaction', type=str, default='RP1_sink')
+    parser.add_argument('-objective_id', type=str, default=None)
+    parser.add_argument('-num_pathways', type=int, default=10)
+    parser.add_argument('-run_id', type=int, default=None)
+    parser.add_argument('-run_b', type=int, default=None)
+    params = parser.parse_args()
+    if not params.db or not os.path.exists(params.db):
+        logging.error('Cannot find the database: '+str(params.db))
+        exit(1)
+    with rpResultsIndex(params.db) as index:
+        if params.command=='runs':
+            for row in index.listRuns():
+                print('\t'.join(str(i) for i in row))
+        elif params.command=='top':
+            for row in index.topPathways(params.reaction, params.objective_id, params.num_pathways, params.run_id):
+                print('\t'.join(str(i) for i in row))
+        elif params.command=='compare':
+            if params.run_id is None or params.run_b is None or params.objective_id is None:
+                logging.error('compare requires -run_id, -run_b and -objective_id')
+                exit(1)
+            for row in index.compareRuns(params.run_id, params.run_b, params.objective_id):
+                print('\t'.join(str(i) for i in row))
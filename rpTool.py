@@ -1,28 +1,43 @@
 import cobra
 from cobra.flux_analysis import pfba
+from cobra.flux_analysis import flux_variability_analysis
 import libsbml
-import tempfile
-import glob
 
 import logging
+import collections
+import math
+
+import rpProfiler
 
 
-#TODO: add the pareto frontier optimisation as an automatic way to calculate the optimal fluxes
 class rpFBA:
     """Class to simulate an rpsbml object using different FBA types and objective functions
     """
-    def __init__(self, rpsbml):
+    def __init__(self, rpsbml, base_model=None, export_fluxes=None, solver_timeout=None, separate_objectives=False):
         """Default constructor
 
         :param rpsbml: The rpSBML object
+        :param base_model: The cobra model of the GEM that rpsbml was merged into. If given, rpsbml is applied to it as a delta instead of being fully converted (Default: None)
+        :param export_fluxes: Keep the results of each objective in flux_results for the batch export (see rpFluxExport): pathway for the fluxes of the heterologous pathway reactions, full for the fluxes of all the reactions, None to disable it (Default: None)
+        :param solver_timeout: Time limit in seconds of each optimisation, after which the solver stops and the results have the status time_limit. None for no limit (Default: None)
+        :param separate_objectives: Use or create the objective with the given objective_id instead of any objective with the same reactions, so that several simulations of the same reactions (ex: fba and pfba) do not overwrite each other's results (Default: False)
 
         :type rpsbml: rpSBML
+        :type base_model: cobra.Model
+        :type export_fluxes: str
+        :type solver_timeout: float
+        :type separate_objectives: bool
         """
         self.logger = logging.getLogger(__name__)
         self.logger.debug('Started instance of rpFBA')
         self.rpsbml = rpsbml
         #TODO enable FBC if not done so
         self.cobraModel = None
+        self.base_model = base_model
+        self.export_fluxes = export_fluxes
+        self.flux_results = [] if export_fluxes else None
+        self.solver_timeout = solver_timeout
+        self.separate_objectives = separate_objectives
         #self._convertToCobra()
 
 
@@ -63,37 +78,301 @@ class rpFBA:
             return None
 
 
+    def _sbmlToCobra(self):
+        """Parse the libSBML document with cobrapy
+
+        cobra.io.sbml._sbml_to_model() is private, it is used as it takes the libSBML document without serialising it (cobrapy is pinned in the Dockerfile, test_rpTool checks both paths with the installed version). If it is missing or its signature has changed, the document is written to a string and parsed by the public cobra.io.read_sbml_model()
+
+        :return: The cobra model
+        :rtype: cobra.Model
+        """
+        try:
+            return cobra.io.sbml._sbml_to_model(self.rpsbml.document)
+        except (AttributeError, TypeError) as e:
+            self.logger.warning('Cannot parse the libSBML document directly, converting it through a string: '+str(e))
+            return cobra.io.read_sbml_model(libsbml.writeSBMLToString(self.rpsbml.document))
+
+
     def _convertToCobra(self):
         """Convert the rpSBML object to cobra object
 
+        The libSBML document held in memory is handed directly to the cobrapy SBML parser (see _sbmlToCobra), avoiding writing the model to disk and parsing the XML a second time. If a base model has been passed to the constructor, only the delta is applied to it (see _applyToBaseModel). The model is only converted once: the following simulations reuse it and only update its objective
+
         :return: Success or failure of the function
         :rtype: bool
         """
+        if self.cobraModel is not None:
+            #already converted by a previous simulation, only the active objective may have changed
+            fbc_plugin = self.rpsbml.model.getPlugin('fbc')
+            try:
+                self._setCobraObjective(self.cobraModel, fbc_plugin.getActiveObjectiveId())
+            except (AttributeError, KeyError) as e:
+                self.logger.error('Cannot set the objective of the Cobra model: '+str(e))
+                return False
+            return True
+        if self.base_model is not None:
+            with rpProfiler.stage('convert'):
+                if not self._applyToBaseModel():
+                    return False
+        else:
+            try:
+                with rpProfiler.stage('convert'):
+                    self.cobraModel = self._sbmlToCobra()
+                #use CPLEX
+                # self.cobraModel.solver = 'cplex'
+            #the errors of an invalid model raised by the cobrapy parser
+            except (cobra.io.sbml.CobraSBMLError, ValueError, KeyError) as e:
+                self.logger.error(e)
+                self.logger.error('Cannot convert the libSBML model to Cobra')
+                return False
+        if self.solver_timeout:
+            #passed by optlang to the solver, that stops with the status time_limit
+            self.cobraModel.solver.configuration.timeout = self.solver_timeout
+        return True
+
+
+    def _setCobraObjective(self, model, objective_id):
+        """Set the objective of a cobra model to one of the FBC objectives of the rpSBML model
+
+        :param model: The cobra model
+        :param objective_id: The id of the FBC objective
+
+        :type model: cobra.Model
+        :type objective_id: str
+
+        :raises AttributeError: If the objective cannot be found
+        :raises KeyError: If a reaction of the objective is not in the cobra model
+
+        :return: None
+        :rtype: None
+        """
+        f_reaction = cobra.io.sbml.F_REPLACE[cobra.io.sbml.F_REACTION]
+        fbc_plugin = self.rpsbml.model.getPlugin('fbc')
+        self._checklibSBML(fbc_plugin, 'Getting FBC package')
+        obj = fbc_plugin.getObjective(objective_id)
+        self._checklibSBML(obj, 'Getting objective '+str(objective_id))
+        model.objective = {model.reactions.get_by_id(f_reaction(i.getReaction())): i.getCoefficient() for i in obj.getListOfFluxObjectives()}
+        model.objective_direction = obj.getType()
+
+
+    def _findCreateObjective(self, reactions, coefficients, is_max=True, objective_id=None, is_separate=None):
+        """Return the id of the FBC objective for the reactions, creating it if needed
+
+        rpSBML.findCreateObjective() returns any objective with the same reactions whatever its id, and only names the objective objective_id if it creates it. If is_separate, the objective with that id is used or created instead, so that the results of different simulations of the same reactions (ex: fba and pfba) do not overwrite each other
+
+        :param reactions: The ids of the reactions of the objective
+        :param coefficients: The coefficients of the reactions
+        :param is_max: Maximise or minimise the objective (Default: True)
+        :param objective_id: The id of the objective (Default: None)
+        :param is_separate: Use or create the objective with objective_id. If None, use separate_objectives (Default: None)
+
+        :type reactions: list
+        :type coefficients: list
+        :type is_max: bool
+        :type objective_id: str
+        :type is_separate: bool
+
+        :return: The id of the objective
+        :rtype: str
+        """
+        if is_separate is None:
+            is_separate = self.separate_objectives
+        if not objective_id or not is_separate:
+            return self.rpsbml.findCreateObjective(reactions, coefficients, is_max, objective_id)
+        fbc_plugin = self.rpsbml.model.getPlugin('fbc')
+        self._checklibSBML(fbc_plugin, 'Getting FBC package')
+        if fbc_plugin.getObjective(objective_id) is None:
+            self.rpsbml.createMultiFluxObj(objective_id, reactions, coefficients, is_max)
+        return objective_id
+
+
+    def _runSourceFBA(self, source_reaction, source_coefficient, is_max=True, pathway_id='rp_pathway'):
+        """Return the optimum of the source reaction, reading it from the annotation of its objective if it has already been calculated
+
+        :param source_reaction: The id of the source reaction
+        :param source_coefficient: The source coefficient associated with the source reaction id
+        :param is_max: Maximise or minimise the objective (Default: True)
+        :param pathway_id: The id of the heterologous pathway (Default: rp_pathway)
+
+        :type source_reaction: str
+        :type source_coefficient: float
+        :type is_max: bool
+        :type pathway_id: str
+
+        :return: The optimum of the source reaction, NaN if the problem is infeasible or unbounded, None if the model cannot be converted
+        :rtype: float
+        """
+        #retreive the biomass objective and flux results and set as maxima
+        fbc_plugin = self.rpsbml.model.getPlugin('fbc')
+        self._checklibSBML(fbc_plugin, 'Getting FBC package')
+        self.logger.debug('findCreateObjective: '+str(source_reaction))
+        source_obj_id = self.rpsbml.findCreateObjective([source_reaction], [source_coefficient], is_max)
+        #TODO: use the rpSBML BRSynth annotation parser
+        source_flux = None
         try:
-            with tempfile.TemporaryDirectory() as tmpOutputFolder:
-                self.rpsbml.writeSBML(tmpOutputFolder)
-                #logging.info(glob.glob(tmpOutputFolder+'/*'))
-                #logging.info(cobra.io.validate_sbml_model(glob.glob(tmpOutputFolder+'/*')[0]))
-                self.cobraModel = cobra.io.read_sbml_model(glob.glob(tmpOutputFolder+'/*')[0], use_fbc_package=True)
-            #self.cobraModel = cobra.io.read_sbml_model(self.rpsbml.document.toXMLNode().toXMLString(), use_fbc_package=True)
-            #use CPLEX
-            # self.cobraModel.solver = 'cplex'
-        except cobra.io.sbml.CobraSBMLError as e:
+            fbc_obj = fbc_plugin.getObjective(source_obj_id)
+            #TODO: if this is None need to set it up 
+            fbc_obj_annot = fbc_obj.getAnnotation()
+            if not fbc_obj_annot:
+                raise ValueError
+            source_flux = float(fbc_obj_annot.getChild('RDF').getChild('BRSynth').getChild('brsynth').getChild(0).getAttrValue('value'))
+            self.logger.debug('Already calculated flux for '+str(source_obj_id))
+        except (AttributeError, ValueError) as e:
+            self.logger.debug('Performing FBA to calculate the source reaction')
+            ### FBA ###
+            #self.runFBA(source_reaction, source_coefficient, is_max, pathway_id)
+            self._checklibSBML(fbc_plugin.setActiveObjectiveId(source_obj_id),
+                    'Setting active objective '+str(source_obj_id))
+            if not self._convertToCobra():
+                self.logger.error('Converting libSBML to CobraPy returned False')
+                self.writeAnalysisResults(source_obj_id, 0.0, pathway_id)
+                return None
+            with rpProfiler.solve(source_obj_id, self.cobraModel):
+                cobra_results = self.cobraModel.optimize()
+            self.writeAnalysisResults(source_obj_id, cobra_results, pathway_id)
+            source_flux = cobra_results.objective_value
+            if cobra_results.status!='optimal':
+                #as cobrapy 0.16, recent versions return the last value of the solver
+                source_flux = float('nan')
+        self.logger.debug('FBA source flux ('+str(source_reaction)+') is: '+str(source_flux))
+        return source_flux
+
+
+    def _applyToBaseModel(self):
+        """Apply the rpSBML model to the shared base cobra model as a delta
+
+        The species and reactions that are not in the base model (i.e. the ones added by merging the heterologous pathway) are created, the flux bounds of the other reactions are synchronised with the rpSBML model and its active objective is set. The changes are made in place and are only reverted if the base model is used as a context by the caller, ex: with base_model: rpFBA(rpsbml, base_model).runFBA(...)
+
+        :return: Success or failure of the function
+        :rtype: bool
+        """
+        model = self.base_model
+        f_specie = cobra.io.sbml.F_REPLACE[cobra.io.sbml.F_SPECIE]
+        f_reaction = cobra.io.sbml.F_REPLACE[cobra.io.sbml.F_REACTION]
+        try:
+            parameters = {i.getId(): i.getValue() for i in self.rpsbml.model.getListOfParameters()}
+            ###### species ######
+            new_metabolites = []
+            boundary_metabolites = []
+            for species in self.rpsbml.model.getListOfSpecies():
+                met_id = f_specie(species.getId())
+                if met_id in model.metabolites:
+                    continue
+                met = cobra.Metabolite(met_id, name=species.getName(), compartment=species.getCompartment())
+                species_fbc = species.getPlugin('fbc')
+                if species_fbc:
+                    met.charge = species_fbc.getCharge()
+                    met.formula = species_fbc.getChemicalFormula()
+                if species.getBoundaryCondition():
+                    boundary_metabolites.append(met)
+                new_metabolites.append(met)
+            model.add_metabolites(new_metabolites)
+            ###### reactions ######
+            new_reactions = []
+            for met in boundary_metabolites:
+                ex_reaction = cobra.Reaction('EX_'+str(met.id), lower_bound=cobra.Configuration().lower_bound)
+                ex_reaction.add_metabolites({met: -1})
+                new_reactions.append(ex_reaction)
+            for reaction in self.rpsbml.model.getListOfReactions():
+                reac_id = f_reaction(reaction.getId())
+                reaction_fbc = reaction.getPlugin('fbc')
+                lower_bound = parameters.get(reaction_fbc.getLowerFluxBound(), cobra.Configuration().lower_bound)
+                upper_bound = parameters.get(reaction_fbc.getUpperFluxBound(), cobra.Configuration().upper_bound)
+                if reac_id in model.reactions:
+                    cobra_reaction = model.reactions.get_by_id(reac_id)
+                    if not cobra_reaction.bounds==(lower_bound, upper_bound):
+                        cobra_reaction.bounds = (lower_bound, upper_bound)
+                    continue
+                cobra_reaction = cobra.Reaction(reac_id, name=reaction.getName(), lower_bound=lower_bound, upper_bound=upper_bound)
+                stoichiometry = {}
+                for reactant in reaction.getListOfReactants():
+                    met_id = f_specie(reactant.getSpecies())
+                    stoichiometry[met_id] = stoichiometry.get(met_id, 0.0)-reactant.getStoichiometry()
+                for product in reaction.getListOfProducts():
+                    met_id = f_specie(product.getSpecies())
+                    stoichiometry[met_id] = stoichiometry.get(met_id, 0.0)+product.getStoichiometry()
+                cobra_reaction.add_metabolites({model.metabolites.get_by_id(i): stoichiometry[i] for i in stoichiometry})
+                new_reactions.append(cobra_reaction)
+            model.add_reactions(new_reactions)
+            ###### objective ######
+            fbc_plugin = self.rpsbml.model.getPlugin('fbc')
+            self._checklibSBML(fbc_plugin, 'Getting FBC package')
+            self._setCobraObjective(model, fbc_plugin.getActiveObjectiveId())
+        except (AttributeError, KeyError, ValueError) as e:
             self.logger.error(e)
-            self.logger.error('Cannot convert the libSBML model to Cobra')
+            self.logger.error('Cannot apply the libSBML model to the base Cobra model')
             return False
+        self.cobraModel = model
         return True
 
 
+    def _getBRSynth(self, sbase_obj):
+        """Return the brsynth node of the annotation of an SBML object
+
+        :param sbase_obj: The SBML object
+
+        :type sbase_obj: libsbml.SBase
+
+        :return: The brsynth node, None if the object does not have one
+        :rtype: libsbml.XMLNode
+        """
+        annot = sbase_obj.getAnnotation()
+        if annot is None:
+            return None
+        #getChild() returns an empty node when the child does not exist
+        brsynth = annot.getChild('RDF').getChild('BRSynth').getChild('brsynth')
+        if brsynth.getName()!='brsynth':
+            return None
+        return brsynth
+
+
+    def _writeBRSynth(self, annotations, units='mmol_per_gDW_per_hr'):
+        """Add or update the BRSynth annotations of several SBML objects in one pass
+
+        Equivalent to calling rpSBML.addUpdateBRSynth() for each value, but the annotation nodes are built directly instead of being parsed from an XML string, and the existing annotations of each object are indexed once. The objects without a BRSynth annotation are handed to rpSBML.addUpdateBRSynth(), which creates it
+
+        :param annotations: List of tuples with an SBML object and the list of its (name, value) annotations
+        :param units: The units of the values (Default: mmol_per_gDW_per_hr)
+
+        :type annotations: list
+        :type units: str
+
+        :return: None
+        :rtype: None
+        """
+        for sbase_obj, values in annotations:
+            brsynth = self._getBRSynth(sbase_obj)
+            if brsynth is None:
+                for name, value in values:
+                    self.rpsbml.addUpdateBRSynth(sbase_obj, name, value, units, False)
+                continue
+            children = {brsynth.getChild(i).getName(): i for i in range(brsynth.getNumChildren())}
+            for name, value in values:
+                attributes = libsbml.XMLAttributes()
+                attributes.add('units', units)
+                attributes.add('value', value)
+                node = libsbml.XMLNode(libsbml.XMLTriple(name, 'http://brsynth.eu', 'brsynth'), attributes)
+                index = children.pop(name, None)
+                if index is not None:
+                    #as rpSBML.addUpdateBRSynth(), an existing annotation is removed and the new one appended at the end
+                    brsynth.removeChild(index)
+                    children = {i: (children[i]-1 if children[i]>index else children[i]) for i in children}
+                children[name] = brsynth.getNumChildren()
+                self._checklibSBML(brsynth.addChild(node), 'Adding the annotation '+str(name))
+
+
     ##########################################################
     ################# Helper functions #######################
     ##########################################################
 
 
     #TODO: move this to rpSBML
+    @rpProfiler.staged('write_annotations')
     def writeAnalysisResults(self, objective_id, cobra_results, pathway_id='rp_pathway'):
         """Method to harcode into BRSynth annotations the results of a COBRA analysis
 
+        The fluxes of the objective and pathway reactions are looked up at once in the cobrapy results and all the annotations are written in a single pass
+
         :param objective_id: The id of the objective to optimise
         :param cobra_results: The cobrapy results object 
         :param pathway_id: The id of the heterologous pathway group (Default: rp_pathway)
@@ -105,7 +384,9 @@ class rpFBA:
         :return: None
         :rtype: None
         """
-        self.logger.debug('----- Setting the results for '+str(objective_id)+ ' -----')
+        is_debug = self.logger.isEnabledFor(logging.DEBUG)
+        if is_debug:
+            self.logger.debug('----- Setting the results for '+str(objective_id)+ ' -----')
         groups = self.rpsbml.model.getPlugin('groups')
         self._checklibSBML(groups, 'Getting groups plugin')
         rp_pathway = groups.getGroup(pathway_id)
@@ -114,34 +395,68 @@ class rpFBA:
             self.rpsbml.createPathway(pathway_id)
             rp_pathway = groups.getGroup(pathway_id)
         self._checklibSBML(rp_pathway, 'Getting RP pathway')
-        #write the results to the rp_pathway
-        self.logger.debug('Set '+str(pathway_id)+' with '+str('fba_'+str(objective_id))+' to '+str(cobra_results.objective_value))
-        self.rpsbml.addUpdateBRSynth(rp_pathway, 'fba_'+str(objective_id), str(cobra_results.objective_value), 'mmol_per_gDW_per_hr', False)
         #get the objective
         fbc_plugin = self.rpsbml.model.getPlugin('fbc')
         self._checklibSBML(fbc_plugin, 'Getting FBC plugin')
         obj = fbc_plugin.getObjective(objective_id)
         self._checklibSBML(obj, 'Getting objective '+str(objective_id))
-        self.rpsbml.addUpdateBRSynth(obj, 'flux_value', str(cobra_results.objective_value), 'mmol_per_gDW_per_hr', False)
-        self.logger.debug('Set the objective '+str(objective_id)+' a flux_value of '+str(cobra_results.objective_value))
-        for flux_obj in obj.getListOfFluxObjectives():
-            #sometimes flux cannot be returned
-            if cobra_results.fluxes.get(flux_obj.getReaction())==None:
-                self.logger.warning('Cobra BUG: Cannot retreive '+str(flux_obj.getReaction())+' flux from cobrapy... setting to 0.0')
-                self.rpsbml.addUpdateBRSynth(flux_obj, 'flux_value', str(0.0), 'mmol_per_gDW_per_hr', False)
-                self.logger.debug('Set the reaction '+str(flux_obj.getReaction())+' a flux_value of '+str(0.0))
-            else:
-                self.rpsbml.addUpdateBRSynth(flux_obj, 'flux_value', str(cobra_results.fluxes.get(flux_obj.getReaction())), 'mmol_per_gDW_per_hr', False)
-                self.logger.debug('Set the reaction '+str(flux_obj.getReaction())+' a flux_value of '+str(cobra_results.fluxes.get(flux_obj.getReaction())))
-        #write all the results to the reactions of pathway_id
+        flux_objs = list(obj.getListOfFluxObjectives())
+        reactions = []
         for member in rp_pathway.getListOfMembers():
             reac = self.rpsbml.model.getReaction(member.getIdRef())
             if reac==None:
                 self.logger.error('Cannot retreive the following reaction: '+str(member.getIdRef()))
-                #return False
                 continue
-            self.logger.debug('Set the reaction '+str(member.getIdRef())+' a '+str('fba_'+str(objective_id))+' of '+str(cobra_results.fluxes.get(reac.getId())))
-            self.rpsbml.addUpdateBRSynth(reac, 'fba_'+str(objective_id), str(cobra_results.fluxes.get(reac.getId())), 'mmol_per_gDW_per_hr', False)
+            reactions.append(reac)
+        #single lookup of all the fluxes, None for the reactions that cobrapy does not return
+        reaction_ids = [i.getReaction() for i in flux_objs]+[i.getId() for i in reactions]
+        positions = cobra_results.fluxes.index.get_indexer(reaction_ids)
+        flux_values = cobra_results.fluxes.values
+        fluxes = {i: (flux_values[p].item() if p>=0 else None) for i, p in zip(reaction_ids, positions)}
+        if cobra_results.status=='time_limit':
+            self.logger.warning('The optimisation of '+str(objective_id)+' has reached the time limit of the solver ('+str(self.solver_timeout)+' s)')
+        objective_value = str(cobra_results.objective_value)
+        #the results of the objective are written to the rp_pathway and the objective
+        annotations = [(rp_pathway, [('fba_'+str(objective_id), objective_value)]),
+                       (obj, [('flux_value', objective_value)])]
+        for flux_obj in flux_objs:
+            flux = fluxes[flux_obj.getReaction()]
+            #sometimes flux cannot be returned
+            if flux is None:
+                self.logger.warning('Cobra BUG: Cannot retreive '+str(flux_obj.getReaction())+' flux from cobrapy... setting to 0.0')
+                flux = 0.0
+            annotations.append((flux_obj, [('flux_value', str(flux))]))
+        #write all the results to the reactions of pathway_id
+        for reac in reactions:
+            annotations.append((reac, [('fba_'+str(objective_id), str(fluxes[reac.getId()]))]))
+        if is_debug:
+            self.logger.debug('Set the objective '+str(objective_id)+' a flux_value of '+objective_value+' and the reactions '+str(fluxes))
+        self._writeBRSynth(annotations)
+        if self.flux_results is not None:
+            self._recordResults(objective_id, cobra_results, fluxes)
+
+
+    def _recordResults(self, objective_id, cobra_results, fluxes):
+        """Keep the results of an objective for the batch export of the fluxes and the results index
+
+        :param objective_id: The id of the objective
+        :param cobra_results: The cobrapy results object
+        :param fluxes: The fluxes of the reactions of the objective and of the heterologous pathway
+
+        :type objective_id: str
+        :type cobra_results: cobra.Solution
+        :type fluxes: dict
+
+        :return: None
+        :rtype: None
+        """
+        result = {'objective': objective_id,
+                  'value': cobra_results.objective_value,
+                  'status': cobra_results.status,
+                  'pathway': fluxes}
+        if self.export_fluxes=='full':
+            result['fluxes'] = cobra_results.fluxes.to_dict()
+        self.flux_results.append(result)
 
 
     ##################################################################
@@ -179,7 +494,8 @@ class rpFBA:
                 'Setting active objective '+str(objective_id))
         if not self._convertToCobra():
             return False
-        cobra_results = self.cobraModel.optimize()
+        with rpProfiler.solve(objective_id, self.cobraModel):
+            cobra_results = self.cobraModel.optimize()
         self.writeAnalysisResults(objective_id, cobra_results, pathway_id)
         return True
 
@@ -204,13 +520,14 @@ class rpFBA:
         """
         fbc_plugin = self.rpsbml.model.getPlugin('fbc')
         self._checklibSBML(fbc_plugin, 'Getting FBC package')
-        objective_id = self.rpsbml.findCreateObjective([reaction_id], [coefficient], is_max, objective_id)
+        objective_id = self._findCreateObjective([reaction_id], [coefficient], is_max, objective_id)
         #run the FBA
         self._checklibSBML(fbc_plugin.setActiveObjectiveId(objective_id),
                 'Setting active objective '+str(objective_id))
         if not self._convertToCobra():
             return 0.0, False
-        cobra_results = self.cobraModel.optimize()
+        with rpProfiler.solve(objective_id, self.cobraModel):
+            cobra_results = self.cobraModel.optimize()
         self.writeAnalysisResults(objective_id, cobra_results, pathway_id)
         return cobra_results.objective_value, True
 
@@ -237,13 +554,14 @@ class rpFBA:
         """
         fbc_plugin = self.rpsbml.model.getPlugin('fbc')
         self._checklibSBML(fbc_plugin, 'Getting FBC package')
-        objective_id = self.rpsbml.findCreateObjective([reaction_id], [coefficient], is_max, objective_id)
+        objective_id = self._findCreateObjective([reaction_id], [coefficient], is_max, objective_id)
         #run the FBA
         self._checklibSBML(fbc_plugin.setActiveObjectiveId(objective_id),
                 'Setting active objective '+str(objective_id))
         if not self._convertToCobra():
             return 0.0, False
-        cobra_results = pfba(self.cobraModel, fraction_of_optimum)
+        with rpProfiler.solve(objective_id, self.cobraModel):
+            cobra_results = pfba(self.cobraModel, fraction_of_optimum)
         self.writeAnalysisResults(objective_id, cobra_results, pathway_id)
         return cobra_results.objective_value, True
 
@@ -280,51 +598,16 @@ class rpFBA:
         :return: Tuple with the results of the FBA and boolean indicating the success or failure of the function
         :rtype: tuple
         """
-        #retreive the biomass objective and flux results and set as maxima
+        source_flux = self._runSourceFBA(source_reaction, source_coefficient, is_max, pathway_id)
+        if source_flux is None:
+            return 0.0, False
         fbc_plugin = self.rpsbml.model.getPlugin('fbc')
-        self._checklibSBML(fbc_plugin, 'Getting FBC package')
-        self.logger.debug('findCreateObjective: '+str(source_reaction))
-        source_obj_id = self.rpsbml.findCreateObjective([source_reaction], [source_coefficient], is_max)
-        #TODO: use the rpSBML BRSynth annotation parser
-        source_flux = None
-        try:
-            fbc_obj = fbc_plugin.getObjective(source_obj_id)
-            #TODO: if this is None need to set it up 
-            fbc_obj_annot = fbc_obj.getAnnotation()
-            if not fbc_obj_annot:
-                raise ValueError
-            source_flux = float(fbc_obj_annot.getChild('RDF').getChild('BRSynth').getChild('brsynth').getChild(0).getAttrValue('value'))
-            self.logger.debug('Already calculated flux for '+str(source_obj_id))
-        except (AttributeError, ValueError) as e:
-            self.logger.debug('Performing FBA to calculate the source reaction')
-            ### FBA ###
-            #self.runFBA(source_reaction, source_coefficient, is_max, pathway_id)
-            self._checklibSBML(fbc_plugin.setActiveObjectiveId(source_obj_id),
-                    'Setting active objective '+str(source_obj_id))
-            if not self._convertToCobra():
-                self.logger.error('Converting libSBML to CobraPy returned False')
-                self.writeAnalysisResults(source_obj_id, 0.0, pathway_id)
-                return 0.0, False
-            cobra_results = self.cobraModel.optimize()
-            self.writeAnalysisResults(source_obj_id, cobra_results, pathway_id)
-            # cobra_results.objective_value
-            fbc_obj = fbc_plugin.getObjective(source_obj_id)
-            fbc_obj_annot = fbc_obj.getAnnotation()
-            if fbc_obj_annot==None:
-                self.logger.error('No annotation available for: '+str(source_obj_id))
-            source_flux = float(fbc_obj_annot.getChild('RDF').getChild('BRSynth').getChild('brsynth').getChild(0).getAttrValue('value'))
         #TODO: add another to check if the objective id exists
-        self.logger.debug('FBA source flux ('+str(source_reaction)+') is: '+str(source_flux))
         if not objective_id:
             objective_id = 'obj_'+str(target_reaction)+'__restricted_'+str(source_reaction)
         #self.logger.debug('findCreateObjective() for '+str(objective_id))
-        objective_id = self.rpsbml.findCreateObjective([target_reaction], [target_coefficient], is_max, objective_id)
+        objective_id = self._findCreateObjective([target_reaction], [target_coefficient], is_max, objective_id)
         self.logger.debug('Optimising the objective: '+str(objective_id))
-        self.logger.debug('Setting upper bound: '+str(source_flux*fraction_of_source))
-        self.logger.debug('Setting loer bound: '+str(source_flux*fraction_of_source))
-        old_upper_bound, old_lower_bound = self.rpsbml.setReactionConstraints(source_reaction,
-                                                                              source_flux*fraction_of_source,
-                                                                              source_flux*fraction_of_source)
         self._checklibSBML(fbc_plugin.setActiveObjectiveId(objective_id),
                 'Setting active objective '+str(objective_id))
         if not self._convertToCobra():
@@ -332,19 +615,278 @@ class rpFBA:
             #although this may not be the greatest idea, set flux to 0.0 when cobrapy error
             self.writeAnalysisResults(objective_id, 0.0, pathway_id)
             return 0.0, False
-        cobra_results = self.cobraModel.optimize()
+        #Only the objective and the source bounds are changed on the same solver instance, so that the second
+        #optimisation starts from the basis of the first one. The context resets them once optimised
+        with self.cobraModel:
+            try:
+                source_cobra_reaction = self.cobraModel.reactions.get_by_id(cobra.io.sbml.F_REPLACE[cobra.io.sbml.F_REACTION](source_reaction))
+                self.logger.debug('Setting upper and lower bounds: '+str(source_flux*fraction_of_source))
+                source_cobra_reaction.bounds = (source_flux*fraction_of_source, source_flux*fraction_of_source)
+                self._setCobraObjective(self.cobraModel, objective_id)
+            except KeyError as e:
+                self.logger.error('Cannot find the reaction '+str(e)+' in the Cobra model')
+                return 0.0, False
+            with rpProfiler.solve(objective_id, self.cobraModel):
+                cobra_results = self.cobraModel.optimize()
         self.writeAnalysisResults(objective_id, cobra_results, pathway_id)
         ##### print the biomass results ######
         #self.logger.debug('Biomass: '+str(cobra_results.fluxes.biomass))
         #self.logger.debug('Target: '+str(cobra_results.fluxes.RP1_sink))
-        #reset the bounds to the original values for the target
-        old_upper_bound, old_lower_bound = self.rpsbml.setReactionConstraints(source_reaction,
-                                                                              old_upper_bound,
-                                                                              old_lower_bound)
         self.logger.debug('The objective '+str(objective_id)+' results '+str(cobra_results.objective_value))
         return cobra_results.objective_value, True
 
 
+    def runFractionSweep(self,
+                         source_reaction,
+                         source_coefficient,
+                         target_reaction,
+                         target_coefficient,
+                         fractions_of_source,
+                         is_max=True,
+                         pathway_id='rp_pathway',
+                         objective_id=None):
+        """Optimise for a target reaction while fixing a source reaction to each of a list of fractions of its optimum
+
+        The source optimum is calculated once and the target is re-optimised for each fraction on the same solver instance, so that each optimisation starts from the basis of the previous one. The results of each fraction are written as for runFractionReaction() under the objective <objective_id>__<fraction> (ex: obj_RP1_sink__restricted_biomass__0_5) and the whole curve is written to the heterologous pathway as fba_<objective_id>__sweep, with the value fraction:flux pairs separated by semicolons (ex: 0.1:8.3;0.5:4.6)
+
+        :param source_reaction: The id of the source reaction
+        :param source_coefficient: The source coefficient associated with the source reaction id
+        :param target_reaction: The id of the target reaction
+        :param target_coefficient: The source coefficient associated with the target reaction id
+        :param fractions_of_source: The fractions of the source optimum, between 0.0 and 1.0
+        :param is_max: Maximise or minimise the objective (Default: True)
+        :param pathway_id: The id of the heterologous pathway (Default: rp_pathway)
+        :param objective_id: Overwrite the default id (Default: None)
+
+        :type source_reaction: str
+        :type source_coefficient: float
+        :type target_reaction: str
+        :type target_coefficient: float
+        :type fractions_of_source: list
+        :type is_max: bool
+        :type pathway_id: str
+        :type objective_id: str
+
+        :return: Tuple with the list of (fraction, objective value) tuples and boolean indicating the success or failure of the function
+        :rtype: tuple
+        """
+        source_flux = self._runSourceFBA(source_reaction, source_coefficient, is_max, pathway_id)
+        if source_flux is None:
+            return [], False
+        fbc_plugin = self.rpsbml.model.getPlugin('fbc')
+        if not objective_id:
+            objective_id = 'obj_'+str(target_reaction)+'__restricted_'+str(source_reaction)
+        #the objectives of all the fractions are created first, so that the cobra model is not converted again between the optimisations
+        fraction_objective_ids = []
+        for fraction in fractions_of_source:
+            fraction_objective_id = objective_id+'__'+('%g' % fraction).replace('.', '_').replace('-', 'm')
+            fraction_objective_ids.append(self._findCreateObjective([target_reaction], [target_coefficient], is_max, fraction_objective_id, True))
+        if not fraction_objective_ids:
+            return [], True
+        self._checklibSBML(fbc_plugin.setActiveObjectiveId(fraction_objective_ids[0]),
+                'Setting active objective '+str(fraction_objective_ids[0]))
+        if not self._convertToCobra():
+            self.logger.error('Converting libSBML to CobraPy returned False')
+            return [], False
+        curve = []
+        #all the fractions optimise the same objective, only the source bounds change between the warm started optimisations
+        with self.cobraModel:
+            try:
+                source_cobra_reaction = self.cobraModel.reactions.get_by_id(cobra.io.sbml.F_REPLACE[cobra.io.sbml.F_REACTION](source_reaction))
+            except KeyError as e:
+                self.logger.error('Cannot find the reaction '+str(e)+' in the Cobra model')
+                return [], False
+            for fraction, fraction_objective_id in zip(fractions_of_source, fraction_objective_ids):
+                self.logger.debug('Setting upper and lower bounds: '+str(source_flux*fraction))
+                source_cobra_reaction.bounds = (source_flux*fraction, source_flux*fraction)
+                with rpProfiler.solve(fraction_objective_id, self.cobraModel):
+                    cobra_results = self.cobraModel.optimize()
+                self.writeAnalysisResults(fraction_objective_id, cobra_results, pathway_id)
+                self.logger.debug('The objective '+str(fraction_objective_id)+' results '+str(cobra_results.objective_value))
+                curve.append((fraction, cobra_results.objective_value))
+        groups = self.rpsbml.model.getPlugin('groups')
+        rp_pathway = groups.getGroup(pathway_id)
+        self.rpsbml.addUpdateBRSynth(rp_pathway,
+                                     'fba_'+str(objective_id)+'__sweep',
+                                     ';'.join(str(i[0])+':'+str(i[1]) for i in curve),
+                                     'mmol_per_gDW_per_hr',
+                                     False)
+        return curve, True
+
+
+    def runProductionEnvelope(self,
+                              source_reaction,
+                              source_coefficient,
+                              target_reaction,
+                              target_coefficient,
+                              is_max=True,
+                              pathway_id='rp_pathway',
+                              objective_id=None,
+                              num_points=20,
+                              tolerance=0.01):
+        """Calculate the production envelope (Pareto frontier) of a target reaction against a source reaction
+
+        The source reaction is fixed to values between its minimum and its optimum and the target reaction is minimised and maximised for each of them. The points are chosen adaptively: after an initial regular grid, the intervals where the edges of the envelope are not linear are bisected until num_points are calculated. All the optimisations are made on the same solver instance. The envelope is written to the heterologous pathway as fba_<objective_id>, with the value source:target_min:target_max triplets separated by semicolons (ex: 0.0:0.0:12.1;0.4:0.0:6.3)
+
+        :param source_reaction: The id of the source reaction
+        :param source_coefficient: The source coefficient associated with the source reaction id
+        :param target_reaction: The id of the target reaction
+        :param target_coefficient: The source coefficient associated with the target reaction id
+        :param is_max: Maximise or minimise the source reaction (Default: True)
+        :param pathway_id: The id of the heterologous pathway (Default: rp_pathway)
+        :param objective_id: Overwrite the default id (Default: None)
+        :param num_points: The maximal number of points of the envelope (Default: 20)
+        :param tolerance: Error of the linear interpolation, relative to the largest target flux, below which an interval is not bisected (Default: 0.01)
+
+        :type source_reaction: str
+        :type source_coefficient: float
+        :type target_reaction: str
+        :type target_coefficient: float
+        :type is_max: bool
+        :type pathway_id: str
+        :type objective_id: str
+        :type num_points: int
+        :type tolerance: float
+
+        :return: Tuple with the list of (source, target minimum, target maximum) tuples, sorted by source, and boolean indicating the success or failure of the function
+        :rtype: tuple
+        """
+        source_flux = self._runSourceFBA(source_reaction, source_coefficient, is_max, pathway_id)
+        if source_flux is None:
+            return [], False
+        if math.isnan(source_flux) or math.isinf(source_flux):
+            #cobrapy returns NaN for an infeasible or unbounded problem
+            self.logger.error('The source reaction '+str(source_reaction)+' has no optimum ('+str(source_flux)+'), the model is infeasible or unbounded')
+            return [], False
+        if not objective_id:
+            objective_id = 'obj_'+str(target_reaction)+'__envelope_'+str(source_reaction)
+        #the source flux may have been read from the annotations, make sure that the model is converted
+        fbc_plugin = self.rpsbml.model.getPlugin('fbc')
+        self._checklibSBML(fbc_plugin.setActiveObjectiveId(self.rpsbml.findCreateObjective([source_reaction], [source_coefficient], is_max)),
+                'Setting active objective of '+str(source_reaction))
+        if not self._convertToCobra():
+            self.logger.error('Converting libSBML to CobraPy returned False')
+            return [], False
+        f_reaction = cobra.io.sbml.F_REPLACE[cobra.io.sbml.F_REACTION]
+        points = {}
+        with self.cobraModel:
+            try:
+                source_cobra_reaction = self.cobraModel.reactions.get_by_id(f_reaction(source_reaction))
+                target_cobra_reaction = self.cobraModel.reactions.get_by_id(f_reaction(target_reaction))
+            except KeyError as e:
+                self.logger.error('Cannot find the reaction '+str(e)+' in the Cobra model')
+                return [], False
+            #other end of the range of the source reaction
+            self.cobraModel.objective = {source_cobra_reaction: source_coefficient}
+            self.cobraModel.objective_direction = 'min' if is_max else 'max'
+            source_other = self.cobraModel.slim_optimize(error_value=None)
+            if source_other is None:
+                self.logger.warning('Cannot calculate the range of '+str(source_reaction)+', using 0.0')
+                source_other = 0.0
+            self.cobraModel.objective = {target_cobra_reaction: target_coefficient}
+            def _evaluate(source_value):
+                source_cobra_reaction.bounds = (source_value, source_value)
+                self.cobraModel.objective_direction = 'min'
+                target_min = self.cobraModel.slim_optimize(error_value=None)
+                self.cobraModel.objective_direction = 'max'
+                target_max = self.cobraModel.slim_optimize(error_value=None)
+                points[source_value] = (target_min, target_max)
+            ##### initial regular grid #####
+            num_init = max(2, min(num_points, 5))
+            grid = [source_other+(source_flux-source_other)*i/(num_init-1) for i in range(num_init)]
+            for source_value in grid:
+                _evaluate(source_value)
+            ##### bisect the intervals where the envelope is not linear #####
+            intervals = collections.deque(zip(grid[:-1], grid[1:]))
+            while intervals and len(points)<num_points:
+                start, stop = intervals.popleft()
+                middle = (start+stop)/2.0
+                _evaluate(middle)
+                error = 0.0
+                for edge in range(2):
+                    values = [points[start][edge], points[middle][edge], points[stop][edge]]
+                    if all(i is None for i in values):
+                        continue
+                    if any(i is None for i in values):
+                        #the interval contains a limit of the feasible region
+                        error = float('inf')
+                        break
+                    error = max(error, abs(values[1]-(values[0]+values[2])/2.0))
+                scale = max([abs(j) for i in points.values() for j in i if j is not None]+[1e-9])
+                if error>tolerance*scale:
+                    intervals.extend([(start, middle), (middle, stop)])
+        envelope = sorted((i, points[i][0], points[i][1]) for i in points)
+        groups = self.rpsbml.model.getPlugin('groups')
+        rp_pathway = groups.getGroup(pathway_id)
+        self.rpsbml.addUpdateBRSynth(rp_pathway,
+                                     'fba_'+str(objective_id),
+                                     ';'.join(':'.join(str(j) for j in i) for i in envelope),
+                                     'mmol_per_gDW_per_hr',
+                                     False)
+        return envelope, True
+
+
+    def runPathwayFVA(self, reaction_id, coefficient=1.0, fraction_of_optimum=0.95, is_max=True, pathway_id='rp_pathway', objective_id=None):
+        """Run flux variability analysis restricted to the reactions of the heterologous pathway and the target reaction
+
+        Only the minimum and maximum fluxes of these few reactions are calculated, with the objective constrained to the fraction of its optimum, on the same solver instance so that the optimisations are warm started. The results are written to the BRSynth annotations of the reactions as fva_min_<objective_id> and fva_max_<objective_id>
+
+        :param reaction_id: The id of the target reaction of the objective
+        :param coefficient: The coefficient associated with the reactions id (Default: 1.0)
+        :param fraction_of_optimum: Between 0.0 and 1.0 determining the fraction of optimum (Default: 0.95)
+        :param is_max: Maximise or minimise the objective (Default: True)
+        :param pathway_id: The id of the heterologous pathway (Default: rp_pathway)
+        :param objective_id: Overwrite the default id (Default: None)
+
+        :type reaction_id: str
+        :type coefficient: float
+        :type fraction_of_optimum: float
+        :type is_max: bool
+        :type pathway_id: str
+        :type objective_id: str
+
+        :return: Tuple with the dictionnary of the (minimum, maximum) fluxes of each reaction and boolean indicating the success or failure of the function
+        :rtype: tuple
+        """
+        fbc_plugin = self.rpsbml.model.getPlugin('fbc')
+        self._checklibSBML(fbc_plugin, 'Getting FBC package')
+        objective_id = self._findCreateObjective([reaction_id], [coefficient], is_max, objective_id)
+        self._checklibSBML(fbc_plugin.setActiveObjectiveId(objective_id),
+                'Setting active objective '+str(objective_id))
+        if not self._convertToCobra():
+            return {}, False
+        groups = self.rpsbml.model.getPlugin('groups')
+        self._checklibSBML(groups, 'Getting groups plugin')
+        rp_pathway = groups.getGroup(pathway_id)
+        self._checklibSBML(rp_pathway, 'Getting RP pathway')
+        reactions = [member.getIdRef() for member in rp_pathway.getListOfMembers()]
+        if reaction_id not in reactions:
+            reactions.append(reaction_id)
+        f_reaction = cobra.io.sbml.F_REPLACE[cobra.io.sbml.F_REACTION]
+        cobra_reactions = {f_reaction(i): i for i in reactions if self.cobraModel.reactions.has_id(f_reaction(i))}
+        if len(cobra_reactions)<len(reactions):
+            self.logger.warning('Cannot find the following reactions in the Cobra model: '+str([i for i in reactions if f_reaction(i) not in cobra_reactions]))
+        #the LPs are few and cheap, a single process avoids copying the model to a pool (and the workers of rpToolServe cannot start children)
+        with rpProfiler.stage('fva'):
+            fva_results = flux_variability_analysis(self.cobraModel,
+                                                    list(cobra_reactions),
+                                                    fraction_of_optimum=fraction_of_optimum,
+                                                    processes=1)
+        results = {}
+        annotations = []
+        for cobra_id, reac_id in cobra_reactions.items():
+            results[reac_id] = (fva_results.at[cobra_id, 'minimum'], fva_results.at[cobra_id, 'maximum'])
+            reac = self.rpsbml.model.getReaction(reac_id)
+            if reac==None:
+                self.logger.error('Cannot retreive the following reaction: '+str(reac_id))
+                continue
+            annotations.append((reac, [('fva_min_'+str(objective_id), str(results[reac_id][0])),
+                                       ('fva_max_'+str(objective_id), str(results[reac_id][1]))]))
+        self.logger.debug('Set the flux ranges '+str(results))
+        self._writeBRSynth(annotations)
+        return results, True
+
+
 
 
     ########################################################################
@@ -3,6 +3,7 @@
 #from contextlib import closing
 #import time
 import libsbml
+import cobra
 import argparse
 import sys #exit using sys exit if any error is encountered
 import os
@@ -12,6 +13,16 @@ import glob
 import logging
 import tempfile
 import shutil
+import contextlib
+import functools
+import threading
+import queue
+import time
+import pickle
+import json
+import collections
+import gc
+import multiprocessing
 
 
 sys.path.insert(0, '/home/')
@@ -19,6 +30,12 @@ import inchikeyMIRIAM
 import rpTool as rpFBA
 import rpSBML
 import rpMerge
+import rpPool
+import rpCache
+import rpProfiler
+import rpFluxExport
+import rpResultsIndex
+import rpJournal
 
 
 
@@ -96,12 +113,22 @@ def processify(func):
         process_func.__name__ = func.__name__ + 'processify_func'
         setattr(sys.modules[__name__], process_func.__name__, process_func)
 
+        #wall time in seconds after which the process is killed
+        process_timeout = kwargs.pop('process_timeout', None)
+
         signal.signal(signal.SIGCHLD, handler) #This is to catch the segmentation error
 
         q = Queue()
         p = Process(target=process_func, args=[q] + list(args), kwargs=kwargs)
         p.start()
-        result, error = q.get()
+        try:
+            result, error = q.get(timeout=process_timeout)
+        except queue.Empty:
+            #the process is killed on purpose, not by a segmentation fault
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            p.kill()
+            p.join()
+            raise TimeoutError('The process has been killed after '+str(process_timeout)+' s')
         p.join()
 
         if error:
@@ -146,70 +173,322 @@ def processify(func):
     return wrapper
 
 
-###########################################################
-################## multiprocesses run #####################
-###########################################################
+####################### use HDD ############################
 
-#This is a non-deamonic multiprocessing method that can be used in combination with processify
 
-import multiprocessing
-import multiprocessing.pool
-import time
+class rpSharedGEM:
+    """GEM shared by all the pathways of a batch: its cobra model, to which the pathways are applied as a delta, and its libSBML document, that the pathways are merged with
+
+    The document is only parsed when it is first used, so that loading the compiled cobra model does not parse the SBML of the GEM if no pathway is run
+    """
+    def __init__(self, gem_sbml, cobra_model, document=None):
+        """Default constructor
 
+        :param gem_sbml: Path to the GEM file
+        :param cobra_model: The cobra model of the GEM
+        :param document: The libSBML document of the GEM, if it has already been parsed (Default: None)
+
+        :type gem_sbml: str
+        :type cobra_model: cobra.Model
+        :type document: libsbml.SBMLDocument
+        """
+        self.gem_sbml = gem_sbml
+        self.cobra_model = cobra_model
+        self._document = document
+
+
+    @property
+    def document(self):
+        """The libSBML document of the GEM, parsed on first use
+
+        :return: The libSBML document
+        :rtype: libsbml.SBMLDocument
+        """
+        if self._document is None:
+            self._document = rpSBML.rpSBML('gem', path=self.gem_sbml).document
+        return self._document
+
+
+def loadGEM(gem_sbml, gem_model=None):
+    """Build the cobra model of the GEM once, to be shared by all the pathways of a batch
+
+    :param gem_sbml: Path to the GEM file
+    :param gem_model: Path to the cobra model of the GEM compiled by compileGEM(). If None, or if the file is not private to the current user (see rpCache.isPrivate()), the cobra model is built from the SBML (Default: None)
 
-class NoDaemonProcess(multiprocessing.Process):
-    """Daemon process class
+    :type gem_sbml: str
+    :type gem_model: str
+
+    :return: The shared GEM, None if it cannot be converted
+    :rtype: rpSharedGEM
     """
-    # make 'daemon' attribute always return False
-    def _get_daemon(self):
-        return False
-    def _set_daemon(self, value):
-        pass
-    daemon = property(_get_daemon, _set_daemon)
+    if gem_model is not None and not rpCache.isPrivate(gem_model):
+        #unpickling a file that another user can write would run their code
+        logging.warning('The compiled GEM '+str(gem_model)+' is not private to the current user, converting the SBML instead')
+        gem_model = None
+    if gem_model is not None:
+        try:
+            with open(gem_model, 'rb') as infile:
+                #the SBML of the GEM is only parsed when a pathway is merged with it
+                return rpSharedGEM(gem_sbml, pickle.load(infile))
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            logging.warning('Cannot load the compiled GEM '+str(gem_model)+', converting the SBML instead: '+str(e))
+    rpsbml_gem = rpSBML.rpSBML('gem', path=gem_sbml)
+    rpfba = rpFBA.rpFBA(rpsbml_gem)
+    if not rpfba._convertToCobra():
+        logging.error('Cannot convert the GEM to cobra: '+str(gem_sbml))
+        return None
+    return rpSharedGEM(gem_sbml, rpfba.cobraModel, rpsbml_gem.document)
+
+
+def compileGEM(gem_sbml, output_folder, gem_cache=None):
+    """Build the cobra model of the GEM once and save it as a binary file that loads much faster than the SBML
+
+    The compiled model is only used with share_gem, where the pathways are applied to the cobra model of the GEM. Otherwise each pathway is merged with the GEM SBML and the merged model is converted as a whole. The compiled model is cached, keyed by the content of the GEM and the versions of cobrapy and of the conversion (the hash of rpTool), so that it is rebuilt automatically when any of them changes
 
+    :param gem_sbml: Path to the GEM file
+    :param output_folder: Folder where the compiled model is written if it is not cached
+    :param gem_cache: Cache of the compiled GEMs. None to disable it (Default: None)
+
+    :type gem_sbml: str
+    :type output_folder: str
+    :type gem_cache: rpCache
 
-class nonDeamonicPool(multiprocessing.pool.Pool):
-    """We sub-class multiprocessing.pool.Pool instead of multiprocessing.Pool because the latter is only a wrapper function, not a proper class.
+    :return: Path to the compiled model, None if the GEM cannot be converted
+    :rtype: str
     """
-    Process = NoDaemonProcess
+    if gem_cache is not None:
+        gem_key = rpCache.hashKey('cobra', rpCache.hashFile(gem_sbml), cobra.__version__, rpCache.hashFile(rpFBA.__file__))
+        gem_path = gem_cache.getPath(gem_key)
+        if gem_path is not None:
+            logging.debug('Using the cached compiled GEM: '+str(gem_path))
+            return gem_path
+    gem_base = loadGEM(gem_sbml)
+    if gem_base is None:
+        return None
+    gem_model = os.path.join(output_folder, 'gem_model.pickle')
+    #the temporary file is only readable by the current user (0600) whatever the umask, as loadGEM() checks it before unpickling it
+    with tempfile.NamedTemporaryFile(dir=output_folder, prefix='.', delete=False) as outfile:
+        pickle.dump(gem_base.cobra_model, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(outfile.name, gem_model)
+    if gem_cache is not None:
+        return gem_cache.putFile(gem_key, gem_model)
+    return gem_model
 
 
-####################### use HDD ############################
+#GEM loaded by each worker of the shared GEM pool
+_gem_base = None
+
+
+def _initSharedGEM(gem_sbml, gem_model=None):
+    """Pool initializer that loads the GEM once per worker process
+
+    :param gem_sbml: Path to the GEM file
+    :param gem_model: Path to the compiled cobra model of the GEM (Default: None)
+
+    :type gem_sbml: str
+    :type gem_model: str
+
+    :return: None
+    :rtype: None
+    """
+    global _gem_base
+    _gem_base = loadGEM(gem_sbml, gem_model)
+
+
+def _resetSharedGEM():
+    """Release the GEM loaded by _initSharedGEM()
+
+    :return: None
+    :rtype: None
+    """
+    global _gem_base
+    _gem_base = None
+
+
+def singleFBA_shared(*args):
+    """Single rpSBML simulation using the GEM loaded by _initSharedGEM(). See singleFBA() for the parameters
+
+    :return: Succcess or failure of the function
+    :rtype: bool
+    """
+    return singleFBA(*args, gem_base=_gem_base)
 
 
-#TODO: do not use the species_group_id and the sink_species_group_id. Loop through all the groups (and if the same) and overwrite the annotation instead
 @processify
-def singleFBA_hdd(file_name,
-                  sbml_path,
-                  gem_sbml,
-                  sim_type,
-                  source_reaction,
-                  target_reaction,
-                  source_coefficient,
-                  target_coefficient,
-                  is_max,
-                  fraction_of,
-                  tmpOutputFolder,
-                  dont_merge=True,
-                  pathway_id='rp_pathway',
-                  objective_id=None,
-                  compartment_id='MNXC3',
-                  fill_orphan_species=False,
-                  species_group_id='central_species',
-                  sink_species_group_id='rp_sink_species'):
+def singleFBA_shared_hdd(*args):
+    """Single rpSBML simulation in a forked process, using the GEM loaded by _initSharedGEM() before the fork. See singleFBA() for the parameters
+
+    :return: Succcess or failure of the function
+    :rtype: bool
+    """
+    return singleFBA_shared(*args)
+
+
+def parseSimType(sim_type):
+    """Return the list of simulation types to run on each model
+
+    :param sim_type: A simulation type, a comma separated list of simulation types (ex: fba,pfba,fraction) or a list of them
+
+    :type sim_type: str
+
+    :return: The simulation types, without duplicates and in the given order
+    :rtype: list
+    """
+    if isinstance(sim_type, str):
+        sim_type = sim_type.split(',')
+    sim_types = []
+    for sim in sim_type:
+        sim = str(sim).strip()
+        if sim and sim not in sim_types:
+            sim_types.append(sim)
+    return sim_types
+
+
+def parseFractions(fractions):
+    """Return the fractions of the source optimum of a fraction_sweep simulation
+
+    :param fractions: A range as start:stop:step (stop included, ex: 0.1:0.95:0.05), a comma separated list of fractions (ex: 0.1,0.5,0.9) or a list of them
+
+    :type fractions: str
+
+    :raises ValueError: If the fractions cannot be interpreted
+
+    :return: The fractions
+    :rtype: tuple
+    """
+    if not isinstance(fractions, str):
+        return tuple(float(i) for i in fractions)
+    if ':' in fractions:
+        start, stop, step = [float(i) for i in fractions.split(':')]
+        if step<=0.0:
+            raise ValueError('The step of the fractions must be positive: '+str(fractions))
+        #rounded so that the floating point errors of the steps do not show in the objective ids
+        return tuple(round(start+i*step, 10) for i in range(int(round((stop-start)/step, 10))+1))
+    return tuple(float(i) for i in fractions.split(',') if i.strip())
+
+
+def transferResults(rpsbml,
+                    rpsbml_gem,
+                    rev_reactions_convert,
+                    cent_spe,
+                    sink_spe,
+                    pathway_id='rp_pathway',
+                    species_group_id='central_species',
+                    sink_species_group_id='rp_sink_species'):
+    """Copy the results of the simulations of the merged model back to the heterologous pathway model: the annotations of the pathway reactions, of the groups and of the objectives
+
+    :param rpsbml: The heterologous pathway model
+    :param rpsbml_gem: The merged model that has been simulated
+    :param rev_reactions_convert: The ids of the reactions of the merged model to the ids of the pathway model, as returned by rpMerge.mergeModels()
+    :param cent_spe: The ids of the central species of the pathway model
+    :param sink_spe: The ids of the sink species of the pathway model
+    :param pathway_id: The id of the heterologous pathway (Default: rp_pathway)
+    :param species_group_id: The id of the central species (Default: central_species)
+    :param sink_species_group_id: The id of the sink species (Default: rp_sink_species)
+
+    :type rpsbml: rpSBML
+    :type rpsbml_gem: rpSBML
+    :type rev_reactions_convert: dict
+    :type cent_spe: list
+    :type sink_spe: list
+    :type pathway_id: str
+    :type species_group_id: str
+    :type sink_species_group_id: str
+
+    :return: None
+    :rtype: None
+    """
+    logging.debug('Returning model with heterologous pathway only')
+    #### reactions ####
+    #the reactions of both models are indexed once by id, the libSBML lookups by id are linear
+    target_reactions = {i.getId(): i for i in rpsbml.model.getListOfReactions()}
+    source_reactions = {i.getId(): i for i in rpsbml_gem.model.getListOfReactions()}
+    source_groups = rpsbml_gem.model.getPlugin('groups')
+    for member in source_groups.getGroup(pathway_id).getListOfMembers():
+        reac_id = member.getIdRef()
+        reacIN = target_reactions.get(rev_reactions_convert.get(reac_id, reac_id))
+        reacOUT = source_reactions.get(reac_id)
+        if reacIN is None or reacOUT is None:
+            logging.warning('Cannot find the reaction '+str(reac_id)+' in the heterologous pathway model or in the merged model')
+            continue
+        reacIN.setAnnotation(reacOUT.getAnnotation())
+        #### species TODO: only for shadow price
+    #### groups ####
+    target_groups = {i.getId(): i for i in rpsbml.model.getPlugin('groups').getListOfGroups()}
+    new_members = {species_group_id: cent_spe, sink_species_group_id: sink_spe}
+    for source_group in source_groups.getListOfGroups():
+        target_group = target_groups.get(source_group.getId())
+        if target_group is None:
+            continue
+        if source_group.getId() in new_members:
+            #TODO: #### replace the new potentially incorect central species with the normal ones #####
+            #replace all the previous members
+            logging.debug('Replacing the members of '+str(source_group.getId()))
+            target_group.getListOfMembers().clear(True)
+            for spe_id in new_members[source_group.getId()]:
+                target_group.createMember().setIdRef(spe_id)
+        else:
+            target_group.setAnnotation(source_group.getAnnotation())
+    #### objectives ####
+    source_fbc = rpsbml_gem.model.getPlugin('fbc')
+    target_fbc = rpsbml.model.getPlugin('fbc')
+    target_objectives = {i.getId(): i for i in target_fbc.getListOfObjectives()}
+    source_obj_id = None
+    for source_obj in source_fbc.getListOfObjectives():
+        source_obj_id = source_obj.getId()
+        target_obj = target_objectives.get(source_obj_id)
+        if target_obj is None:
+            target_fbc.addObjective(source_obj)
+            continue
+        target_obj.setAnnotation(source_obj.getAnnotation())
+        source_fluxObjs = {i.getReaction(): i for i in source_obj.getListOfFluxObjectives()}
+        for target_fluxObj in target_obj.getListOfFluxObjectives():
+            source_fluxObj = source_fluxObjs.get(target_fluxObj.getReaction())
+            if source_fluxObj is not None:
+                target_fluxObj.setAnnotation(source_fluxObj.getAnnotation())
+    #rpsbml.createMultiFluxObj('obj_RP1_sink', ['RP1_sink'], [1])
+    if source_obj_id is not None:
+        target_fbc.setActiveObjectiveId(source_obj_id) #tmp random assigenement of objective
+
+
+#TODO: do not use the species_group_id and the sink_species_group_id. Loop through all the groups (and if the same) and overwrite the annotation instead
+def singleFBA(file_name,
+              sbml_path,
+              gem_sbml,
+              sim_type,
+              source_reaction,
+              target_reaction,
+              source_coefficient,
+              target_coefficient,
+              is_max,
+              fraction_of,
+              tmpOutputFolder,
+              dont_merge=True,
+              pathway_id='rp_pathway',
+              objective_id=None,
+              compartment_id='MNXC3',
+              fill_orphan_species=False,
+              species_group_id='central_species',
+              sink_species_group_id='rp_sink_species',
+              sweep_fractions=None,
+              envelope_points=20,
+              profile_report=None,
+              export_fluxes=None,
+              solver_timeout=None,
+              gem_base=None):
     """Single rpSBML simulation
 
     :param file_name: The name of the model
-    :param sbml_path: Path to the rpSBML file
+    :param sbml_path: Path to the rpSBML file, or its content
     :param gem_sbml: Path to the GEM file
-    :param sim_type: The type of simulation to use. Available simulation types include: fraction, fba, rpfba
+    :param sim_type: The type of simulation to use. Available simulation types include: fraction, fraction_sweep, envelope, fba, pfba, fva. Several types can be given as a list or separated by commas, in which case their objectives are named obj_<type> (or <objective_id>__<type>)
     :param source_reaction: The reaction id of the source reaction.
     :param target_reaction: The reaction id of the target reaction. Note that if fba or rpfba options are used, then these are ignored
     :param source_coefficient: The source coefficient
     :param target_coefficient: The target coefficient
     :param is_max: Maximise or minimise the objective
     :param fraction_of: The fraction of the optimum. Note that this value is ignored is fba is used
-    :param tmpOutputFolder: The path to the output document
+    :param tmpOutputFolder: The path to the output document. If None, the output SBML is returned instead of being written
     :param dont_merge: Output the merged model (Default: True)
     :param pathway_id: The id of the heterologous pathway (Default: rp_pathway)
     :param objective_id: Overwrite the auto-generated id of the results (Default: None)
@@ -217,6 +496,12 @@ def singleFBA_hdd(file_name,
     :param fill_orphan_species: Add pseudo reactions that consume/produce single parent species. Note in development
     :param species_group_id: The id of the central species (Default: central_species)
     :param sink_species_group_id: The id of the sink species (Default: rp_sink_species)
+    :param sweep_fractions: The fractions of the source optimum of the fraction_sweep simulation, as returned by parseFractions() (Default: None)
+    :param envelope_points: The maximal number of points of the production envelope of the envelope simulation (Default: 20)
+    :param profile_report: Path to the JSON lines report where the time and memory of each stage of the run is appended. None to disable the profiling (Default: None)
+    :param export_fluxes: Also return the results of the model for the batch export (see rpFluxExport) and the results index (see rpResultsIndex): pathway for the fluxes of the objective and heterologous pathway reactions, full for the fluxes of all the reactions. None to disable it (Default: None)
+    :param solver_timeout: Time limit in seconds of each optimisation. The objectives that reach it have the status time_limit in the results (Default: None)
+    :param gem_base: The GEM parsed once for the whole batch, as returned by loadGEM(). If given, gem_sbml is ignored and the pathway is applied as a delta to the shared cobra model (Default: None)
 
     :type inputTar: str 
     :type gem_sbml: str
@@ -236,145 +521,528 @@ def singleFBA_hdd(file_name,
     :type fill_orphan_species: bool
     :type species_group_id: str
     :type sink_species_group_id: str
+    :type sweep_fractions: list
+    :type envelope_points: int
+    :type profile_report: str
+    :type export_fluxes: str
+    :type solver_timeout: float
+    :type gem_base: rpSharedGEM
+
+    :return: Succcess or failure of the function, or the output SBML if tmpOutputFolder is None. If export_fluxes is set, tuple of it and the results of the model: its wall time and the results of each objective
+    :rtype: bool
+    """
+    start = time.perf_counter()
+    with rpProfiler.profile(file_name, profile_report):
+        logging.debug('--------- '+str(file_name)+' ------------')
+        with rpProfiler.stage('parse'):
+            if isinstance(sbml_path, bytes):
+                rpsbml = rpSBML.rpSBML(file_name, libsbml.readSBMLFromString(sbml_path.decode('utf-8')))
+            else:
+                rpsbml = rpSBML.rpSBML(file_name, path=sbml_path)
+        #Save the central species
+        groups = rpsbml.model.getPlugin('groups')
+        central = groups.getGroup(species_group_id)
+        sink_group = groups.getGroup(sink_species_group_id)
+        rp_group = groups.getGroup(pathway_id)
+        cent_spe = [str(i.getIdRef()) for i in central.getListOfMembers()]
+        sink_spe = [str(i.getIdRef()) for i in sink_group.getListOfMembers()]
+        rp_reac = [str(i.getIdRef()) for i in rp_group.getListOfMembers()]
+        logging.debug('old central species: '+str(cent_spe))
+        logging.debug('old sink species: '+str(sink_spe))
+        logging.debug('old rp reactions: '+str(rp_reac))
+        #rpsbml_gem = rpSBML.rpSBML(file_name, libsbml.readSBMLFromString(gem_sbml))
+        with rpProfiler.stage('parse_gem'):
+            if gem_base is None:
+                base_model = None
+                rpsbml_gem = rpSBML.rpSBML(file_name, path=gem_sbml)
+            else:
+                base_model = gem_base.cobra_model
+                rpsbml_gem = rpSBML.rpSBML(file_name, gem_base.document.clone())
+        #rpsbml.mergeModels(rpsbml_gem, species_group_id, sink_species_group_id)
+        rpmerge = rpMerge.rpMerge()
+        with rpProfiler.stage('merge'):
+            species_source_target, reactions_convert = rpmerge.mergeModels(rpsbml, rpsbml_gem)
+        #NOTE: reactions_convert is organised with key being the rpsbml reaction and value being the rpsbml_gem value`
+        #BUG: when merging the RP1_sink (very rare cases) can be recognised if another reaction contains the same species as a reactant
+        ## under such as scenario the algorithm will consider that they are the same -- TODO: overwrite it
+        if target_reaction in reactions_convert:
+            logging.warning('The target_reaction ('+str(target_reaction)+') has been detected in model '+str(file_name)+', ignoring this model...')
+            return False
+        rev_reactions_convert = {v: k for k, v in reactions_convert.items()}
+        logging.debug('species_source_target: '+str(species_source_target))
+        logging.debug('reactions_convert: '+str(reactions_convert))
+        logging.debug('rev_reactions_convert: '+str(rev_reactions_convert))
+        #TO TEST MERGE: TO REMOVE
+        #rpsbml_gem.modelName = 'test'
+        #rpsbml_gem.writeSBML('/home/mdulac/workspace/Galaxy-SynBioCAD/rpFBA/rpFBA_image/tmp_out/')
+        sim_types = parseSimType(sim_type)
+        #a single simulation reuses the objective of the target reaction of the model, as rpSBML.findCreateObjective()
+        rpfba = rpFBA.rpFBA(rpsbml_gem, base_model, export_fluxes, solver_timeout, len(sim_types)>1)
+        #the pathway delta applied to the shared base model is rolled back when exiting its context
+        with (base_model if base_model is not None else contextlib.nullcontext()):
+            #the simulations run back to back on the same merged model, that is only converted to cobra once
+            for sim in sim_types:
+                sim_objective_id = objective_id
+                if len(sim_types)>1:
+                    #several simulations optimise the same target reaction, keep their results apart
+                    sim_objective_id = str(objective_id)+'__'+sim if objective_id else 'obj_'+sim
+                with rpProfiler.stage('simulate_'+sim):
+                    ####### fraction of reaction ######
+                    if sim=='fraction':
+                        rpfba.runFractionReaction(source_reaction, source_coefficient, target_reaction, target_coefficient, fraction_of, is_max, pathway_id, sim_objective_id)
+                    ####### sweep of fractions of reaction ######
+                    elif sim=='fraction_sweep':
+                        rpfba.runFractionSweep(source_reaction, source_coefficient, target_reaction, target_coefficient, sweep_fractions or [], is_max, pathway_id, sim_objective_id)
+                    ####### production envelope ######
+                    elif sim=='envelope':
+                        rpfba.runProductionEnvelope(source_reaction, source_coefficient, target_reaction, target_coefficient, is_max, pathway_id, sim_objective_id, envelope_points)
+                    ####### FVA of the pathway #######
+                    elif sim=='fva':
+                        rpfba.runPathwayFVA(target_reaction, target_coefficient, fraction_of, is_max, pathway_id, sim_objective_id)
+                    ####### FBA ########
+                    elif sim=='fba':
+                        rpfba.runFBA(target_reaction, target_coefficient, is_max, pathway_id, sim_objective_id)
+                    ####### pFBA #######
+                    elif sim=='pfba':
+                        rpfba.runParsimoniousFBA(target_reaction, target_coefficient, fraction_of, is_max, pathway_id, sim_objective_id)
+                    else:
+                        logging.error('Cannot recognise sim_type: '+str(sim))
+        '''
+        ###### multi objective #####
+        elif sim_type=='multi_fba':
+            rpfba.runMultiObjective(reactions, coefficients, is_max, pathway_id)
+        '''
+        if dont_merge:
+            with rpProfiler.stage('transfer'):
+                transferResults(rpsbml, rpfba.rpsbml, rev_reactions_convert, cent_spe, sink_spe, pathway_id, species_group_id, sink_species_group_id)
+                rpsbml_out = rpsbml
+        else:
+            logging.debug('Returning the full model')
+            rpsbml_out = rpfba.rpsbml
+        with rpProfiler.stage('write_sbml'):
+            if tmpOutputFolder is None:
+                sbml_out = libsbml.writeSBMLToString(rpsbml_out.document)
+            else:
+                rpsbml_out.writeSBML(tmpOutputFolder)
+                sbml_out = True
+        if export_fluxes:
+            return sbml_out, {'wall': time.perf_counter()-start, 'objectives': rpfba.flux_results}
+        return sbml_out
+
+
+@processify
+def singleFBA_hdd(file_name,
+                  sbml_path,
+                  gem_sbml,
+                  sim_type,
+                  source_reaction,
+                  target_reaction,
+                  source_coefficient,
+                  target_coefficient,
+                  is_max,
+                  fraction_of,
+                  tmpOutputFolder,
+                  dont_merge=True,
+                  pathway_id='rp_pathway',
+                  objective_id=None,
+                  compartment_id='MNXC3',
+                  fill_orphan_species=False,
+                  species_group_id='central_species',
+                  sink_species_group_id='rp_sink_species',
+                  sweep_fractions=None,
+                  envelope_points=20,
+                  profile_report=None,
+                  export_fluxes=None,
+                  solver_timeout=None):
+    """Single rpSBML simulation in its own process. See singleFBA() for the parameters. The keyword argument process_timeout kills the process after that many seconds
+
+    :raises TimeoutError: If the process has been killed after process_timeout
 
     :return: Succcess or failure of the function
     :rtype: bool
     """
-    logging.debug('--------- '+str(file_name)+' ------------')
-    rpsbml = rpSBML.rpSBML(file_name, path=sbml_path)
-    #Save the central species
-    groups = rpsbml.model.getPlugin('groups')
-    central = groups.getGroup(species_group_id)
-    sink_group = groups.getGroup(sink_species_group_id)
-    rp_group = groups.getGroup(pathway_id)
-    cent_spe = [str(i.getIdRef()) for i in central.getListOfMembers()]
-    sink_spe = [str(i.getIdRef()) for i in sink_group.getListOfMembers()]
-    rp_reac = [str(i.getIdRef()) for i in rp_group.getListOfMembers()]
-    logging.debug('old central species: '+str(cent_spe))
-    logging.debug('old sink species: '+str(sink_spe))
-    logging.debug('old rp reactions: '+str(rp_reac))
-    #rpsbml_gem = rpSBML.rpSBML(file_name, libsbml.readSBMLFromString(gem_sbml))
-    rpsbml_gem = rpSBML.rpSBML(file_name, path=gem_sbml)
-    #rpsbml.mergeModels(rpsbml_gem, species_group_id, sink_species_group_id)
-    rpmerge = rpMerge.rpMerge()
-    species_source_target, reactions_convert = rpmerge.mergeModels(rpsbml, rpsbml_gem)
-    #NOTE: reactions_convert is organised with key being the rpsbml reaction and value being the rpsbml_gem value`
-    #BUG: when merging the RP1_sink (very rare cases) can be recognised if another reaction contains the same species as a reactant
-    ## under such as scenario the algorithm will consider that they are the same -- TODO: overwrite it
-    if target_reaction in reactions_convert:
-        logging.warning('The target_reaction ('+str(target_reaction)+') has been detected in model '+str(file_name)+', ignoring this model...')
-        return False
-    rev_reactions_convert = {v: k for k, v in reactions_convert.items()}
-    logging.debug('species_source_target: '+str(species_source_target))
-    logging.debug('reactions_convert: '+str(reactions_convert))
-    logging.debug('rev_reactions_convert: '+str(rev_reactions_convert))
-    #TO TEST MERGE: TO REMOVE
-    #rpsbml_gem.modelName = 'test'
-    #rpsbml_gem.writeSBML('/home/mdulac/workspace/Galaxy-SynBioCAD/rpFBA/rpFBA_image/tmp_out/')
-    rpfba = rpFBA.rpFBA(rpsbml_gem)
-    ####### fraction of reaction ######
-    if sim_type=='fraction':
-        rpfba.runFractionReaction(source_reaction, source_coefficient, target_reaction, target_coefficient, fraction_of, is_max, pathway_id, objective_id)
-    ####### FBA ########
-    elif sim_type=='fba':
-        rpfba.runFBA(target_reaction, target_coefficient, is_max, pathway_id, objective_id)
-    ####### pFBA #######
-    elif sim_type=='pfba':
-        rpfba.runParsimoniousFBA(target_reaction, target_coefficient, fraction_of, is_max, pathway_id, objective_id)
-    else:
-        logging.error('Cannot recognise sim_type: '+str(sim_type))
-    '''
-    ###### multi objective #####
-    elif sim_type=='multi_fba':
-        rpfba.runMultiObjective(reactions, coefficients, is_max, pathway_id)
-    '''
-    if dont_merge:
-        logging.debug('Returning model with heterologous pathway only')
-        groups = rpfba.rpsbml.model.getPlugin('groups')
-        rp_pathway = groups.getGroup(pathway_id)
-        logging.debug('---- Reactions ----')
-        for member in rp_pathway.getListOfMembers():
-            #### reaction annotation
-            logging.debug(member.getIdRef())
-            reacFBA = rpfba.rpsbml.model.getReaction(member.getIdRef())
-            logging.debug(reacFBA)
-            try:
-                #reacIN = rpsbml.model.getReaction(reactions_convert[member.getIdRef()])
-                reacIN = rpsbml.model.getReaction(rev_reactions_convert[member.getIdRef()])
-            except KeyError:
-                reacIN = rpsbml.model.getReaction(member.getIdRef())
-            logging.debug(reacIN)
-            logging.debug(reacFBA.getAnnotation())
-            reacIN.setAnnotation(reacFBA.getAnnotation())
-            #### species TODO: only for shadow price
-        #### add groups ####
-        source_groups = rpfba.rpsbml.model.getPlugin('groups')
-        target_groups = rpsbml.model.getPlugin('groups')
-        target_groupsID = [i.getId() for i in target_groups.getListOfGroups()]
-        for source_group in source_groups.getListOfGroups():
-            #logging.debug('Replacing group id: '+str(source_group.getId()))
-            if source_group.getId()==species_group_id:
-                target_group = target_groups.getGroup(source_group.getId())
-                #TODO: #### replace the new potentially incorect central species with the normal ones #####
-                #delete all the previous members
-                logging.debug('Removing central_species')
-                for i in range(target_group.getNumMembers()):
-                    logging.debug('Deleting group member: '+str(target_group.getMember(0).getIdRef()))
-                    target_group.removeMember(0)
-                #add the new ones
-                for cs in cent_spe:
-                    logging.debug('Creating new member: '+str(cs))
-                    newM = target_group.createMember()
-                    newM.setIdRef(cs)  
-            elif source_group.getId()==sink_species_group_id:
-                target_group = target_groups.getGroup(source_group.getId())
-                logging.debug('Removing sink species')
-                for i in range(target_group.getNumMembers()):
-                    logging.debug('Deleting group member: '+str(target_group.getMember(0).getIdRef()))
-                    target_group.removeMember(0)
-                #add the new ones
-                for cs in sink_spe:
-                    logging.debug('Creating new member: '+str(cs))
-                    newM = target_group.createMember()
-                    newM.setIdRef(cs)  
-            elif source_group.getId() in target_groupsID:
-                target_group = target_groups.getGroup(source_group.getId())
-                target_group.setAnnotation(source_group.getAnnotation())
-            '''
-            elif source_group.getId()==pathway_id:
-                target_group = target_groups.getGroup(source_group.getId())
-                logging.debug('Removing rp ractions')
-                for i in range(target_group.getNumMembers()):
-                    logging.debug('Deleting group member: '+str(target_group.getMember(0).getIdRef()))
-                    target_group.removeMember(0)
-                #add the new ones
-                for cs in rp_reac:
-                    logging.debug('Creating new member: '+str(cs))
-                    newM = target_group.createMember()
-                    newM.setIdRef(cs)  
-            '''
-        #### add objectives ####
-        source_fbc = rpfba.rpsbml.model.getPlugin('fbc')
-        target_fbc = rpsbml.model.getPlugin('fbc')
-        target_objID = [i.getId() for i in target_fbc.getListOfObjectives()]
-        for source_obj in source_fbc.getListOfObjectives():
-            source_obj_id = source_obj.getId()
-            if source_obj.getId() in target_objID:
-                target_obj = target_fbc.getObjective(source_obj.getId())
-                target_obj.setAnnotation(source_obj.getAnnotation())
-                for target_fluxObj in target_obj.getListOfFluxObjectives():
-                    for source_fluxObj in source_obj.getListOfFluxObjectives():
-                        if target_fluxObj.getReaction()==source_fluxObj.getReaction():
-                            target_fluxObj.setAnnotation(source_fluxObj.getAnnotation())
+    return singleFBA(file_name,
+                     sbml_path,
+                     gem_sbml,
+                     sim_type,
+                     source_reaction,
+                     target_reaction,
+                     source_coefficient,
+                     target_coefficient,
+                     is_max,
+                     fraction_of,
+                     tmpOutputFolder,
+                     dont_merge,
+                     pathway_id,
+                     objective_id,
+                     compartment_id,
+                     fill_orphan_species,
+                     species_group_id,
+                     sink_species_group_id,
+                     sweep_fractions,
+                     envelope_points,
+                     profile_report,
+                     export_fluxes,
+                     solver_timeout)
+
+
+class rpTarWriter:
+    """Append the output models to a TAR archive as soon as they are produced
+
+    The models are passed through a bounded queue to a thread that compresses and writes them, so that the compression overlaps with the simulations. The archive is flushed after each model so that the results that are already written can be recovered if the run is killed
+    """
+    def __init__(self, outputTar, mode='w:gz', max_queue=100, profile_report=None):
+        """Default constructor
+
+        :param outputTar: Path of the TAR output
+        :param mode: The tarfile mode to open the archive (Default: w:gz)
+        :param max_queue: The maximal number of models waiting to be written (Default: 100)
+        :param profile_report: Path to the JSON lines report where the time to write each model is appended. None to disable the profiling (Default: None)
+
+        :type outputTar: str
+        :type mode: str
+        :type max_queue: int
+        :type profile_report: str
+        """
+        self.outputTar = outputTar
+        self.mode = mode
+        self.profile_report = profile_report
+        self.num_models = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._error = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+    def _run(self):
+        """Write the models of the queue to the archive until close() is called
+
+        :return: None
+        :rtype: None
+        """
+        try:
+            with tarfile.open(self.outputTar, mode=self.mode) as tar:
+                while True:
+                    model = self._queue.get()
+                    if model is None:
+                        break
+                    file_name, content = model
+                    #the profile of the model being simulated belongs to the other thread, use a separate one
+                    model_profile = rpProfiler.rpProfile(file_name)
+                    with model_profile.stage('write_tar'):
+                        if isinstance(content, str):
+                            content = content.encode('utf-8')
+                        info = tarfile.TarInfo(str(file_name)+'.sbml.xml')
+                        info.size = len(content)
+                        info.mtime = time.time()
+                        tar.addfile(tarinfo=info, fileobj=io.BytesIO(content))
+                        tar.fileobj.flush()
+                    if self.profile_report:
+                        model_profile.write(self.profile_report)
+                    self.num_models += 1
+        except Exception as e:
+            self._error = e
+            #keep consuming so that write() never blocks
+            while self._queue.get() is not None:
+                pass
+
+
+    def write(self, file_name, content):
+        """Add a model to the archive, blocking if the queue is full
+
+        :param file_name: The name of the model
+        :param content: The SBML of the model
+
+        :type file_name: str
+        :type content: str
+
+        :return: None
+        :rtype: None
+        """
+        self._queue.put((file_name, content))
+
+
+    def close(self):
+        """Write the remaining models and close the archive
+
+        :raises Exception: If an error occured while writing the archive
+
+        :return: None
+        :rtype: None
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._error:
+            raise self._error
+
+
+class rpBatchReport:
+    """Outcome of the models of a batch: the number of models of each status and the reason of each failure
+    """
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.failures = []
+
+
+    def add(self, model_name, status, reason=None):
+        """Add the outcome of a model
+
+        :param model_name: The name of the model
+        :param status: The status of the model: success, cached, skipped, resumed, failed, crashed, quarantined or timed_out
+        :param reason: The error of the model, only the last line of a traceback being kept (Default: None)
+
+        :type model_name: str
+        :type status: str
+        :type reason: str
+
+        :return: None
+        :rtype: None
+        """
+        self.counts[status] += 1
+        if status not in ['success', 'cached', 'skipped', 'resumed']:
+            if reason:
+                reason = str(reason).strip().splitlines()[-1]
+            self.failures.append({'model': model_name, 'status': status, 'reason': reason})
+
+
+    def write(self, path):
+        """Write the report as JSON: the number of models of each status, the number of failures of each reason and the failed models
+
+        :param path: Path of the JSON report
+
+        :type path: str
+
+        :return: None
+        :rtype: None
+        """
+        reasons = collections.Counter(str(i['reason']) for i in self.failures)
+        with open(path, 'w') as outfile:
+            json.dump({'num_models': sum(self.counts.values()),
+                       'counts': dict(self.counts),
+                       'reasons': dict(reasons.most_common()),
+                       'failures': self.failures}, outfile, indent=2)
+
+
+def readTar(inputTar, profile_report=None):
+    """Stream the models of a TAR archive, without extracting it to disk
+
+    Each member is read from the (compressed) archive only when the next model is requested
+
+    :param inputTar: Path of the TAR rpSBML files
+    :param profile_report: Path to the JSON lines report where the time to read each model is appended. None to disable the profiling (Default: None)
+
+    :type inputTar: str
+    :type profile_report: str
+
+    :return: Generator of tuples with the name of the model and the content of its file
+    :rtype: generator
+    """
+    with tarfile.open(inputTar, mode='r|*') as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            file_name = member.name.split('/')[-1].replace('.sbml', '').replace('.xml', '').replace('.rpsbml', '')
+            if profile_report:
+                model_profile = rpProfiler.rpProfile(file_name)
+                with model_profile.stage('read_tar'):
+                    content = tar.extractfile(member).read()
+                model_profile.write(profile_report)
             else:
-                target_fbc.addObjective(source_obj)
-        #rpsbml.createMultiFluxObj('obj_RP1_sink', ['RP1_sink'], [1])
-        target_fbc.setActiveObjectiveId(source_obj_id) #tmp random assigenement of objective
-        rpsbml.writeSBML(tmpOutputFolder)
-    else:
-        logging.debug('Returning the full model')
-        rpfba.rpsbml.writeSBML(tmpOutputFolder)
-    return True
+                content = tar.extractfile(member).read()
+            yield file_name, content
+
+
+def countTar(inputTar, max_count=None):
+    """Count the models of a TAR archive from its headers, without extracting it to disk
+
+    :param inputTar: Path of the TAR rpSBML files
+    :param max_count: Stop counting when this number is reached (Default: None)
+
+    :type inputTar: str
+    :type max_count: int
+
+    :return: The number of models
+    :rtype: int
+    """
+    num_models = 0
+    with tarfile.open(inputTar, mode='r|*') as tar:
+        for member in tar:
+            if member.isfile():
+                num_models += 1
+                if max_count and num_models>=max_count:
+                    break
+    return num_models
+
+
+def modelCost(task):
+    """Estimate the cost of running a model, to dispatch the most expensive models first
+
+    The time to merge, simulate and write a pathway grows with its number of reactions (ex: two optimisations per reaction for fva), the size of the file breaking the ties
+
+    :param task: The name of the model and the content of its file, as read by readTar()
+
+    :type task: tuple
+
+    :return: The estimated cost
+    :rtype: float
+    """
+    content = task[1]
+    marker = b'<reaction ' if isinstance(content, bytes) else '<reaction '
+    return content.count(marker)+len(content)/1e9
+
+
+def _exportMode(flux_writer, results_index=None, keep_status=False):
+    """Return the export_fluxes mode of singleFBA() for a flux writer and a results index
+
+    :param flux_writer: The writer of the batch export of the fluxes, or None
+    :param results_index: The results index, or None (Default: None)
+    :param keep_status: Return the results of the models even if they are neither exported nor indexed, to check their status (ex: to not cache the models that reached the time limit of the solver) (Default: False)
+
+    :type flux_writer: rpFluxExport.rpFluxWriter
+    :type results_index: rpResultsIndex.rpResultsIndex
+    :type keep_status: bool
+
+    :return: full, pathway or None if the results are not needed
+    :rtype: str
+    """
+    if flux_writer is not None and flux_writer.full_fluxes:
+        return 'full'
+    if flux_writer is not None or results_index is not None or keep_status:
+        return 'pathway'
+    return None
+
+
+def _modelStatus(results):
+    """Return the status of a model that has been simulated from its results
+
+    :param results: The results of the model returned by singleFBA(), or None
+
+    :type results: dict
+
+    :return: timed_out if the solver has reached its time limit for one of the objectives, success otherwise
+    :rtype: str
+    """
+    if results and any(i['status']=='time_limit' for i in results['objectives']):
+        return 'timed_out'
+    return 'success'
+
+
+def _recordModel(file_name, model_key, results, flux_writer=None, results_index=None, batch_report=None):
+    """Add the results of a model to the batch export of the fluxes, to the results index and to the batch report
+
+    :param file_name: The name of the model
+    :param model_key: The key of the model in the cache and the results index
+    :param results: The results of the model returned by singleFBA()
+    :param flux_writer: The writer of the batch export of the fluxes, or None (Default: None)
+    :param results_index: The results index, or None (Default: None)
+    :param batch_report: The report of the batch, or None (Default: None)
+
+    :type file_name: str
+    :type model_key: str
+    :type results: dict
+    :type flux_writer: rpFluxExport.rpFluxWriter
+    :type results_index: rpResultsIndex.rpResultsIndex
+    :type batch_report: rpBatchReport
+
+    :return: None
+    :rtype: None
+    """
+    status = _modelStatus(results)
+    if flux_writer is not None:
+        flux_writer.write(file_name, results['objectives'])
+    if results_index is not None:
+        results_index.addModel(file_name, model_key, results, status)
+    if batch_report is not None:
+        batch_report.add(file_name, status, 'Time limit of the solver' if status=='timed_out' else None)
+
+
+def _recordFailure(file_name, model_key, status, reason=None, flux_writer=None, results_index=None, batch_report=None):
+    """Add a model that has not produced any results to the batch export of the fluxes, as a single row without objective, to the results index and to the batch report
+
+    :param file_name: The name of the model
+    :param model_key: The key of the model in the cache and the results index
+    :param status: The status of the model: failed, crashed, quarantined or timed_out
+    :param reason: The error of the model (Default: None)
+    :param flux_writer: The writer of the batch export of the fluxes, or None (Default: None)
+    :param results_index: The results index, or None (Default: None)
+    :param batch_report: The report of the batch, or None (Default: None)
+
+    :type file_name: str
+    :type model_key: str
+    :type status: str
+    :type reason: str
+    :type flux_writer: rpFluxExport.rpFluxWriter
+    :type results_index: rpResultsIndex.rpResultsIndex
+    :type batch_report: rpBatchReport
+
+    :return: None
+    :rtype: None
+    """
+    if flux_writer is not None:
+        flux_writer.write(file_name, [{'objective': '', 'value': None, 'status': status, 'pathway': {}}])
+    if results_index is not None:
+        results_index.addModel(file_name, model_key, status=status)
+    if batch_report is not None:
+        batch_report.add(file_name, status, reason)
+
+
+def _getCached(cache, cache_key, export_fluxes=None):
+    """Return the cached output of a model and, if the results are exported, its results
+
+    :param cache: Cache of the output models
+    :param cache_key: The key of the model
+    :param export_fluxes: The export_fluxes mode of singleFBA() (Default: None)
+
+    :type cache: rpCache
+    :type cache_key: str
+    :type export_fluxes: str
+
+    :return: Tuple of the output SBML and the results of the model (None if not exported), None if the model is not cached
+    :rtype: tuple
+    """
+    sbml_out = cache.get(cache_key)
+    if sbml_out is None:
+        return None
+    if not export_fluxes:
+        return sbml_out, None
+    results = cache.get(rpCache.hashKey(cache_key, 'results', export_fluxes))
+    if results is None:
+        #cached by a run that did not export the results
+        return None
+    return sbml_out, json.loads(results)
+
+
+def _putCached(cache, cache_key, sbml_out, results=None, export_fluxes=None):
+    """Add the output of a model and, if the results are exported, its results to the cache
+
+    :param cache: Cache of the output models
+    :param cache_key: The key of the model
+    :param sbml_out: The output SBML
+    :param results: The results of the model returned by singleFBA() (Default: None)
+    :param export_fluxes: The export_fluxes mode of singleFBA() (Default: None)
+
+    :type cache: rpCache
+    :type cache_key: str
+    :type sbml_out: str
+    :type results: dict
+    :type export_fluxes: str
+
+    :return: None
+    :rtype: None
+    """
+    cache.put(cache_key, sbml_out)
+    if export_fluxes:
+        cache.put(rpCache.hashKey(cache_key, 'results', export_fluxes), json.dumps(results))
 
 
 ##
@@ -396,13 +1064,27 @@ def runFBA_hdd(inputTar,
                compartment_id='MNXC3',
                fill_orphan_species=False,
                species_group_id='central_species',
-               sink_species_group_id='rp_sink_species'):
+               sink_species_group_id='rp_sink_species',
+               share_gem=False,
+               cache=None,
+               gem_model=None,
+               sweep_fractions=None,
+               envelope_points=20,
+               profile_report=None,
+               flux_writer=None,
+               results_index=None,
+               skip_computed=False,
+               solver_timeout=None,
+               model_timeout=None,
+               crash_retries=1,
+               batch_report=None,
+               journal=None):
     """Subprocess implementation of rpFBA
 
     :param inputTar: Path of the TAR rpSBML files
     :param gem_sbml: Path to the GEM file
     :param outputTar: Path of the TAR output
-    :param sim_type: The type of simulation to use. Available simulation types include: fraction, fba, rpfba
+    :param sim_type: The type of simulation to use. Available simulation types include: fraction, fraction_sweep, envelope, fba, pfba, fva. Several types can be given as a list or separated by commas, in which case their objectives are named obj_<type> (or <objective_id>__<type>)
     :param source_reaction: The reaction id of the source reaction.
     :param target_reaction: The reaction id of the target reaction. Note that if fba or rpfba options are used, then these are ignored
     :param source_coefficient: The source coefficient
@@ -417,6 +1099,20 @@ def runFBA_hdd(inputTar,
     :param fill_orphan_species: Add pseudo reactions that consume/produce single parent species. Note in development
     :param species_group_id: The id of the central species (Default: central_species)
     :param sink_species_group_id: The id of the sink species (Default: rp_sink_species)
+    :param share_gem: Parse the GEM once for the whole batch and apply each pathway to it as a reversible delta. The GEM is loaded in this process and each model still runs in its own forked process, that shares it copy-on-write. Ignored if the processes are not forked (Default: False)
+    :param cache: Cache of the output models, keyed by the input model, the GEM and the parameters. None to disable it (Default: None)
+    :param gem_model: Path to the cobra model of the GEM compiled by compileGEM(), used with share_gem (Default: None)
+    :param sweep_fractions: The fractions of the source optimum of the fraction_sweep simulation (Default: None)
+    :param envelope_points: The maximal number of points of the production envelope of the envelope simulation (Default: 20)
+    :param profile_report: Path to the JSON lines report where the time and memory of each stage of each model is appended. None to disable the profiling (Default: None)
+    :param flux_writer: Writer of the batch export of the results of each objective. None to disable it (Default: None)
+    :param results_index: Index where the results of each model are added, to the run started by the caller. None to disable it (Default: None)
+    :param skip_computed: Skip the models that the results index has already computed with the same GEM and parameters. They are not written to the output (Default: False)
+    :param solver_timeout: Time limit in seconds of each optimisation. The models with an objective that reaches it have the status timed_out in the results index and are not cached (Default: None)
+    :param model_timeout: Wall time in seconds after which the process running a model is killed, the model having the status timed_out in the results index (Default: None)
+    :param crash_retries: Number of times a model whose process crashed (ex: segmentation fault) is run again in a new process. A model that crashes every time has the status quarantined in the results index and is skipped by the following runs with skip_computed (Default: 1)
+    :param batch_report: Report where the outcome of each model is added. None to disable it (Default: None)
+    :param journal: Journal of the completed models of an interrupted batch. If given, the models that it lists are skipped and the outputs are added to it instead of outputTar, the caller assembling the archive (Default: None)
 
     :type inputTar: str 
     :type gem_sbml: str
@@ -436,56 +1132,157 @@ def runFBA_hdd(inputTar,
     :type fill_orphan_species: bool
     :type species_group_id: str
     :type sink_species_group_id: str
+    :type share_gem: bool
+    :type cache: rpCache
+    :type gem_model: str
+    :type sweep_fractions: list
+    :type envelope_points: int
+    :type profile_report: str
+    :type flux_writer: rpFluxExport.rpFluxWriter
+    :type results_index: rpResultsIndex.rpResultsIndex
+    :type skip_computed: bool
+    :type solver_timeout: float
+    :type model_timeout: float
+    :type crash_retries: int
+    :type batch_report: rpBatchReport
+    :type journal: rpJournal.rpJournal
 
     :return: Succcess or failure of the function
     :rtype: bool
     """
-    with tempfile.TemporaryDirectory() as tmpOutputFolder:
-        with tempfile.TemporaryDirectory() as tmpInputFolder:
-            tar = tarfile.open(inputTar, mode='r')
-            tar.extractall(path=tmpInputFolder)
-            tar.close()
-            if len(glob.glob(tmpInputFolder+'/*'))==0:
-                logging.error('Input file is empty')
+    export_fluxes = _exportMode(flux_writer, results_index, cache is not None and bool(solver_timeout))
+    if journal is not None:
+        #the outputs are added to the journal, that is closed by the caller
+        output_writer = contextlib.nullcontext(journal)
+    else:
+        output_writer = rpTarWriter(outputTar, profile_report=profile_report)
+    with output_writer as writer, contextlib.ExitStack() as gem_stack:
+        if share_gem and multiprocessing.get_start_method()=='fork':
+            #the GEM is loaded once in this process and each model runs in a forked process, so that a crash of the solver does not stop the batch
+            _initSharedGEM(gem_sbml, gem_model)
+            gem_stack.callback(_resetSharedGEM)
+            if _gem_base is None:
                 return False
-            #open the model as a string
-            for sbml_path in glob.glob(tmpInputFolder+'/*'):
-                fileName = sbml_path.split('/')[-1].replace('.sbml', '').replace('.xml', '').replace('.rpsbml', '')
-                logging.debug('############## '+str(fileName)+' ################')
+            #keep the garbage collector from writing to the pages of the GEM objects in the forked processes
+            gc.freeze()
+            gem_stack.callback(gc.unfreeze)
+            single_func = functools.partial(singleFBA_shared_hdd, process_timeout=model_timeout)
+        else:
+            if share_gem:
+                logging.warning('The processes are not forked, each model is merged with the GEM instead of sharing it')
+            single_func = functools.partial(singleFBA_hdd, process_timeout=model_timeout)
+        if cache is not None or results_index is not None:
+            gem_hash = rpCache.hashFile(gem_sbml)
+            cache_params = (sim_type,
+                            source_reaction,
+                            target_reaction,
+                            source_coefficient,
+                            target_coefficient,
+                            isMax,
+                            fraction_of,
+                            dont_merge,
+                            pathway_id,
+                            objective_id,
+                            compartment_id,
+                            fill_orphan_species,
+                            species_group_id,
+                            sink_species_group_id,
+                            sweep_fractions,
+                            envelope_points)
+        num_models = 0
+        num_skipped = 0
+        num_resumed = 0
+        #the models are read one at a time from the archive
+        for fileName, sbml_string in readTar(inputTar, profile_report):
+            num_models += 1
+            logging.debug('############## '+str(fileName)+' ################')
+            if journal is not None and journal.isDone(fileName):
+                logging.debug('Skipping '+str(fileName)+', completed by a previous run')
+                num_resumed += 1
+                if batch_report is not None:
+                    batch_report.add(fileName, 'resumed')
+                continue
+            model_key = None
+            if cache is not None or results_index is not None:
+                model_key = rpCache.hashKey(gem_hash, fileName, sbml_string, *cache_params)
+            if skip_computed and results_index is not None and results_index.isComputed(model_key, ('success', 'quarantined')):
+                logging.debug('Skipping '+str(fileName)+', already computed or quarantined with the same parameters')
+                num_skipped += 1
+                if batch_report is not None:
+                    batch_report.add(fileName, 'skipped')
+                continue
+            if cache is not None:
+                cached = _getCached(cache, model_key, export_fluxes)
+                if cached is not None:
+                    logging.debug('Using the cached results of '+str(fileName))
+                    writer.write(fileName, cached[0])
+                    if export_fluxes:
+                        _recordModel(fileName, model_key, cached[1], flux_writer, results_index)
+                    if batch_report is not None:
+                        batch_report.add(fileName, 'cached')
+                    continue
+            if _gem_base is not None:
+                #the SBML of the GEM is parsed in this process before the first model is forked, rather than by every model
+                _gem_base.document
+            #a model that crashes is run again in a new process
+            for attempt in range(crash_retries+1):
                 try:
                     #logging.debug('Running single FBA with the following parameters:')
                     #logging.debug('\t')
-                    singleFBA_hdd(fileName,
-                                  sbml_path,
-                                  gem_sbml,
-                                  sim_type,
-                                  source_reaction,
-                                  target_reaction,
-                                  source_coefficient,
-                                  target_coefficient,
-                                  isMax,
-                                  fraction_of,
-                                  tmpOutputFolder,
-                                  dont_merge,
-                                  pathway_id,
-                                  objective_id,
-                                  compartment_id,
-                                  fill_orphan_species,
-                                  species_group_id,
-                                  sink_species_group_id)
+                    result = single_func(fileName,
+                                         sbml_string,
+                                         gem_sbml,
+                                         sim_type,
+                                         source_reaction,
+                                         target_reaction,
+                                         source_coefficient,
+                                         target_coefficient,
+                                         isMax,
+                                         fraction_of,
+                                         None,
+                                         dont_merge,
+                                         pathway_id,
+                                         objective_id,
+                                         compartment_id,
+                                         fill_orphan_species,
+                                         species_group_id,
+                                         sink_species_group_id,
+                                         sweep_fractions,
+                                         envelope_points,
+                                         profile_report,
+                                         export_fluxes,
+                                         solver_timeout)
+                    sbml_out, results = result if result and export_fluxes else (result, None)
+                    if sbml_out:
+                        writer.write(fileName, sbml_out)
+                        _recordModel(fileName, model_key, results, flux_writer, results_index, batch_report)
+                        if cache is not None and _modelStatus(results)=='success':
+                            _putCached(cache, model_key, sbml_out, results, export_fluxes)
+                    else:
+                        _recordFailure(fileName, model_key, 'failed', 'No output model', flux_writer, results_index, batch_report)
+                #TimeoutError is a subclass of OSError
+                except TimeoutError as e:
+                    logging.warning('Timed out running the model '+str(fileName)+': '+str(e))
+                    _recordFailure(fileName, model_key, 'timed_out', str(e), flux_writer, results_index, batch_report)
                 except OSError as e:
                     logging.warning(e)
                     logging.warning('Segmentation fault by Cobrapy')
-                    pass
-            if len(glob.glob(tmpOutputFolder+'/*'))==0:
-                logging.error('rpFBA has not produced any results')
-                return False
-            with tarfile.open(outputTar, mode='w:gz') as ot:
-                for sbml_path in glob.glob(tmpOutputFolder+'/*'):
-                    fileName = str(sbml_path.split('/')[-1].replace('.sbml', '').replace('.xml', '').replace('.rpsbml', ''))+'.sbml.xml'
-                    info = tarfile.TarInfo(fileName)
-                    info.size = os.path.getsize(sbml_path)
-                    ot.addfile(tarinfo=info, fileobj=open(sbml_path, 'rb'))
+                    if attempt<crash_retries:
+                        logging.warning('Running the model '+str(fileName)+' again in a new process')
+                        continue
+                    #crashed again in a new process, the model is not run by the following runs with skip_computed
+                    _recordFailure(fileName, model_key, 'quarantined' if crash_retries else 'crashed', str(e), flux_writer, results_index, batch_report)
+                break
+        if num_models==0:
+            logging.error('Input file is empty')
+            return False
+        if num_skipped:
+            logging.info('Skipped '+str(num_skipped)+' models already computed with the same parameters')
+        if num_resumed:
+            logging.info('Skipped '+str(num_resumed)+' models completed by a previous run')
+    if writer.num_models==0 and num_skipped<num_models:
+        logging.error('rpFBA has not produced any results')
+        return False
     return True
 
 
@@ -511,13 +1308,30 @@ def runFBA_multi(inputTar,
                  compartment_id='MNXC3',
                  fill_orphan_species=False,
                  species_group_id='central_species',
-                 sink_species_group_id='rp_sink_species'):
+                 sink_species_group_id='rp_sink_species',
+                 share_gem=False,
+                 max_tasks_per_worker=100,
+                 max_worker_rss=None,
+                 cache=None,
+                 gem_model=None,
+                 sweep_fractions=None,
+                 envelope_points=20,
+                 profile_report=None,
+                 flux_writer=None,
+                 results_index=None,
+                 skip_computed=False,
+                 schedule_lookahead=1000,
+                 solver_timeout=None,
+                 model_timeout=None,
+                 crash_retries=1,
+                 batch_report=None,
+                 journal=None):
     """Subprocess implementation of rpFBA
 
     :param inputTar: Path of the TAR rpSBML files
     :param gem_sbml: Path to the GEM file
     :param outputTar: Path of the TAR output
-    :param sim_type: The type of simulation to use. Available simulation types include: fraction, fba, rpfba
+    :param sim_type: The type of simulation to use. Available simulation types include: fraction, fraction_sweep, envelope, fba, pfba, fva. Several types can be given as a list or separated by commas, in which case their objectives are named obj_<type> (or <objective_id>__<type>)
     :param source_reaction: The reaction id of the source reaction.
     :param target_reaction: The reaction id of the target reaction. Note that if fba or rpfba options are used, then these are ignored
     :param source_coefficient: The source coefficient
@@ -532,6 +1346,23 @@ def runFBA_multi(inputTar,
     :param fill_orphan_species: Add pseudo reactions that consume/produce single parent species. Note in development
     :param species_group_id: The id of the central species (Default: central_species)
     :param sink_species_group_id: The id of the sink species (Default: rp_sink_species)
+    :param share_gem: Parse the GEM once for the whole batch and apply each pathway to it as a reversible delta. The GEM is loaded before the workers are forked so that they share it copy-on-write (Default: False)
+    :param max_tasks_per_worker: Number of models after which a worker process is replaced, to contain the cobrapy memory leak (Default: 100)
+    :param max_worker_rss: Resident memory in MB above which a worker process is replaced (Default: None)
+    :param cache: Cache of the output models, keyed by the input model, the GEM and the parameters. None to disable it (Default: None)
+    :param gem_model: Path to the cobra model of the GEM compiled by compileGEM(), used with share_gem (Default: None)
+    :param sweep_fractions: The fractions of the source optimum of the fraction_sweep simulation (Default: None)
+    :param envelope_points: The maximal number of points of the production envelope of the envelope simulation (Default: 20)
+    :param profile_report: Path to the JSON lines report where the time and memory of each stage of each model is appended. None to disable the profiling (Default: None)
+    :param flux_writer: Writer of the batch export of the results of each objective. None to disable it (Default: None)
+    :param results_index: Index where the results of each model are added, to the run started by the caller. None to disable it (Default: None)
+    :param skip_computed: Skip the models that the results index has already computed with the same GEM and parameters. They are not written to the output (Default: False)
+    :param schedule_lookahead: The number of models read ahead from the archive and dispatched to the workers by decreasing estimated cost (see modelCost()). 0 to dispatch the models in the order of the archive (Default: 1000)
+    :param solver_timeout: Time limit in seconds of each optimisation. The models with an objective that reaches it have the status timed_out in the results index and are not cached (Default: None)
+    :param model_timeout: Wall time in seconds after which the worker running a model is killed and replaced, the model having the status timed_out in the results index (Default: None)
+    :param crash_retries: Number of times a model whose worker died (ex: segmentation fault, killed when out of memory) is run again, each time in a new worker. A model that crashes every time has the status quarantined in the results index and is skipped by the following runs with skip_computed (Default: 1)
+    :param batch_report: Report where the outcome of each model is added. None to disable it (Default: None)
+    :param journal: Journal of the completed models of an interrupted batch. If given, the models that it lists are skipped and the outputs are added to it instead of outputTar, the caller assembling the archive (Default: None)
 
     :type inputTar: str 
     :type gem_sbml: str
@@ -551,56 +1382,208 @@ def runFBA_multi(inputTar,
     :type fill_orphan_species: bool
     :type species_group_id: str
     :type sink_species_group_id: str
+    :type share_gem: bool
+    :type max_tasks_per_worker: int
+    :type max_worker_rss: float
+    :type cache: rpCache
+    :type gem_model: str
+    :type sweep_fractions: list
+    :type envelope_points: int
+    :type profile_report: str
+    :type flux_writer: rpFluxExport.rpFluxWriter
+    :type results_index: rpResultsIndex.rpResultsIndex
+    :type skip_computed: bool
+    :type schedule_lookahead: int
+    :type solver_timeout: float
+    :type model_timeout: float
+    :type crash_retries: int
+    :type batch_report: rpBatchReport
+    :type journal: rpJournal.rpJournal
 
     :return: Succcess or failure of the function
     :rtype: bool
     """
-    with tempfile.TemporaryDirectory() as tmpOutputFolder:
-        with tempfile.TemporaryDirectory() as tmpInputFolder:
-            tar = tarfile.open(inputTar, mode='r')
-            tar.extractall(path=tmpInputFolder)
-            tar.close()
-            if len(glob.glob(tmpInputFolder+'/*'))==0:
-                logging.error('Input file is empty')
-                return False
-            #HERE SPECIFY THE NUMBER OF CORES
-            pool = nonDeamonicPool(processes=num_workers)
-            results = []
-            for sbml_path in glob.glob(tmpInputFolder+'/*'):
-                file_name = sbml_path.split('/')[-1].replace('.sbml', '').replace('.xml', '').replace('.rpsbml', '')
-                results.append(pool.apply_async(singleFBA_hdd, args=(file_name,
-                                                                     sbml_path,
-                                                                     gem_sbml,
-                                                                     sim_type,
-                                                                     source_reaction,
-                                                                     target_reaction,
-                                                                     source_coefficient,
-                                                                     target_coefficient,
-                                                                     is_max,
-                                                                     fraction_of,
-                                                                     tmpOutputFolder,
-                                                                     dont_merge,
-                                                                     pathway_id,
-                                                                     objective_id,
-                                                                     compartment_id,
-                                                                     fill_orphan_species,
-                                                                     species_group_id,
-                                                                     sink_species_group_id,)))
-            output = [p.get() for p in results]
-            pool.close()
-            pool.join()
-            if len(glob.glob(tmpOutputFolder+'/*'))==0:
-                logging.error('rpFBA has not produced any results')
+    export_fluxes = _exportMode(flux_writer, results_index, cache is not None and bool(solver_timeout))
+    if journal is not None:
+        #the outputs are added to the journal, that is closed by the caller
+        output_writer = contextlib.nullcontext(journal)
+    else:
+        output_writer = rpTarWriter(outputTar, profile_report=profile_report)
+    with output_writer as writer:
+        is_forked_gem = False
+        if share_gem and multiprocessing.get_start_method()=='fork':
+            #the GEM is loaded in this process before the workers are forked, so that they share its pages copy-on-write
+            _initSharedGEM(gem_sbml, gem_model)
+            if _gem_base is None:
                 return False
-            with tarfile.open(outputTar, mode='w:gz') as ot:
-                for sbml_path in glob.glob(tmpOutputFolder+'/*'):
-                    file_name = str(sbml_path.split('/')[-1].replace('.sbml', '').replace('.xml', '').replace('.rpsbml', ''))+'.sbml.xml'
-                    info = tarfile.TarInfo(file_name)
-                    info.size = os.path.getsize(sbml_path)
-                    ot.addfile(tarinfo=info, fileobj=open(sbml_path, 'rb'))
+            #keep the garbage collector from writing to the pages of the GEM objects in the workers
+            gc.freeze()
+            is_forked_gem = True
+            initializer, initargs, single_func = None, (), singleFBA_shared
+        elif share_gem:
+            #each worker parses the GEM once and keeps it for all its models
+            initializer, initargs, single_func = _initSharedGEM, (gem_sbml, gem_model), singleFBA_shared
+        else:
+            initializer, initargs, single_func = None, (), singleFBA
+        #only the model name and content differ between the models, the other arguments are passed once per worker
+        common_args = (gem_sbml,
+                       sim_type,
+                       source_reaction,
+                       target_reaction,
+                       source_coefficient,
+                       target_coefficient,
+                       is_max,
+                       fraction_of,
+                       None,
+                       dont_merge,
+                       pathway_id,
+                       objective_id,
+                       compartment_id,
+                       fill_orphan_species,
+                       species_group_id,
+                       sink_species_group_id,
+                       sweep_fractions,
+                       envelope_points,
+                       profile_report,
+                       export_fluxes,
+                       solver_timeout)
+        models = readTar(inputTar, profile_report)
+        num_cached = 0
+        num_skipped = 0
+        num_resumed = 0
+        if cache is not None or results_index is not None:
+            gem_hash = rpCache.hashFile(gem_sbml)
+            #all the parameters except the GEM path, the output folder, the profile report, the export mode and the solver time limit
+            cache_params = common_args[1:8]+common_args[9:-3]
+        if cache is not None or (skip_computed and results_index is not None) or journal is not None:
+            def _uncachedModels(models):
+                """Write the outputs of the cached models, skip the computed and completed ones and only yield the others"""
+                nonlocal num_cached, num_skipped, num_resumed
+                for file_name, sbml_string in models:
+                    if journal is not None and journal.isDone(file_name):
+                        logging.debug('Skipping '+str(file_name)+', completed by a previous run')
+                        num_resumed += 1
+                        if batch_report is not None:
+                            batch_report.add(file_name, 'resumed')
+                        continue
+                    if cache is None and results_index is None:
+                        yield file_name, sbml_string
+                        continue
+                    model_key = rpCache.hashKey(gem_hash, file_name, sbml_string, *cache_params)
+                    if skip_computed and results_index is not None and results_index.isComputed(model_key, ('success', 'quarantined')):
+                        logging.debug('Skipping '+str(file_name)+', already computed or quarantined with the same parameters')
+                        num_skipped += 1
+                        if batch_report is not None:
+                            batch_report.add(file_name, 'skipped')
+                        continue
+                    cached = _getCached(cache, model_key, export_fluxes) if cache is not None else None
+                    if cached is None:
+                        yield file_name, sbml_string
+                    else:
+                        logging.debug('Using the cached results of '+str(file_name))
+                        writer.write(file_name, cached[0])
+                        if export_fluxes:
+                            _recordModel(file_name, model_key, cached[1], flux_writer, results_index)
+                        if batch_report is not None:
+                            batch_report.add(file_name, 'cached')
+                        num_cached += 1
+            models = _uncachedModels(models)
+        if is_forked_gem:
+            def _parsedGEM(models):
+                """Parse the SBML of the GEM before the first model is dispatched, and so before the workers are forked"""
+                for model in models:
+                    _gem_base.document
+                    yield model
+            models = _parsedGEM(models)
+        #HERE SPECIFY THE NUMBER OF CORES
+        num_models = 0
+        try:
+            with rpPool.rpPool(single_func,
+                               common_args,
+                               num_workers,
+                               max_tasks=max_tasks_per_worker,
+                               max_rss=max_worker_rss,
+                               initializer=initializer,
+                               initargs=initargs,
+                               task_timeout=model_timeout,
+                               retries=crash_retries) as pool:
+                #the models are handed to the workers as they are read from the archive, the most expensive of the models read ahead first
+                #readTar() is a generator, the chunks are sized from the number of models counted in the archive headers
+                num_tasks = countTar(inputTar)
+                if schedule_lookahead:
+                    pool_results = pool.imap_unordered(models, cost=modelCost, lookahead=int(schedule_lookahead), num_tasks=num_tasks)
+                else:
+                    pool_results = pool.imap_unordered(models, num_tasks=num_tasks)
+                for task, result, error, status in pool_results:
+                    num_models += 1
+                    model_key = None
+                    if cache is not None or results_index is not None:
+                        model_key = rpCache.hashKey(gem_hash, task[0], task[1], *cache_params)
+                    if error:
+                        logging.warning('Failed to run the model '+str(task[0])+': '+str(error))
+                        if status=='crashed' and crash_retries:
+                            #crashed again in a new worker, the model is not run by the following runs with skip_computed
+                            status = 'quarantined'
+                        _recordFailure(task[0], model_key, status, error, flux_writer, results_index, batch_report)
+                    elif result:
+                        sbml_out, results = result if export_fluxes else (result, None)
+                        #the output is appended to the archive as soon as the model completes
+                        writer.write(task[0], sbml_out)
+                        _recordModel(task[0], model_key, results, flux_writer, results_index, batch_report)
+                        if cache is not None and _modelStatus(results)=='success':
+                            _putCached(cache, model_key, sbml_out, results, export_fluxes)
+                    else:
+                        _recordFailure(task[0], model_key, 'failed', 'No output model', flux_writer, results_index, batch_report)
+        except RuntimeError as e:
+            #the workers keep failing to start (ex: the GEM cannot be loaded)
+            logging.error(str(e))
+            return False
+        finally:
+            if is_forked_gem:
+                gc.unfreeze()
+                _resetSharedGEM()
+        if num_models+num_cached+num_skipped+num_resumed==0:
+            logging.error('Input file is empty')
+            return False
+        if num_skipped:
+            logging.info('Skipped '+str(num_skipped)+' models already computed with the same parameters')
+        if num_resumed:
+            logging.info('Skipped '+str(num_resumed)+' models completed by a previous run')
+    if writer.num_models==0 and num_models+num_cached>0:
+        logging.error('rpFBA has not produced any results')
+        return False
     return True
 
 
+def enrichGEM(gem_sbml, output_folder, gem_cache=None):
+    """Add the InChIKey cross-references to the species of the GEM using inchikeyMIRIAM
+
+    The enriched GEM is cached, keyed by the content of the GEM and the version of inchikeyMIRIAM (the hash of its source), so that an unchanged GEM is only enriched once
+
+    :param gem_sbml: Path to the GEM file
+    :param output_folder: Folder where the enriched GEM is written if it is not cached
+    :param gem_cache: Cache of the enriched GEMs. None to disable it (Default: None)
+
+    :type gem_sbml: str
+    :type output_folder: str
+    :type gem_cache: rpCache
+
+    :return: Path to the enriched GEM
+    :rtype: str
+    """
+    if gem_cache is not None:
+        gem_key = rpCache.hashKey(rpCache.hashFile(gem_sbml), rpCache.hashFile(inchikeyMIRIAM.__file__))
+        gem_path = gem_cache.getPath(gem_key)
+        if gem_path is not None:
+            logging.debug('Using the cached enriched GEM: '+str(gem_path))
+            return gem_path
+    inchikey_enriched_gem_sbml = os.path.join(output_folder, 'tmp.sbml')
+    inchikeyMIRIAM.main(gem_sbml, inchikey_enriched_gem_sbml)
+    if gem_cache is not None:
+        return gem_cache.putFile(gem_key, inchikey_enriched_gem_sbml)
+    return inchikey_enriched_gem_sbml
+
+
 def main(input_path,
          gem_sbml,
          output_path,
@@ -618,13 +1601,32 @@ def main(input_path,
          compartment_id='MNXC3',
          fill_orphan_species=None,
          species_group_id='central_species',
-         sink_species_group_id='rp_sink_species'):
+         sink_species_group_id='rp_sink_species',
+         share_gem=False,
+         max_tasks_per_worker=100,
+         max_worker_rss=None,
+         cache_dir=None,
+         cache_size=1024,
+         clear_cache=False,
+         sweep_fractions='0.1:0.95:0.05',
+         envelope_points=20,
+         profile_report=None,
+         flux_export=None,
+         flux_export_full=False,
+         results_db=None,
+         skip_computed=False,
+         schedule_lookahead=1000,
+         solver_timeout=None,
+         model_timeout=None,
+         crash_retries=1,
+         batch_report=None,
+         work_dir=None):
     """Run rpFBA on a collection of rpSBML files
 
     :param input_path: Path of the TAR rpSBML files
     :param gem_sbml: Path to the GEM file
     :param output_path: Path of the TAR rpSBML output files
-    :param sim_type: The type of simulation to use. Available simulation types include: fraction, fba, rpfba
+    :param sim_type: The type of simulation to use. Available simulation types include: fraction, fraction_sweep, envelope, fba, pfba, fva. Several types can be given as a list or separated by commas, in which case their objectives are named obj_<type> (or <objective_id>__<type>)
     :param source_reaction: The reaction id of the source reaction.
     :param target_reaction: The reaction id of the target reaction. Note that if fba or rpfba options are used, then these are ignored
     :param source_coefficient: The source coefficient
@@ -639,6 +1641,25 @@ def main(input_path,
     :param fill_orphan_species: Add pseudo reactions that consume/produce single parent species. Note in development
     :param species_group_id: The id of the central species (Default: central_species)
     :param sink_species_group_id: The id of the sink species (Default: rp_sink_species)
+    :param share_gem: Parse the GEM once for the whole batch and apply each pathway to it as a reversible delta. The GEM is loaded before the workers are forked so that they share it copy-on-write (Default: False)
+    :param max_tasks_per_worker: Number of models after which a worker process is replaced, to contain the cobrapy memory leak (Default: 100)
+    :param max_worker_rss: Resident memory in MB above which a worker process is replaced (Default: None)
+    :param cache_dir: Folder of the cache of the output models and of the enriched and compiled GEMs (the compiled GEM is only used with share_gem). The folders of the cache are made private to the user. None to disable the cache (Default: None)
+    :param cache_size: Maximal size of the cache of the output models in MB, the least recently used models are removed above it (Default: 1024)
+    :param clear_cache: Remove all the output models and GEMs of the cache before running (Default: False)
+    :param sweep_fractions: The fractions of the source optimum of the fraction_sweep simulation, as a range start:stop:step or a comma separated list (Default: 0.1:0.95:0.05)
+    :param envelope_points: The maximal number of points of the production envelope of the envelope simulation (Default: 20)
+    :param profile_report: Path to the JSON lines report of the wall time, CPU time, RSS and RSS change of each stage of each model, and of the status and iterations of the solver. A summary of the batch is written next to it (<report>.summary.json). None to disable the profiling (Default: None)
+    :param flux_export: Path of a columnar export (.npz, see rpFluxExport) of the results of the batch, with one row per model and objective: objective value, solver status and fluxes of the heterologous pathway reactions. None to disable it (Default: None)
+    :param flux_export_full: Export the fluxes of all the reactions of the models instead of only the heterologous pathway (Default: False)
+    :param results_db: Path to the SQLite results index (see rpResultsIndex) where the parameters of the run and the status, wall time, objective values and fluxes of each model are added. None to disable it (Default: None)
+    :param skip_computed: Skip the models that have already been computed with the same GEM and parameters by a run of the results index. They are not written to the output (Default: False)
+    :param schedule_lookahead: The number of models read ahead from the archive and dispatched to the workers by decreasing estimated cost, to shorten the batch when the pathways have very different sizes. 0 to dispatch the models in the order of the archive (Default: 1000)
+    :param solver_timeout: Time limit in seconds of each optimisation, after which the objective has the status time_limit and the model the status timed_out. None for no limit (Default: None)
+    :param model_timeout: Wall time in seconds after which the process running a model is killed, the model having the status timed_out and not being written to the output. None for no limit (Default: None)
+    :param crash_retries: Number of times a model whose process crashed (ex: segmentation fault, killed when out of memory) is run again in a new process before being quarantined: it is not written to the output and is skipped by the following runs with skip_computed (Default: 1)
+    :param batch_report: Path of a JSON report of the batch with the number of models of each status (success, cached, skipped, resumed, failed, crashed, quarantined, timed_out), the number of failures of each reason and the failed models. None to disable it (Default: None)
+    :param work_dir: Persistent work folder where the outputs of the completed models are journaled. If the batch is interrupted, running it again with the same inputs, parameters and work folder skips the models already completed. The output archive is assembled from the journal at the end of the run. None to write the outputs directly to the output archive (Default: None)
 
     :type input_path: str 
     :type gem_sbml: str
@@ -658,20 +1679,90 @@ def main(input_path,
     :type fill_orphan_species: bool
     :type species_group_id: str
     :type sink_species_group_id: str
+    :type share_gem: bool
+    :type max_tasks_per_worker: int
+    :type max_worker_rss: float
+    :type cache_dir: str
+    :type cache_size: float
+    :type clear_cache: bool
+    :type sweep_fractions: str
+    :type envelope_points: int
+    :type profile_report: str
+    :type flux_export: str
+    :type flux_export_full: bool
+    :type results_db: str
+    :type skip_computed: bool
+    :type schedule_lookahead: int
+    :type solver_timeout: float
+    :type model_timeout: float
+    :type crash_retries: int
+    :type batch_report: str
+    :type work_dir: str
 
     :return: Succcess or failure of the function
     :rtype: bool
     """
-    with tempfile.TemporaryDirectory() as tmpInputFolder:
-        inchikey_enriched_gem_sbml = os.path.join(tmpInputFolder, 'tmp.sbml')
-        inchikeyMIRIAM.main(gem_sbml, inchikey_enriched_gem_sbml) 
+    cache = None
+    gem_cache = None
+    if cache_dir:
+        cache = rpCache.rpCache(os.path.join(cache_dir, 'models'), cache_size)
+        gem_cache = rpCache.rpCache(os.path.join(cache_dir, 'gems'))
+        if clear_cache:
+            cache.clear()
+            gem_cache.clear()
+    if profile_report:
+        #start a new report for this batch
+        open(profile_report, 'w').close()
+    flux_writer = None
+    results_index = None
+    journal = None
+    report = rpBatchReport() if batch_report else None
+    #the parameters that change the outputs of the models
+    run_params = {'sim_type': sim_type,
+                  'source_reaction': source_reaction,
+                  'target_reaction': target_reaction,
+                  'source_coefficient': source_coefficient,
+                  'target_coefficient': target_coefficient,
+                  'is_max': is_max,
+                  'fraction_of': fraction_of,
+                  'dont_merge': dont_merge,
+                  'pathway_id': pathway_id,
+                  'objective_id': objective_id,
+                  'compartment_id': compartment_id,
+                  'species_group_id': species_group_id,
+                  'sink_species_group_id': sink_species_group_id,
+                  'sweep_fractions': sweep_fractions,
+                  'envelope_points': envelope_points,
+                  'solver_timeout': solver_timeout}
+    with contextlib.ExitStack() as stack:
+        tmpInputFolder = stack.enter_context(tempfile.TemporaryDirectory())
+        if flux_export:
+            flux_writer = stack.enter_context(rpFluxExport.rpFluxWriter(flux_export, bool(flux_export_full)))
+        if results_db or work_dir:
+            gem_hash = rpCache.hashFile(gem_sbml)
+        if results_db:
+            results_index = stack.enter_context(rpResultsIndex.rpResultsIndex(results_db))
+            results_index.startRun(input_path,
+                                   output_path,
+                                   gem_hash,
+                                   dict(run_params,
+                                        share_gem=share_gem,
+                                        num_workers=num_workers,
+                                        model_timeout=model_timeout))
+        if work_dir:
+            #the journal of the batch is identified by its inputs and parameters
+            fingerprint = rpCache.hashKey(rpCache.hashFile(input_path), gem_hash, json.dumps(run_params, sort_keys=True, default=str))
+            journal = stack.enter_context(rpJournal.rpJournal(work_dir, fingerprint))
+            if journal.num_resumed:
+                logging.info('Resuming the batch of '+str(journal.run_dir)+', '+str(journal.num_resumed)+' models have already been completed')
+        inchikey_enriched_gem_sbml = enrichGEM(gem_sbml, tmpInputFolder, gem_cache)
+        gem_model = None
+        if share_gem:
+            #the cobra model of the GEM is built once and loaded by all the workers
+            gem_model = compileGEM(inchikey_enriched_gem_sbml, tmpInputFolder, gem_cache)
         ##### count the number of files that are within the files ####
-        num_models = 0
-        with tempfile.TemporaryDirectory() as tmpCountFolder:
-            tar = tarfile.open(input_path, mode='r')
-            tar.extractall(path=tmpCountFolder)
-            num_models = len(glob.glob(tmpCountFolder+'/*'))
-            tar.close() 
+        #only need to know if there are 0, 1 or more models
+        num_models = countTar(input_path, 2)
         if num_models==0:
             logging.warning('The input tar file seems to be empty')
         #outputTar_obj = io.BytesIO()
@@ -679,7 +1770,7 @@ def main(input_path,
             runFBA_hdd(input_path,
                        inchikey_enriched_gem_sbml,
                        output_path,
-                       str(sim_type),
+                       ','.join(parseSimType(sim_type)),
                        str(source_reaction),
                        str(target_reaction),
                        float(source_coefficient),
@@ -692,13 +1783,26 @@ def main(input_path,
                        str(compartment_id),
                        fill_orphan_species,
                        str(species_group_id),
-                       str(sink_species_group_id))
-            return True
+                       str(sink_species_group_id),
+                       bool(share_gem),
+                       cache,
+                       gem_model,
+                       parseFractions(sweep_fractions),
+                       int(envelope_points),
+                       profile_report,
+                       flux_writer,
+                       results_index,
+                       bool(skip_computed),
+                       float(solver_timeout) if solver_timeout else None,
+                       float(model_timeout) if model_timeout else None,
+                       int(crash_retries),
+                       report,
+                       journal)
         elif num_workers>1:
             runFBA_multi(input_path,
                          inchikey_enriched_gem_sbml,
                          output_path,
-                         str(sim_type),
+                         ','.join(parseSimType(sim_type)),
                          str(source_reaction),
                          str(target_reaction),
                          float(source_coefficient),
@@ -712,8 +1816,37 @@ def main(input_path,
                          str(compartment_id),
                          fill_orphan_species,
                          str(species_group_id),
-                         str(sink_species_group_id))
-            return True
+                         str(sink_species_group_id),
+                         bool(share_gem),
+                         max_tasks_per_worker,
+                         max_worker_rss,
+                         cache,
+                         gem_model,
+                         parseFractions(sweep_fractions),
+                         int(envelope_points),
+                         profile_report,
+                         flux_writer,
+                         results_index,
+                         bool(skip_computed),
+                         int(schedule_lookahead),
+                         float(solver_timeout) if solver_timeout else None,
+                         float(model_timeout) if model_timeout else None,
+                         int(crash_retries),
+                         report,
+                         journal)
         else:
             logging.error('Cannot have 0 or less workers: '+str(num_workers))
             return False
+        if journal is not None:
+            #the archive is assembled from the outputs of this run and of the previous ones
+            with rpTarWriter(output_path, profile_report=profile_report) as writer:
+                for file_name, path in journal.outputs():
+                    with open(path, 'rb') as infile:
+                        writer.write(file_name, infile.read())
+    if profile_report:
+        rpProfiler.writeSummary(profile_report)
+    if report is not None:
+        report.write(batch_report)
+        if report.failures:
+            logging.warning(str(len(report.failures))+' models have failed, see '+str(batch_report))
+    return True
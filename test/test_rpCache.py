@@ -0,0 +1,69 @@
+import unittest
+import tempfile
+import os
+import sys
+
+sys.path.insert(0, '..')
+
+import rpCache
+
+
+class TestRPCache(unittest.TestCase):
+
+    def test_hashKey(self):
+        self.assertEqual(rpCache.hashKey(b'model', 'fba', 1.0), rpCache.hashKey(b'model', 'fba', 1.0))
+        self.assertNotEqual(rpCache.hashKey(b'model', 'fba', 1.0), rpCache.hashKey(b'model', 'fba', 0.75))
+        self.assertNotEqual(rpCache.hashKey('ab', 'c'), rpCache.hashKey('a', 'bc'))
+
+    def test_get_put(self):
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            cache = rpCache.rpCache(tmp_folder)
+            key = rpCache.hashKey('model')
+            self.assertIsNone(cache.get(key))
+            cache.put(key, '<sbml/>')
+            self.assertEqual(cache.get(key), b'<sbml/>')
+            #the entries persist across instances
+            self.assertEqual(rpCache.rpCache(tmp_folder).get(key), b'<sbml/>')
+            cache.clear()
+            self.assertIsNone(cache.get(key))
+
+    def test_isPrivate(self):
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            cache = rpCache.rpCache(os.path.join(tmp_folder, 'gems'))
+            self.assertEqual(os.stat(cache.cache_dir).st_mode & 0o777, 0o700)
+            path = cache.put(rpCache.hashKey('gem'), b'model')
+            self.assertTrue(rpCache.isPrivate(path))
+            #a file that the other users can write is not trusted
+            os.chmod(path, 0o666)
+            self.assertFalse(rpCache.isPrivate(path))
+            self.assertFalse(rpCache.isPrivate(os.path.join(tmp_folder, 'missing')))
+
+    def test_evict(self):
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            #room for two entries of 0.4 MB
+            cache = rpCache.rpCache(tmp_folder, 1.0)
+            content = b'0'*400000
+            keys = [rpCache.hashKey(i) for i in range(3)]
+            cache.put(keys[0], content)
+            cache.put(keys[1], content)
+            os.utime(cache._path(keys[0]), (0, 0))
+            os.utime(cache._path(keys[1]), (1, 1))
+            #reading the oldest entry makes it the most recently used
+            cache.get(keys[0])
+            cache.put(keys[2], content)
+            self.assertIsNotNone(cache.get(keys[0]))
+            self.assertIsNone(cache.get(keys[1]))
+            self.assertIsNotNone(cache.get(keys[2]))
+            self.assertLessEqual(cache.size, 1048576)
+
+    def test_putFile(self):
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            cache = rpCache.rpCache(os.path.join(tmp_folder, 'cache'))
+            key = rpCache.hashKey('gem')
+            self.assertIsNone(cache.getPath(key))
+            gem_path = os.path.join(tmp_folder, 'gem.sbml')
+            with open(gem_path, 'w') as gem_file:
+                gem_file.write('<sbml/>')
+            entry_path = cache.putFile(key, gem_path)
+            self.assertEqual(cache.getPath(key), entry_path)
+            self.assertEqual(rpCache.hashFile(entry_path), rpCache.hashFile(gem_path))
@@ -0,0 +1,41 @@
+import unittest
+import tempfile
+import math
+import os
+import sys
+
+sys.path.insert(0, '..')
+
+import rpFluxExport
+
+
+class TestRPFluxExport(unittest.TestCase):
+
+    def test_write_read(self):
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            path = os.path.join(tmp_folder, 'fluxes.npz')
+            with rpFluxExport.rpFluxWriter(path, chunk_size=2) as writer:
+                writer.write('model_1', [{'objective': 'obj_fba', 'value': 9.2, 'status': 'optimal', 'pathway': {'RP1': 9.2, 'RP1_sink': 9.2}}])
+                writer.write('model_2', [{'objective': 'obj_fba', 'value': None, 'status': 'infeasible', 'pathway': {'RP1': None}},
+                                         {'objective': 'obj_pfba', 'value': 859.4, 'status': 'optimal', 'pathway': {'RP2': 1.0}}])
+                #the first two chunks are already readable
+                self.assertEqual(len(rpFluxExport.readFluxExport(path)['model']), 3)
+                writer.write('model_3', [{'objective': 'obj_fba', 'value': 1.0, 'status': 'optimal', 'pathway': {'RP1': 1.0}}])
+            columns = rpFluxExport.readFluxExport(path)
+            self.assertEqual(list(columns['model']), ['model_1', 'model_2', 'model_2', 'model_3'])
+            self.assertEqual(list(columns['objective']), ['obj_fba', 'obj_fba', 'obj_pfba', 'obj_fba'])
+            self.assertEqual(list(columns['status']), ['optimal', 'infeasible', 'optimal', 'optimal'])
+            self.assertTrue(math.isnan(columns['value'][1]))
+            self.assertEqual(list(columns['reactions']), ['RP1', 'RP1_sink', 'RP2'])
+            #fluxes of the model_2 obj_pfba row
+            fluxes = {columns['reactions'][i]: v for r, i, v in zip(columns['flux_row'], columns['flux_reaction'], columns['flux_value']) if r==2}
+            self.assertEqual(fluxes, {'RP2': 1.0})
+
+    def test_full_fluxes(self):
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            path = os.path.join(tmp_folder, 'fluxes.npz')
+            with rpFluxExport.rpFluxWriter(path, full_fluxes=True) as writer:
+                writer.write('model_1', [{'objective': 'obj_fba', 'value': 9.2, 'status': 'optimal', 'pathway': {'RP1': 9.2}, 'fluxes': {'RP1': 9.2, 'PGI': 4.8}}])
+            columns = rpFluxExport.readFluxExport(path)
+            self.assertEqual(list(columns['reactions']), ['RP1', 'PGI'])
+            self.assertEqual(list(columns['flux_pathway']), [True, False])
@@ -0,0 +1,42 @@
+import unittest
+import unittest.mock
+import tempfile
+import os
+import sys
+
+sys.path.insert(0, '..')
+
+import rpJournal
+
+
+class TestRPJournal(unittest.TestCase):
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            with rpJournal.rpJournal(tmp_folder, 'abc') as journal:
+                self.assertFalse(journal.isDone('model_1'))
+                journal.write('model_1', '<sbml>1</sbml>')
+                journal.write('model_2', b'<sbml>2</sbml>')
+            #the run is killed while journaling a model
+            with open(journal.path, 'a') as outfile:
+                outfile.write('{"model": "model_3", "pa')
+            with rpJournal.rpJournal(tmp_folder, 'abc') as journal:
+                self.assertEqual(journal.num_resumed, 2)
+                self.assertTrue(journal.isDone('model_2'))
+                self.assertFalse(journal.isDone('model_3'))
+                journal.write('model_3', '<sbml>3</sbml>')
+                outputs = journal.outputs()
+            self.assertEqual([i[0] for i in outputs], ['model_1', 'model_2', 'model_3'])
+            with open(outputs[1][1], 'r') as infile:
+                self.assertEqual(infile.read(), '<sbml>2</sbml>')
+            #other inputs or parameters have their own journal
+            with rpJournal.rpJournal(tmp_folder, 'def') as journal:
+                self.assertEqual(journal.num_models, 0)
+
+    def test_sync(self):
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            with rpJournal.rpJournal(tmp_folder, 'abc') as journal:
+                with unittest.mock.patch('os.fsync', wraps=os.fsync) as fsync:
+                    journal.write('model_1', '<sbml>1</sbml>')
+        #the output, the folder of the outputs and the journal
+        self.assertEqual(fsync.call_count, 3)
@@ -0,0 +1,129 @@
+import unittest
+import tempfile
+import os
+import sys
+import signal
+import time
+
+sys.path.insert(0, '..')
+
+import rpPool
+
+
+def _multiply(value, factor):
+    if value==3:
+        raise ValueError('Cannot multiply 3')
+    return value*factor, os.getpid()
+
+
+def _crash(value):
+    if value==1:
+        os.kill(os.getpid(), signal.SIGSEGV)
+    return value
+
+
+def _crashOnce(value, marker):
+    #crash the first time the task is run only
+    if value==1 and not os.path.exists(marker):
+        open(marker, 'w').close()
+        os.kill(os.getpid(), signal.SIGSEGV)
+    return value, os.getpid()
+
+
+def _sleep(value):
+    if value==1:
+        time.sleep(60)
+    return value
+
+
+def _failInit():
+    raise IOError('Cannot load the GEM')
+
+
+def _crashInit():
+    os.kill(os.getpid(), signal.SIGSEGV)
+
+
+class TestRPPool(unittest.TestCase):
+
+    def test_imap_unordered(self):
+        with rpPool.rpPool(_multiply, (10,), num_workers=2, chunksize=2) as pool:
+            results = {task[0]: (result, error, status) for task, result, error, status in pool.imap_unordered([(i,) for i in range(6)])}
+        self.assertEqual(sorted(results), list(range(6)))
+        self.assertEqual(results[2][0][0], 20)
+        self.assertIsNone(results[3][0])
+        self.assertIn('Cannot multiply 3', results[3][1])
+        self.assertEqual(results[3][2], 'failed')
+        self.assertEqual(results[2][2], 'success')
+
+    def test_chunksize(self):
+        pool = rpPool.rpPool(_multiply, (1,), num_workers=2)
+        self.assertEqual(pool._chunksize(None), 1)
+        self.assertEqual(pool._chunksize(100), 13)
+        self.assertEqual(rpPool.rpPool(_multiply, (1,), num_workers=2, chunksize=5)._chunksize(100), 5)
+        #a generator of tasks, the number of tasks is given separately
+        with pool:
+            results = {task[0]: result[0] for task, result, error, status in pool.imap_unordered(((i,) for i in range(40) if i!=3), cost=lambda x: x[0], num_tasks=39)}
+        self.assertEqual(sorted(results), [i for i in range(40) if i!=3])
+
+    def test_max_tasks(self):
+        with rpPool.rpPool(_multiply, (1,), num_workers=1, chunksize=1, max_tasks=2) as pool:
+            pids = [result[1] for task, result, error, status in pool.imap_unordered([(i,) for i in [0, 1, 2, 4]])]
+        self.assertEqual(len(set(pids)), 2)
+        #the worker retires in the middle of its chunk
+        with rpPool.rpPool(_multiply, (1,), num_workers=1, chunksize=4, max_tasks=1) as pool:
+            results = {task[0]: result[1] for task, result, error, status in pool.imap_unordered([(i,) for i in [0, 1, 2, 4]])}
+        self.assertEqual(sorted(results), [0, 1, 2, 4])
+        self.assertEqual(len(set(results.values())), 4)
+
+    def test_cost(self):
+        tasks = [(i,) for i in [2, 7, 1, 5, 4]]
+        with rpPool.rpPool(_multiply, (1,), num_workers=1) as pool:
+            order = [task[0] for task, result, error, status in pool.imap_unordered(tasks, cost=lambda x: x[0])]
+        self.assertEqual(order, [7, 5, 4, 2, 1])
+        #only the tasks read ahead are ordered
+        with rpPool.rpPool(_multiply, (1,), num_workers=1) as pool:
+            order = [task[0] for task, result, error, status in pool.imap_unordered(iter(tasks), cost=lambda x: x[0], lookahead=2)]
+        self.assertEqual(order, [7, 2, 5, 4, 1])
+
+    def test_worker_crash(self):
+        with rpPool.rpPool(_crash, num_workers=1, chunksize=3) as pool:
+            results = {task[0]: (result, error, status) for task, result, error, status in pool.imap_unordered([(i,) for i in range(3)])}
+        self.assertEqual(results[0], (0, None, 'success'))
+        self.assertIsNone(results[1][0])
+        self.assertIn('-11', results[1][1])
+        self.assertEqual(results[1][2], 'crashed')
+        self.assertEqual(results[2], (2, None, 'success'))
+
+    def test_retries(self):
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            marker = os.path.join(tmp_folder, 'crashed')
+            with rpPool.rpPool(_crashOnce, (marker,), num_workers=1, chunksize=3, retries=1) as pool:
+                results = {task[0]: (result, status) for task, result, error, status in pool.imap_unordered([(i,) for i in range(3)])}
+        self.assertEqual([results[i][1] for i in range(3)], ['success']*3)
+        #the task is run again in a new worker
+        self.assertNotEqual(results[0][0][1], results[1][0][1])
+        with rpPool.rpPool(_crash, num_workers=1, chunksize=3, retries=1) as pool:
+            results = {task[0]: (error, status) for task, result, error, status in pool.imap_unordered([(i,) for i in range(3)])}
+        self.assertEqual(results[1][1], 'crashed')
+        self.assertIn('retried 1 times', results[1][0])
+        self.assertEqual(results[2], (None, 'success'))
+
+    def test_task_timeout(self):
+        start = time.monotonic()
+        with rpPool.rpPool(_sleep, num_workers=2, chunksize=2, task_timeout=1.0) as pool:
+            results = {task[0]: (result, status) for task, result, error, status in pool.imap_unordered([(i,) for i in range(4)])}
+        self.assertLess(time.monotonic()-start, 30)
+        self.assertEqual(results[1], (None, 'timed_out'))
+        self.assertEqual([results[i] for i in [0, 2, 3]], [(0, 'success'), (2, 'success'), (3, 'success')])
+
+    def test_init_failure(self):
+        with rpPool.rpPool(_multiply, (2,), num_workers=2, initializer=_failInit, max_init_failures=3) as pool:
+            with self.assertRaises(RuntimeError) as context:
+                list(pool.imap_unordered([(i,) for i in range(4)]))
+        self.assertIn('Cannot load the GEM', str(context.exception))
+        #the workers that die in the initializer count as failures too
+        with rpPool.rpPool(_multiply, (2,), num_workers=1, initializer=_crashInit, max_init_failures=2) as pool:
+            with self.assertRaises(RuntimeError) as context:
+                list(pool.imap_unordered([(i,) for i in range(4)]))
+        self.assertIn('-11', str(context.exception))
@@ -0,0 +1,71 @@
+import unittest
+import tempfile
+import json
+import os
+import sys
+
+sys.path.insert(0, '..')
+
+import rpProfiler
+
+
+class TestRPProfiler(unittest.TestCase):
+
+    def test_disabled(self):
+        #nothing is recorded outside of a profiled model
+        with rpProfiler.stage('parse'):
+            pass
+        self.assertIsNone(rpProfiler._current)
+        self.assertIs(rpProfiler.profile('model', None), rpProfiler._NULL_CONTEXT)
+
+    def test_profile(self):
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            report = os.path.join(tmp_folder, 'report.jsonl')
+            for model_name in ['model_1', 'model_2']:
+                with rpProfiler.profile(model_name, report):
+                    with rpProfiler.stage('parse'):
+                        pass
+                    for i in range(2):
+                        with rpProfiler.stage('merge'):
+                            pass
+            self.assertIsNone(rpProfiler._current)
+            with open(report) as infile:
+                records = [json.loads(i) for i in infile]
+            self.assertEqual([i['model'] for i in records], ['model_1', 'model_2'])
+            self.assertEqual(records[0]['stages']['merge']['count'], 2)
+            self.assertGreater(records[0]['stages']['parse']['peak_rss'], 0.0)
+            self.assertIsNotNone(records[0]['stages']['merge']['rss_delta'])
+            self.assertGreater(records[0]['worker_peak_rss'], 0.0)
+            summary = rpProfiler.writeSummary(report)
+            self.assertTrue(os.path.exists(os.path.join(tmp_folder, 'report.summary.json')))
+            self.assertEqual(summary['num_models'], 2)
+            self.assertEqual(summary['stages']['merge']['count'], 2)
+            self.assertLessEqual(summary['stages']['merge']['wall']['p50'], summary['stages']['merge']['wall']['max'])
+            self.assertNotIn('worker_peak_rss', summary['stages']['merge'])
+            self.assertEqual(summary['worker_peak_rss'], max(i['worker_peak_rss'] for i in records))
+
+    @unittest.skipUnless(rpProfiler._resetPeakRSS(), 'The peak RSS cannot be reset')
+    def test_stage_peak_rss(self):
+        profile = rpProfiler.rpProfile('model')
+        #a large allocation released before the stage starts is not part of its peak
+        buffer = bytearray(200*1048576)
+        del buffer
+        with profile.stage('outer'):
+            with profile.stage('allocate'):
+                buffer = bytearray(100*1048576)
+                del buffer
+            with profile.stage('small'):
+                pass
+        stages = profile.stages
+        self.assertLess(stages['small']['peak_rss']+50, stages['allocate']['peak_rss'])
+        #the peak of the nested stage is also the peak of the enclosing stage
+        self.assertGreaterEqual(stages['outer']['peak_rss'], stages['allocate']['peak_rss'])
+        #the peak of the process before the stages is kept
+        self.assertGreater(rpProfiler._getPeakRSS(), stages['outer']['peak_rss']+50)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(rpProfiler._percentile(values, 50), 50)
+        self.assertEqual(rpProfiler._percentile(values, 95), 95)
+        self.assertEqual(rpProfiler._percentile(values, 100), 100)
+        self.assertEqual(rpProfiler._percentile([3.0], 95), 3.0)
@@ -0,0 +1,47 @@
+import unittest
+import tempfile
+import os
+import sys
+
+sys.path.insert(0, '..')
+
+import rpResultsIndex
+
+
+def _results(value, flux):
+    return {'wall': 0.1, 'objectives': [{'objective': 'obj_fba', 'value': value, 'status': 'optimal', 'pathway': {'RP1_sink': flux, 'RP1': flux}}]}
+
+
+class TestRPResultsIndex(unittest.TestCase):
+
+    def test_top_compare(self):
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            db_path = os.path.join(tmp_folder, 'results.db')
+            with rpResultsIndex.rpResultsIndex(db_path) as index:
+                run_a = index.startRun('input.tar', 'output.tar', 'gem', {'sim_type': 'fba'})
+                index.addModel('model_1', 'key_1', _results(1.0, 1.0))
+                index.addModel('model_2', 'key_2', _results(3.0, 3.0))
+                index.addModel('model_3', 'key_3', status='failed')
+                run_b = index.startRun('input.tar', 'output.tar', 'gem', {'sim_type': 'fba'})
+                index.addModel('model_1', 'key_1', _results(2.0, 2.0))
+            #the index persists across instances
+            with rpResultsIndex.rpResultsIndex(db_path) as index:
+                self.assertEqual([i[0] for i in index.listRuns()], [run_a, run_b])
+                self.assertEqual(index.topPathways('RP1_sink', run_id=run_a), [('model_2', 'obj_fba', 3.0), ('model_1', 'obj_fba', 1.0)])
+                #the last run by default
+                self.assertEqual(index.topPathways('RP1_sink', 'obj_fba', 1), [('model_1', 'obj_fba', 2.0)])
+                self.assertEqual(index.compareRuns(run_a, run_b, 'obj_fba'), [('model_1', 1.0, 2.0), ('model_2', 3.0, None)])
+
+    def test_isComputed(self):
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            with rpResultsIndex.rpResultsIndex(os.path.join(tmp_folder, 'results.db')) as index:
+                index.startRun('input.tar', 'output.tar', 'gem', {})
+                index.addModel('model_1', 'key_1', _results(1.0, 1.0))
+                index.addModel('model_2', 'key_2', status='failed')
+                self.assertTrue(index.isComputed('key_1'))
+                #the failed models are run again
+                self.assertFalse(index.isComputed('key_2'))
+                self.assertFalse(index.isComputed('key_3'))
+                index.addModel('model_4', 'key_4', status='quarantined')
+                self.assertFalse(index.isComputed('key_4'))
+                self.assertTrue(index.isComputed('key_4', ('success', 'quarantined')))
@@ -1,13 +1,127 @@
 import unittest
+import unittest.mock
+import types
 import os
 import sys
 
+import cobra
+import libsbml
+
 sys.path.insert(0, '..')
 
 import rpTool as rpFBA
 #WARNING: Need to copy a version of rpSBML locally
-import rpSBML
+try:
+    import rpSBML
+except ImportError:
+    rpSBML = None
+
+#the merged model of the pathway and the GEM is not bundled with the repository
+MERGED_PATH = os.path.join('data', 'merged.xml')
+
+
+class TestSBMLToCobra(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join('data', 'rpsbml.xml')
+        #only the libSBML document of the rpSBML object is read
+        self.rpfba = rpFBA.rpFBA(types.SimpleNamespace(document=libsbml.readSBMLFromFile(self.path)))
+        self.expected = cobra.io.read_sbml_model(self.path)
+
+    def _assertSameModel(self, model):
+        self.assertEqual(sorted(i.id for i in model.reactions), sorted(i.id for i in self.expected.reactions))
+        self.assertEqual(sorted(i.id for i in model.metabolites), sorted(i.id for i in self.expected.metabolites))
+        for reaction in self.expected.reactions:
+            self.assertEqual(model.reactions.get_by_id(reaction.id).bounds, reaction.bounds)
+
+    def test_private_parser(self):
+        with unittest.mock.patch.object(cobra.io, 'read_sbml_model', side_effect=AssertionError('Serialised the document')):
+            self._assertSameModel(self.rpfba._sbmlToCobra())
+
+    def test_fallback(self):
+        sbml_to_model = cobra.io.sbml._sbml_to_model
+        calls = []
+        def _changedSignature(doc, *args, **kwargs):
+            #only the direct call of rpTool fails, read_sbml_model() calls the same function
+            calls.append(doc)
+            if len(calls)==1:
+                raise TypeError('Unexpected signature')
+            return sbml_to_model(doc, *args, **kwargs)
+        with unittest.mock.patch.object(cobra.io.sbml, '_sbml_to_model', _changedSignature):
+            self._assertSameModel(self.rpfba._sbmlToCobra())
+        self.assertEqual(len(calls), 2)
+
+
+class TestBaseModel(unittest.TestCase):
+
+    def setUp(self):
+        self.base_model = cobra.io.read_sbml_model(os.path.join('data', 'gem.xml'))
+        #add a heterologous pathway to the GEM: a new species, a boundary species, two reactions and the bound of an existing reaction
+        self.document = libsbml.readSBMLFromFile(os.path.join('data', 'gem.xml'))
+        model = self.document.getModel()
+        for species_id, is_boundary in [('M_TARGET_c', False), ('M_TARGET_b', True)]:
+            species = model.createSpecies()
+            species.setId(species_id)
+            species.setCompartment('c')
+            species.setBoundaryCondition(is_boundary)
+            species.setHasOnlySubstanceUnits(False)
+            species.setConstant(False)
+        for parameter_id, value in [('B_0', 0.0), ('B_1000', 1000.0), ('B_glc', -5.0)]:
+            parameter = model.createParameter()
+            parameter.setId(parameter_id)
+            parameter.setValue(value)
+            parameter.setConstant(True)
+        for reac_id, reactants, products in [('R_RP1', ['M_g3p_c', 'M_pyr_c'], ['M_TARGET_c']), ('R_RP1_sink', ['M_TARGET_c'], ['M_TARGET_b'])]:
+            reaction = model.createReaction()
+            reaction.setId(reac_id)
+            reaction.setReversible(False)
+            reaction.setFast(False)
+            for species_id in reactants:
+                reactant = reaction.createReactant()
+                reactant.setSpecies(species_id)
+                reactant.setStoichiometry(1.0)
+                reactant.setConstant(True)
+            for species_id in products:
+                product = reaction.createProduct()
+                product.setSpecies(species_id)
+                product.setStoichiometry(1.0)
+                product.setConstant(True)
+            reaction.getPlugin('fbc').setLowerFluxBound('B_0')
+            reaction.getPlugin('fbc').setUpperFluxBound('B_1000')
+        model.getReaction('R_EX_glc__D_e').getPlugin('fbc').setLowerFluxBound('B_glc')
+        fbc_plugin = model.getPlugin('fbc')
+        objective = fbc_plugin.createObjective()
+        objective.setId('obj_RP1_sink')
+        objective.setType('maximize')
+        flux_objective = objective.createFluxObjective()
+        flux_objective.setReaction('R_RP1_sink')
+        flux_objective.setCoefficient(1.0)
+        fbc_plugin.setActiveObjectiveId('obj_RP1_sink')
+        self.rpsbml = types.SimpleNamespace(document=self.document, model=model)
 
+    def test_applyToBaseModel(self):
+        #the delta gives the same model as converting the whole merged model
+        expected = rpFBA.rpFBA(self.rpsbml)
+        self.assertTrue(expected._convertToCobra())
+        base_objective = str(self.base_model.objective.expression)
+        with self.base_model:
+            rpfba = rpFBA.rpFBA(self.rpsbml, self.base_model)
+            self.assertTrue(rpfba._convertToCobra())
+            self.assertEqual(sorted(i.id for i in rpfba.cobraModel.reactions), sorted(i.id for i in expected.cobraModel.reactions))
+            self.assertEqual(sorted(i.id for i in rpfba.cobraModel.metabolites), sorted(i.id for i in expected.cobraModel.metabolites))
+            self.assertIn('EX_TARGET_b', rpfba.cobraModel.reactions)
+            self.assertEqual(rpfba.cobraModel.reactions.EX_glc__D_e.lower_bound, -5.0)
+            self.assertAlmostEqual(rpfba.cobraModel.slim_optimize(), expected.cobraModel.slim_optimize())
+        #the pathway is removed from the base model when leaving its context
+        for reac_id in ['RP1', 'RP1_sink', 'EX_TARGET_b']:
+            self.assertNotIn(reac_id, self.base_model.reactions)
+        for met_id in ['TARGET_c', 'TARGET_b']:
+            self.assertNotIn(met_id, self.base_model.metabolites)
+        self.assertEqual(self.base_model.reactions.EX_glc__D_e.lower_bound, -10.0)
+        self.assertEqual(str(self.base_model.objective.expression), base_objective)
+
+
+@unittest.skipIf(rpSBML is None, 'rpSBML is not installed')
 class TestRPTool(unittest.TestCase):
 
     """
@@ -15,8 +129,33 @@ class TestRPTool(unittest.TestCase):
     def setUpClass(self):
     """
 
+    def test_writeBRSynth(self):
+        path = os.path.join('data', 'rpsbml.xml')
+        rpsbml = rpSBML.rpSBML('test', path=path)
+        expected = rpSBML.rpSBML('expected', path=path)
+        rpfba = rpFBA.rpFBA(rpsbml)
+        brsynth = rpfba._getBRSynth(rpsbml.model.getReaction('RP1'))
+        #update an existing annotation and add new ones
+        values = [(brsynth.getChild(0).getName(), '1.5'), ('fba_obj_test', '2.5'), ('fba_obj_other', '3.5')]
+        rpfba._writeBRSynth([(rpsbml.model.getReaction('RP1'), values)])
+        for name, value in values:
+            expected.addUpdateBRSynth(expected.model.getReaction('RP1'), name, value, 'mmol_per_gDW_per_hr', False)
+        self.assertEqual(rpsbml.model.getReaction('RP1').getAnnotation().toXMLString(), expected.model.getReaction('RP1').getAnnotation().toXMLString())
+
+    def test_runProductionEnvelope_infeasible(self):
+        rpsbml = rpSBML.rpSBML('test', path=os.path.join('data', 'rpsbml.xml'))
+        #the pathway cannot carry a flux as its source species is not produced
+        rpsbml.model.getParameter('B_0').setValue(1.0)
+        rpfba = rpFBA.rpFBA(rpsbml)
+        envelope, status = rpfba.runProductionEnvelope('RP1', 1.0, 'RP1_sink', 1.0)
+        self.assertFalse(status)
+        self.assertEqual(envelope, [])
+        brsynth = rpfba._getBRSynth(rpsbml.model.getPlugin('groups').getGroup('rp_pathway'))
+        self.assertNotIn('fba_obj_RP1_sink__envelope_RP1', [brsynth.getChild(i).getName() for i in range(brsynth.getNumChildren())])
+
+    @unittest.skipUnless(os.path.exists(MERGED_PATH), MERGED_PATH+' is missing')
     def test_runFBA(self):
-        rpsbml = rpSBML.rpSBML('test', path=os.path.join('data', 'merged.xml'))
+        rpsbml = rpSBML.rpSBML('test', path=MERGED_PATH)
         rpfba = rpFBA.rpFBA(rpsbml)
         obj_value, status = rpfba.runFBA('RP1_sink')
         self.assertAlmostEqual(obj_value, 9.230769230769237)
@@ -24,9 +163,14 @@ class TestRPTool(unittest.TestCase):
         #make sure that the results are written to the file
         all_json = rpsbml.genJSON()
         self.assertAlmostEqual(all_json['pathway']['brsynth']['fba_obj_RP1_sink']['value'], 9.230769230769237)
+        #the objective of the same reaction is reused whatever the given id
+        obj_value, status = rpfba.runFBA('RP1_sink', objective_id='obj_fba')
+        self.assertTrue(status)
+        self.assertNotIn('fba_obj_fba', rpsbml.genJSON()['pathway']['brsynth'])
 
+    @unittest.skipUnless(os.path.exists(MERGED_PATH), MERGED_PATH+' is missing')
     def test_runFractionReaction(self):
-        rpsbml = rpSBML.rpSBML('test', path=os.path.join('data', 'merged.xml'))
+        rpsbml = rpSBML.rpSBML('test', path=MERGED_PATH)
         rpfba = rpFBA.rpFBA(rpsbml)
         obj_value, status = rpfba.runFractionReaction('biomass', 1.0, 'RP1_sink', 1.0)
         self.assertAlmostEqual(obj_value, 2.3076923076923888)
@@ -36,8 +180,9 @@ class TestRPTool(unittest.TestCase):
         self.assertAlmostEqual(all_json['pathway']['brsynth']['fba_obj_RP1_sink__restricted_biomass']['value'], 2.3076923076923888)
         self.assertAlmostEqual(all_json['pathway']['brsynth']['fba_obj_biomass']['value'], 3.6794124272706443)
 
+    @unittest.skipUnless(os.path.exists(MERGED_PATH), MERGED_PATH+' is missing')
     def test_runParsimoniousFBA(self):
-        rpsbml = rpSBML.rpSBML('test', path=os.path.join('data', 'merged.xml'))
+        rpsbml = rpSBML.rpSBML('test', path=MERGED_PATH)
         rpfba = rpFBA.rpFBA(rpsbml)
         obj_value, status = rpfba.runParsimoniousFBA('RP1_sink')
         self.assertAlmostEqual(obj_value, 859.3846153846168)
@@ -45,3 +190,86 @@ class TestRPTool(unittest.TestCase):
         #make sure that the results are written to the file
         all_json = rpsbml.genJSON()
         self.assertAlmostEqual(all_json['pathway']['brsynth']['fba_obj_RP1_sink']['value'], 859.3846153846168)
+
+    @unittest.skipUnless(os.path.exists(MERGED_PATH), MERGED_PATH+' is missing')
+    def test_runFBA_base_model(self):
+        rpsbml_base = rpSBML.rpSBML('base', path=MERGED_PATH)
+        rpfba_base = rpFBA.rpFBA(rpsbml_base)
+        self.assertTrue(rpfba_base._convertToCobra())
+        base_model = rpfba_base.cobraModel
+        #the base model is the GEM without the heterologous pathway, that the delta adds back
+        f_reaction = cobra.io.sbml.F_REPLACE[cobra.io.sbml.F_REACTION]
+        pathway_reactions = [f_reaction(i.getIdRef()) for i in rpsbml_base.model.getPlugin('groups').getGroup('rp_pathway').getListOfMembers()]+['RP1_sink']
+        base_model.remove_reactions(pathway_reactions, remove_orphans=True)
+        base_objective = str(base_model.objective.expression)
+        rpsbml = rpSBML.rpSBML('test', path=MERGED_PATH)
+        with base_model:
+            rpfba = rpFBA.rpFBA(rpsbml, base_model)
+            obj_value, status = rpfba.runFBA('RP1_sink')
+            for reac_id in pathway_reactions:
+                self.assertIn(reac_id, rpfba.cobraModel.reactions)
+        self.assertAlmostEqual(obj_value, 9.230769230769237)
+        self.assertTrue(status)
+        #make sure that the pathway and the objective of the base model have been rolled back
+        for reac_id in pathway_reactions:
+            self.assertNotIn(reac_id, base_model.reactions)
+        self.assertEqual(str(base_model.objective.expression), base_objective)
+
+    @unittest.skipUnless(os.path.exists(MERGED_PATH), MERGED_PATH+' is missing')
+    def test_runMultipleSimulations(self):
+        rpsbml = rpSBML.rpSBML('test', path=MERGED_PATH)
+        rpfba = rpFBA.rpFBA(rpsbml, separate_objectives=True)
+        obj_value, status = rpfba.runFBA('RP1_sink', objective_id='obj_fba')
+        self.assertAlmostEqual(obj_value, 9.230769230769237)
+        self.assertTrue(status)
+        #the second simulation reuses the cobra model of the first one
+        cobra_model = rpfba.cobraModel
+        obj_value, status = rpfba.runParsimoniousFBA('RP1_sink', objective_id='obj_pfba')
+        self.assertAlmostEqual(obj_value, 859.3846153846168)
+        self.assertTrue(status)
+        self.assertIs(rpfba.cobraModel, cobra_model)
+        #make sure that the results of both simulations are kept
+        all_json = rpsbml.genJSON()
+        self.assertAlmostEqual(all_json['pathway']['brsynth']['fba_obj_fba']['value'], 9.230769230769237)
+        self.assertAlmostEqual(all_json['pathway']['brsynth']['fba_obj_pfba']['value'], 859.3846153846168)
+
+    @unittest.skipUnless(os.path.exists(MERGED_PATH), MERGED_PATH+' is missing')
+    def test_runFractionSweep(self):
+        rpsbml = rpSBML.rpSBML('test', path=MERGED_PATH)
+        rpfba = rpFBA.rpFBA(rpsbml)
+        curve, status = rpfba.runFractionSweep('biomass', 1.0, 'RP1_sink', 1.0, [0.5, 0.75])
+        self.assertTrue(status)
+        self.assertEqual([i[0] for i in curve], [0.5, 0.75])
+        #same result as a single fraction
+        self.assertAlmostEqual(curve[1][1], 2.3076923076923888)
+        #make sure that the results are written to the file
+        all_json = rpsbml.genJSON()
+        self.assertAlmostEqual(all_json['pathway']['brsynth']['fba_obj_RP1_sink__restricted_biomass__0_75']['value'], 2.3076923076923888)
+        self.assertAlmostEqual(all_json['pathway']['brsynth']['fba_obj_biomass']['value'], 3.6794124272706443)
+
+    @unittest.skipUnless(os.path.exists(MERGED_PATH), MERGED_PATH+' is missing')
+    def test_runProductionEnvelope(self):
+        rpsbml = rpSBML.rpSBML('test', path=MERGED_PATH)
+        rpfba = rpFBA.rpFBA(rpsbml)
+        envelope, status = rpfba.runProductionEnvelope('biomass', 1.0, 'RP1_sink', 1.0, num_points=10)
+        self.assertTrue(status)
+        self.assertLessEqual(len(envelope), 10)
+        self.assertEqual(envelope, sorted(envelope))
+        #the production of the target decreases with the growth
+        self.assertGreaterEqual(envelope[0][2], envelope[-1][2])
+        self.assertAlmostEqual(envelope[-1][0], 3.6794124272706443)
+        #make sure that the results are written to the file
+        all_json = rpsbml.genJSON()
+        self.assertIn('fba_obj_RP1_sink__envelope_biomass', all_json['pathway']['brsynth'])
+
+    @unittest.skipUnless(os.path.exists(MERGED_PATH), MERGED_PATH+' is missing')
+    def test_runPathwayFVA(self):
+        rpsbml = rpSBML.rpSBML('test', path=MERGED_PATH)
+        rpfba = rpFBA.rpFBA(rpsbml)
+        results, status = rpfba.runPathwayFVA('RP1_sink', fraction_of_optimum=0.95)
+        self.assertTrue(status)
+        #the target reaction is constrained to the fraction of its optimum
+        self.assertAlmostEqual(results['RP1_sink'][1], 9.230769230769237, places=5)
+        self.assertAlmostEqual(results['RP1_sink'][0], 0.95*9.230769230769237, places=5)
+        for reac_id, (flux_min, flux_max) in results.items():
+            self.assertLessEqual(flux_min, flux_max+1e-9)
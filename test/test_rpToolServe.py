@@ -0,0 +1,259 @@
+import unittest
+import tempfile
+import tarfile
+import io
+import json
+import os
+import sys
+import types
+
+sys.path.insert(0, '..')
+
+#WARNING: Need to copy a version of rpSBML, rpMerge and inchikeyMIRIAM locally
+try:
+    import libsbml
+    import rpToolServe
+except ImportError:
+    rpToolServe = None
+
+
+def _writeTar(path, models, mode='w:gz'):
+    with tarfile.open(path, mode=mode) as tar:
+        #a folder member is not a model
+        folder = tarfile.TarInfo('models')
+        folder.type = tarfile.DIRTYPE
+        tar.addfile(folder)
+        for name, content in models:
+            info = tarfile.TarInfo('models/'+name)
+            info.size = len(content)
+            tar.addfile(tarinfo=info, fileobj=io.BytesIO(content))
+
+
+@unittest.skipIf(rpToolServe is None, 'rpSBML, rpMerge or inchikeyMIRIAM is not installed')
+class TestTar(unittest.TestCase):
+
+    def test_readTar(self):
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            input_tar = os.path.join(tmp_folder, 'input.tar.gz')
+            _writeTar(input_tar, [('rp_1.sbml.xml', b'<sbml>1</sbml>'), ('rp_2.rpsbml.xml', b'<sbml>2</sbml>')])
+            models = rpToolServe.readTar(input_tar)
+            #the models are read as they are requested
+            self.assertEqual(next(models), ('rp_1', b'<sbml>1</sbml>'))
+            self.assertEqual(list(models), [('rp_2', b'<sbml>2</sbml>')])
+            report = os.path.join(tmp_folder, 'profile.jsonl')
+            self.assertEqual(len(list(rpToolServe.readTar(input_tar, report))), 2)
+            with open(report) as infile:
+                self.assertEqual(len(infile.readlines()), 2)
+
+    def test_countTar(self):
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            input_tar = os.path.join(tmp_folder, 'input.tar')
+            _writeTar(input_tar, [('rp_'+str(i)+'.sbml.xml', b'<sbml/>') for i in range(5)], 'w')
+            self.assertEqual(rpToolServe.countTar(input_tar), 5)
+            self.assertEqual(rpToolServe.countTar(input_tar, 2), 2)
+            empty_tar = os.path.join(tmp_folder, 'empty.tar.gz')
+            _writeTar(empty_tar, [])
+            self.assertEqual(rpToolServe.countTar(empty_tar), 0)
+
+
+@unittest.skipIf(rpToolServe is None, 'rpSBML, rpMerge or inchikeyMIRIAM is not installed')
+class TestTarWriter(unittest.TestCase):
+
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            output_tar = os.path.join(tmp_folder, 'output.tar.gz')
+            report = os.path.join(tmp_folder, 'profile.jsonl')
+            with rpToolServe.rpTarWriter(output_tar, max_queue=1, profile_report=report) as writer:
+                writer.write('rp_1', '<sbml>1</sbml>')
+                writer.write('rp_2', b'<sbml>2</sbml>')
+            self.assertEqual(writer.num_models, 2)
+            self.assertEqual(list(rpToolServe.readTar(output_tar)), [('rp_1', b'<sbml>1</sbml>'), ('rp_2', b'<sbml>2</sbml>')])
+            with open(report) as infile:
+                self.assertEqual(len(infile.readlines()), 2)
+
+    def test_error(self):
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            writer = rpToolServe.rpTarWriter(os.path.join(tmp_folder, 'missing', 'output.tar'))
+            #the models are still consumed after the archive has failed
+            for i in range(3):
+                writer.write('rp_'+str(i), '<sbml/>')
+            with self.assertRaises(OSError):
+                writer.close()
+
+
+def _results(value, status='optimal'):
+    return {'wall': 0.1, 'objectives': [{'objective': 'obj_fba', 'value': value, 'status': status, 'pathway': {'RP1_sink': value} if value is not None else {}}]}
+
+
+@unittest.skipIf(rpToolServe is None, 'rpSBML, rpMerge or inchikeyMIRIAM is not installed')
+class TestRecord(unittest.TestCase):
+
+    def test_exportMode(self):
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            with rpToolServe.rpFluxExport.rpFluxWriter(os.path.join(tmp_folder, 'pathway.npz')) as writer:
+                self.assertEqual(rpToolServe._exportMode(writer), 'pathway')
+            with rpToolServe.rpFluxExport.rpFluxWriter(os.path.join(tmp_folder, 'full.npz'), full_fluxes=True) as writer:
+                self.assertEqual(rpToolServe._exportMode(writer), 'full')
+        self.assertIsNone(rpToolServe._exportMode(None))
+        #the status of the objectives is needed to not cache the models that reach the time limit
+        self.assertEqual(rpToolServe._exportMode(None, keep_status=True), 'pathway')
+
+    def test_flux_export(self):
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            path = os.path.join(tmp_folder, 'fluxes.npz')
+            with rpToolServe.rpFluxExport.rpFluxWriter(path) as writer:
+                rpToolServe._recordModel('rp_1', 'key_1', _results(9.2), writer)
+                rpToolServe._recordModel('rp_2', 'key_2', _results(None, 'time_limit'), writer)
+                rpToolServe._recordFailure('rp_3', 'key_3', 'crashed', 'Worker died', writer)
+            columns = rpToolServe.rpFluxExport.readFluxExport(path)
+        self.assertEqual(list(columns['model']), ['rp_1', 'rp_2', 'rp_3'])
+        self.assertEqual(list(columns['status']), ['optimal', 'time_limit', 'crashed'])
+        #a failed model has a single row without objective or flux
+        self.assertEqual(columns['objective'][2], '')
+        self.assertEqual(list(columns['flux_row']), [0])
+
+    def test_results_index(self):
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            with rpToolServe.rpResultsIndex.rpResultsIndex(os.path.join(tmp_folder, 'results.db')) as index:
+                index.startRun('input.tar', 'output.tar', 'gem', {})
+                rpToolServe._recordModel('rp_1', 'key_1', _results(9.2), results_index=index)
+                rpToolServe._recordModel('rp_2', 'key_2', _results(None, 'time_limit'), results_index=index)
+                rpToolServe._recordFailure('rp_3', 'key_3', 'quarantined', 'Worker died', results_index=index)
+                self.assertTrue(index.isComputed('key_1'))
+                #the models that reached the time limit are not computed
+                self.assertFalse(index.isComputed('key_2'))
+                self.assertTrue(index.isComputed('key_2', ('timed_out',)))
+                self.assertTrue(index.isComputed('key_3', ('quarantined',)))
+                self.assertEqual(index.topPathways('RP1_sink'), [('rp_1', 'obj_fba', 9.2)])
+
+
+@unittest.skipIf(rpToolServe is None, 'rpSBML, rpMerge or inchikeyMIRIAM is not installed')
+class TestModelCost(unittest.TestCase):
+
+    def test_modelCost(self):
+        small = ('rp_1', b'<model><reaction id="R1"/></model>')
+        large = ('rp_2', b'<model><reaction id="R1"/><reaction id="R2"/></model>')
+        self.assertGreater(rpToolServe.modelCost(large), rpToolServe.modelCost(small))
+        self.assertEqual(rpToolServe.modelCost(('rp_3', large[1].decode('utf-8'))), rpToolServe.modelCost(large))
+        #the size of the file breaks the ties between models with the same number of reactions
+        padded = ('rp_4', b'<model><reaction id="R1_longer_id"/></model>')
+        self.assertGreater(rpToolServe.modelCost(padded), rpToolServe.modelCost(small))
+        self.assertLess(rpToolServe.modelCost(padded), rpToolServe.modelCost(large))
+
+
+@unittest.skipIf(rpToolServe is None, 'rpSBML, rpMerge or inchikeyMIRIAM is not installed')
+class TestParseSimType(unittest.TestCase):
+
+    def test_parseSimType(self):
+        self.assertEqual(rpToolServe.parseSimType('fba'), ['fba'])
+        self.assertEqual(rpToolServe.parseSimType(' fba, pfba ,fba,,fraction'), ['fba', 'pfba', 'fraction'])
+        self.assertEqual(rpToolServe.parseSimType(['pfba', 'fba', 'pfba']), ['pfba', 'fba'])
+
+
+@unittest.skipIf(rpToolServe is None, 'rpSBML, rpMerge or inchikeyMIRIAM is not installed')
+class TestParseFractions(unittest.TestCase):
+
+    def test_range(self):
+        self.assertEqual(rpToolServe.parseFractions('0.1:0.5:0.1'), (0.1, 0.2, 0.3, 0.4, 0.5))
+        self.assertEqual(rpToolServe.parseFractions('0.1:0.95:0.05')[-1], 0.95)
+        self.assertEqual(len(rpToolServe.parseFractions('0.1:0.95:0.05')), 18)
+        with self.assertRaises(ValueError):
+            rpToolServe.parseFractions('0.1:0.5:0')
+        with self.assertRaises(ValueError):
+            rpToolServe.parseFractions('0.1:0.5')
+
+    def test_list(self):
+        self.assertEqual(rpToolServe.parseFractions('0.1, 0.5,0.9,'), (0.1, 0.5, 0.9))
+        self.assertEqual(rpToolServe.parseFractions([0.25, '0.75']), (0.25, 0.75))
+        with self.assertRaises(ValueError):
+            rpToolServe.parseFractions('0.1,half')
+
+
+def _pathwayModel(reaction_ids, members, value=None):
+    #a model with the pathway and central species groups and an objective, annotated with the value if given
+    document = libsbml.SBMLDocument(3, 1)
+    document.enablePackage(libsbml.FbcExtension.getXmlnsL3V1V2(), 'fbc', True)
+    document.enablePackage(libsbml.GroupsExtension.getXmlnsL3V1V1(), 'groups', True)
+    model = document.createModel()
+    model.setId('model')
+    model.getPlugin('fbc').setStrict(True)
+    annotation = None if value is None else '<annotation><test xmlns="http://test" value="'+str(value)+'"/></annotation>'
+    for reaction_id in reaction_ids:
+        reaction = model.createReaction()
+        reaction.setId(reaction_id)
+        reaction.setReversible(False)
+        if annotation:
+            reaction.setMetaId(reaction_id)
+            reaction.setAnnotation(annotation)
+    groups = model.getPlugin('groups')
+    for group_id, group_members in [('rp_pathway', members), ('central_species', ['old_species'])]:
+        group = groups.createGroup()
+        group.setId(group_id)
+        group.setKind(libsbml.GROUP_KIND_COLLECTION)
+        if annotation:
+            group.setMetaId(group_id)
+            group.setAnnotation(annotation)
+        for member_id in group_members:
+            group.createMember().setIdRef(member_id)
+    objective = model.getPlugin('fbc').createObjective()
+    objective.setId('obj_fba')
+    objective.setType('maximize')
+    flux_objective = objective.createFluxObjective()
+    flux_objective.setReaction(members[0])
+    flux_objective.setCoefficient(1.0)
+    if annotation:
+        objective.setMetaId('obj_fba')
+        objective.setAnnotation(annotation)
+        flux_objective.setMetaId('obj_fba_'+members[0])
+        flux_objective.setAnnotation(annotation)
+    model.getPlugin('fbc').setActiveObjectiveId('obj_fba')
+    return types.SimpleNamespace(document=document, model=model)
+
+
+@unittest.skipIf(rpToolServe is None, 'rpSBML, rpMerge or inchikeyMIRIAM is not installed')
+class TestTransferResults(unittest.TestCase):
+
+    def test_transferResults(self):
+        rpsbml = _pathwayModel(['RP1', 'RP2'], ['RP1', 'RP2'])
+        #the merged model renames RP2 and has the reactions of the GEM
+        rpsbml_gem = _pathwayModel(['R_GEM', 'RP1', 'RP2_merged', 'RP3'], ['RP1', 'RP2_merged', 'RP3'], 9.2)
+        objective = rpsbml_gem.model.getPlugin('fbc').createObjective()
+        objective.setId('obj_new')
+        objective.setType('maximize')
+        objective.createFluxObjective().setReaction('RP1')
+        rpToolServe.transferResults(rpsbml, rpsbml_gem, {'RP2_merged': 'RP2'}, ['new_species'], [])
+        for reaction_id in ['RP1', 'RP2']:
+            self.assertIn('value="9.2"', rpsbml.model.getReaction(reaction_id).getAnnotationString())
+        groups = rpsbml.model.getPlugin('groups')
+        self.assertIn('value="9.2"', groups.getGroup('rp_pathway').getAnnotationString())
+        #the members of the central species are replaced
+        self.assertEqual([i.getIdRef() for i in groups.getGroup('central_species').getListOfMembers()], ['new_species'])
+        fbc = rpsbml.model.getPlugin('fbc')
+        self.assertIn('value="9.2"', fbc.getObjective('obj_fba').getAnnotationString())
+        self.assertIn('value="9.2"', fbc.getObjective('obj_fba').getFluxObjective(0).getAnnotationString())
+        #the objectives missing from the pathway model are added, the last one being active
+        self.assertIsNotNone(fbc.getObjective('obj_new'))
+        self.assertEqual(fbc.getActiveObjectiveId(), 'obj_new')
+
+
+@unittest.skipIf(rpToolServe is None, 'rpSBML, rpMerge or inchikeyMIRIAM is not installed')
+class TestBatchReport(unittest.TestCase):
+
+    def test_write(self):
+        batch_report = rpToolServe.rpBatchReport()
+        batch_report.add('rp_1', 'success')
+        batch_report.add('rp_2', 'cached')
+        batch_report.add('rp_3', 'failed', 'Traceback (most recent call last):\n  File "rpTool.py"\nKeyError: \'RP1\'\n')
+        batch_report.add('rp_4', 'failed', "KeyError: 'RP1'")
+        batch_report.add('rp_5', 'crashed')
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            path = os.path.join(tmp_folder, 'report.json')
+            batch_report.write(path)
+            with open(path) as infile:
+                report = json.load(infile)
+        self.assertEqual(report['num_models'], 5)
+        self.assertEqual(report['counts'], {'success': 1, 'cached': 1, 'failed': 2, 'crashed': 1})
+        #only the last line of the tracebacks is kept
+        self.assertEqual(report['reasons'], {"KeyError: 'RP1'": 2, 'None': 1})
+        self.assertEqual([i['model'] for i in report['failures']], ['rp_3', 'rp_4', 'rp_5'])
+        self.assertEqual(report['failures'][0], {'model': 'rp_3', 'status': 'failed', 'reason': "KeyError: 'RP1'"})